@@ -0,0 +1,82 @@
+# 同步 vs. 非同步 DB 存取的併發負載測試（需要 httpx）
+# 舊路徑：sync def + SessionLocal，每個請求佔用 Starlette 執行緒池（預設 40）一個位置
+# 新路徑：async def + AsyncSession，等待 I/O 時不佔用執行緒
+# --db-latency-ms 模擬遠端資料庫（如 PostgreSQL）每次查詢的網路往返時間
+# 用法：python -m benchmarks.async_load --concurrency 200 --requests 2000 --db-latency-ms 50
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI, Depends
+from sqlalchemy import insert, select
+from sqlalchemy.orm import sessionmaker
+
+from databases import Base, AsyncSessionLocal, create_db_engine, create_async_db_engine, get_db
+from models import Product
+
+
+def build_app(latency: float):
+    path = os.path.join(tempfile.mkdtemp(), "load.db")
+    engine = create_db_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Product), [{"name": f"P{i}", "price": 1, "stock": 1, "is_active": True} for i in range(100)])
+    SessionLocal = sessionmaker(bind=engine)
+    async_engine = create_async_db_engine(f"sqlite:///{path}")
+    AsyncSessionLocal.configure(bind=async_engine)
+
+    app = FastAPI()
+
+    @app.get("/sync/{product_id}")
+    def sync_route(product_id: int):
+        with SessionLocal() as db:
+            time.sleep(latency)
+            return {"stock": db.execute(select(Product.stock).where(Product.id == product_id)).scalar()}
+
+    @app.get("/async/{product_id}")
+    async def async_route(product_id: int, db=Depends(get_db)):
+        await asyncio.sleep(latency)
+        return {"stock": (await db.execute(select(Product.stock).where(Product.id == product_id))).scalar()}
+
+    return app, async_engine
+
+
+async def drive(app, prefix: str, concurrency: int, requests: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(f"/{prefix}/{1 + i % 100}")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{prefix:5s} concurrency={concurrency} rps={requests / elapsed:.0f} "
+          f"p50={statistics.median(latencies) * 1000:.1f}ms p95={latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms")
+
+
+async def main(concurrency: int, requests: int, latency_ms: float):
+    app, async_engine = build_app(latency_ms / 1000)
+    for prefix in ("sync", "async"):
+        await drive(app, prefix, concurrency, requests)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--db-latency-ms", type=float, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.requests, args.db_latency_ms))
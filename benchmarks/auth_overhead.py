@@ -0,0 +1,102 @@
+# 每個請求的認證成本：舊作法（每次 jwt.decode + 同步 roles_required 走執行緒池）vs. token 快取 + async dependency
+# 以不需認證的端點為基準，相減得到認證本身的額外耗時
+# 用法：python -m benchmarks.auth_overhead --requests 5000 --tokens 5
+import argparse
+import asyncio
+import time
+from datetime import timedelta
+from typing import Annotated
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from jose import jwt, JWTError
+
+import routers.auth as auth
+from utils.permissions import roles_required
+
+
+async def old_get_current_user(token: Annotated[str, Depends(auth.oauth2_bearer)]):
+    try:
+        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=403, detail="Token 驗證失敗")
+    return {"username": payload.get("sub"), "id": payload.get("id"),
+            "user_role": payload.get("role"), "customer_id": payload.get("customer_id")}
+
+
+def old_roles_required(*roles):
+    def wrapper(user=Depends(old_get_current_user)):
+        if user["user_role"] not in roles:
+            raise HTTPException(status_code=403, detail="無此權限")
+        return user
+    return wrapper
+
+
+def build_app():
+    app = FastAPI()
+
+    @app.get("/none")
+    async def no_auth():
+        return {"ok": True}
+
+    # 與實際端點相同的組合：dependencies 檢查角色，參數再取一次使用者
+    @app.get("/old", dependencies=[Depends(old_roles_required("admin"))])
+    async def old(user: dict = Depends(old_get_current_user)):
+        return {"ok": True}
+
+    @app.get("/new", dependencies=[Depends(roles_required("admin"))])
+    async def new(user: dict = Depends(auth.get_current_user)):
+        return {"ok": True}
+
+    return app
+
+
+async def measure(client, path: str, headers, requests: int):
+    started = time.perf_counter()
+    for n in range(requests):
+        response = await client.get(path, headers=headers[n % len(headers)])
+        response.raise_for_status()
+    return (time.perf_counter() - started) / requests
+
+
+def decode_only(tokens, calls: int):
+    started = time.perf_counter()
+    for n in range(calls):
+        jwt.decode(tokens[n % len(tokens)], auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    return (time.perf_counter() - started) / calls
+
+
+async def cached_only(tokens, calls: int):
+    started = time.perf_counter()
+    for n in range(calls):
+        await auth.get_current_user(tokens[n % len(tokens)])
+    return (time.perf_counter() - started) / calls
+
+
+async def run(requests: int, token_count: int):
+    tokens = [auth.create_access_token(f"service{i}", i, "admin", None, timedelta(minutes=20))
+              for i in range(token_count)]
+    headers = [{"Authorization": f"Bearer {token}"} for token in tokens]
+
+    print(f"jwt.decode           {decode_only(tokens, requests) * 1e6:8.1f} µs/call")
+    print(f"cached lookup        {await cached_only(tokens, requests) * 1e6:8.1f} µs/call")
+
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path in ("/none", "/old", "/new"):
+            await measure(client, path, headers, 200)   # 暖機
+        baseline = await measure(client, "/none", headers, requests)
+        results = {path: await measure(client, path, headers, requests) for path in ("/old", "/new")}
+
+    print(f"no auth              {baseline * 1e6:8.1f} µs/request")
+    for path, label in (("/old", "decode + sync roles"), ("/new", "token cache + async")):
+        print(f"{label:20s} {results[path] * 1e6:8.1f} µs/request  auth overhead {(results[path] - baseline) * 1e6:7.1f} µs")
+    print("token cache", auth.token_cache.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--tokens", type=int, default=5, help="輪流使用的 token 數（模擬少數服務帳號）")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.tokens))
@@ -0,0 +1,73 @@
+# 顧客列表的訂單彙總：消費前 100 名、最近下單區間，比較讀 customer_sales 與請求時加總 orders
+# 用法：python -m benchmarks.customer_summary --customers 20000 --orders 200000 --repeat 20
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+async def _best(fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+async def run(args):
+    from sqlalchemy import case, func, select
+    from databases import AsyncSessionLocal, async_engine
+    from models import Customer, Order
+    from routers.customers import list_customers
+
+    since = datetime(2025, 1, 1) - timedelta(days=30)   # 與 benchmarks.seed 相同的基準時間
+    active = Order.payment_status != "cancelled"
+    spend = func.sum(case((active, Order.total_amount), else_=0))
+
+    async with AsyncSessionLocal() as db:
+        async def summary(**filters):
+            params = dict(search=None, sort=None, order="desc", min_orders=None, min_revenue=None,
+                          last_order_from=None, last_order_to=None, limit=100, offset=0)
+            return await list_customers(db=db, **{**params, **filters})
+
+        async def aggregate(stmt):
+            return (await db.execute(stmt)).all()
+
+        per_customer = (
+            select(Customer.id, Customer.name, func.count(Order.id), spend, func.max(Order.order_date))
+            .outerjoin(Order, Order.customer_id == Customer.id).group_by(Customer.id)
+        )
+        cases = {
+            "消費前 100 名": (
+                lambda: summary(sort="revenue"),
+                lambda: aggregate(per_customer.order_by(spend.desc(), Customer.id.desc()).limit(100)),
+            ),
+            "近 30 天有下單": (
+                lambda: summary(last_order_from=since, sort="last_order_at"),
+                lambda: aggregate(per_customer.having(func.max(Order.order_date) >= since)
+                                  .order_by(func.max(Order.order_date).desc()).limit(100)),
+            ),
+        }
+        for name, (fast, slow) in cases.items():
+            first, aggregated = await _best(fast, args.repeat), await _best(slow, args.repeat)
+            print(f"{name:10s} customer_sales {first * 1000:8.2f} ms  加總 orders {aggregated * 1000:8.2f} ms"
+                  f"  x{aggregated / first:.1f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--customers", type=int, default=20000)
+    parser.add_argument("--orders", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # 先設定 DATABASE_URL 再匯入 databases
+    path = os.path.join(tempfile.mkdtemp(), "customers.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from benchmarks.seed import seed_database
+    seed_database(os.environ["DATABASE_URL"], customers=args.customers, products=2000, orders=args.orders, users=1)
+    asyncio.run(run(args))
@@ -0,0 +1,99 @@
+# 訂單明細匯出比較：單一 JOIN 串流 vs. 透過 OrderRead 與 ORM 關聯逐筆組裝
+# 用法：python -m benchmarks.export_detailed --orders 5000 --items 3
+import argparse
+import asyncio
+import csv
+import os
+import tempfile
+import time
+from datetime import datetime
+from io import StringIO
+
+from sqlalchemy import create_engine, event, insert
+
+from databases import Base, SessionLocal, AsyncSessionLocal, create_async_db_engine
+from models import Customer, Product, Order, OrderItem
+from schemas import OrderRead
+from routers.exports import detailed_orders_stmt, DETAILED_ORDER_HEADER
+from utils.csv_stream import stream_csv
+
+
+def seed(engine, orders: int, items: int):
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(Customer), [{"name": f"C{i}", "email": f"c{i}@example.com"} for i in range(1000)])
+        conn.execute(insert(Product), [
+            {"name": f"P{i}", "price": 1 + i % 50, "stock": 1000, "category": f"cat{i % 20}", "is_active": True}
+            for i in range(2000)
+        ])
+        conn.execute(insert(Order), [
+            {"customer_id": 1 + i % 1000, "order_date": now, "total_amount": 0, "payment_status": "paid"}
+            for i in range(orders)
+        ])
+        conn.execute(insert(OrderItem), [
+            {"order_id": 1 + i // items, "product_id": 1 + i % 2000, "quantity": 1 + i % 5, "unit_price": 1 + i % 50}
+            for i in range(orders * items)
+        ])
+
+
+def via_order_read():
+    # 舊作法：OrderRead 序列化後，每個訂單 / 項目再延遲載入顧客與商品
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(DETAILED_ORDER_HEADER)
+    with SessionLocal() as db:
+        for order in db.query(Order).order_by(Order.id).all():
+            data = OrderRead.model_validate(order, from_attributes=True)
+            customer = order.customer
+            for item in data.items:
+                product = db.get(Product, item.product_id)
+                writer.writerow([
+                    data.id, data.order_date, data.payment_status, customer.id, customer.name, customer.email,
+                    item.product_id, product.name if product else None, product.category if product else None,
+                    item.quantity, item.unit_price, item.quantity * item.unit_price
+                ])
+    return len(output.getvalue())
+
+
+def via_stream():
+    async def consume():
+        return sum([len(chunk) async for chunk in stream_csv(DETAILED_ORDER_HEADER, detailed_orders_stmt())])
+    return asyncio.run(consume())
+
+
+def measure(engine, fn):
+    # 非同步 engine 傳入其 sync_engine，SQL 事件同樣會觸發
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    started = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - started
+    event.remove(engine, "before_cursor_execute", count)
+    return elapsed, statements[0], size
+
+
+def run(orders: int, items: int):
+    path = os.path.join(tempfile.mkdtemp(), "detailed.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_db_engine(f"sqlite:///{path}")
+    SessionLocal.configure(bind=engine)
+    AsyncSessionLocal.configure(bind=async_engine)
+    seed(engine, orders, items)
+
+    for name, fn, target in (("order_read", via_order_read, engine),
+                             ("joined_stream", via_stream, async_engine.sync_engine)):
+        elapsed, statements, size = measure(target, fn)
+        print(f"{name:14s} rows={orders * items} time={elapsed:.2f}s sql_statements={statements} bytes={size}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--items", type=int, default=3)
+    args = parser.parse_args()
+    run(args.orders, args.items)
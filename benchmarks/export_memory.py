@@ -0,0 +1,55 @@
+# 訂單匯出記憶體測試：灌入大量訂單後消耗 stream_csv，觀察峰值 RSS 是否隨資料量固定
+# 用法：python -m benchmarks.export_memory --rows 1000000 [--gzip]
+import argparse
+import asyncio
+import os
+import resource
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, select
+
+from databases import Base, AsyncSessionLocal, create_async_db_engine
+from models import Order
+from utils.csv_stream import stream_csv
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(rows: int, gzip: bool):
+    path = os.path.join(tempfile.mkdtemp(), "export.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    AsyncSessionLocal.configure(bind=create_async_db_engine(f"sqlite:///{path}"))
+
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        for start in range(0, rows, 50000):
+            conn.execute(insert(Order), [
+                {"customer_id": 1 + i % 1000, "order_date": now, "total_amount": i % 997, "payment_status": "paid"}
+                for i in range(start, min(start + 50000, rows))
+            ])
+
+    before = peak_rss_mb()
+    started = time.perf_counter()
+    first_byte = None
+    size = 0
+    stmt = select(Order.id, Order.customer_id, Order.total_amount).order_by(Order.id)
+    async for chunk in stream_csv(["ID", "Customer ID", "Total Amount"], stmt, gzip):
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(chunk)
+    elapsed = time.perf_counter() - started
+    print(f"rows={rows} bytes={size} ttfb={first_byte * 1000:.1f}ms total={elapsed:.2f}s "
+          f"peak_rss_before={before:.1f}MB peak_rss_after={peak_rss_mb():.1f}MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.gzip))
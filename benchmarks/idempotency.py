@@ -0,0 +1,93 @@
+# 用戶端重試的成本：POST /orders 第一次執行 vs. 以相同 Idempotency-Key 重送（本行程快取 / 資料表）
+# 並以多個同時送出的重複請求確認只建立一筆訂單、只扣一次庫存
+# 用法：python -m benchmarks.idempotency --requests 500 --duplicates 20
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+import httpx
+
+
+async def _timed(client, requests: int, make):
+    started = time.perf_counter()
+    for n in range(requests):
+        url, kwargs = make(n)
+        response = await client.post(url, **kwargs)
+        response.raise_for_status()
+    return (time.perf_counter() - started) / requests
+
+
+async def run(args):
+    from sqlalchemy import func, select
+    import main
+    from databases import AsyncSessionLocal
+    from models import Order, Product
+    from routers.auth import create_access_token
+    from utils.idempotency import response_cache
+
+    headers = {"Authorization": "Bearer " + create_access_token("bench", 1, "admin", None, timedelta(minutes=30))}
+    async with main.app.router.lifespan_context(main.app):
+        async with AsyncSessionLocal() as db:
+            product_id = (await db.execute(select(Product.id).limit(1))).scalar()
+            stock_before = (await db.execute(select(Product.stock).where(Product.id == product_id))).scalar()
+        body = {"customer_id": 1, "items": [{"product_id": product_id, "quantity": 1}]}
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            def fresh(n):
+                return "/orders/", {"json": body, "headers": {**headers, "Idempotency-Key": f"fresh-{n}"}}
+
+            def replay(n):
+                return "/orders/", {"json": body, "headers": {**headers, "Idempotency-Key": "fresh-0"}}
+
+            no_key = await _timed(client, args.requests, lambda n: ("/orders/", {"json": body, "headers": headers}))
+            first = await _timed(client, args.requests, fresh)
+            cached = await _timed(client, args.requests, replay)
+
+            async def replay_from_table():
+                response_cache.clear()
+                return await _timed(client, 1, replay)
+            table = sum([await replay_from_table() for _ in range(args.requests)]) / args.requests
+
+            # 同時送出的重複請求：只有一個執行，其餘等待同一個結果
+            async with AsyncSessionLocal() as db:
+                orders_before = (await db.execute(select(func.count()).select_from(Order))).scalar()
+            responses = await asyncio.gather(*(
+                client.post("/orders/", json=body, headers={**headers, "Idempotency-Key": "burst"})
+                for _ in range(args.duplicates)
+            ))
+            async with AsyncSessionLocal() as db:
+                orders_after = (await db.execute(select(func.count()).select_from(Order))).scalar()
+                stock_after = (await db.execute(select(Product.stock).where(Product.id == product_id))).scalar()
+
+    print(f"沒有 key（每次都建立）   {no_key * 1000:7.2f} ms/request")
+    print(f"新 key（建立 + 記錄回應） {first * 1000:7.2f} ms/request")
+    print(f"重送（本行程快取）       {cached * 1000:7.2f} ms/request  x{first / cached:.1f}")
+    print(f"重送（查資料表）         {table * 1000:7.2f} ms/request  x{first / table:.1f}")
+    ids = {response.json()["id"] for response in responses}
+    replayed = sum(1 for response in responses if response.headers.get("Idempotent-Replayed"))
+    print(f"{args.duplicates} 個同時重複請求：建立 {orders_after - orders_before} 筆訂單、回傳訂單 {sorted(ids)}、"
+          f"重送 {replayed} 個")
+    expected = stock_before - 2 * args.requests - 1
+    if orders_after - orders_before != 1 or len(ids) != 1 or stock_after != expected:
+        raise SystemExit(f"FAIL: 重複請求被執行多次（庫存 {stock_after}，預期 {expected}）")
+    print("OK: 重複請求只執行一次")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--duplicates", type=int, default=20)
+    args = parser.parse_args()
+
+    # 先設定 DATABASE_URL 再匯入 databases
+    path = os.path.join(tempfile.mkdtemp(), "idempotency.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.setdefault("JOB_WORKERS", "0")
+    os.environ.setdefault("SLOW_REQUEST_MS", "0")
+    from benchmarks.seed import seed_database
+    seed_database(os.environ["DATABASE_URL"], customers=100, products=100, orders=100, users=1)
+    asyncio.run(run(args))
@@ -0,0 +1,83 @@
+# 登入風暴下非認證端點的延遲（需要 httpx）
+# inline：bcrypt 直接在 event loop 上執行（舊作法）；pool：交給 utils.passwords 的執行緒池
+# 用法：python -m benchmarks.login_storm --logins 40 --probe-interval-ms 10
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import insert
+
+import routers.auth as auth
+from databases import Base, AsyncSessionLocal, create_db_engine, create_async_db_engine
+from models import Users
+from utils.passwords import bcrypt_context
+
+
+async def inline_verify(password, hashed):
+    return bcrypt_context.verify_and_update(password, hashed)
+
+
+async def storm(client, logins: int, interval: float):
+    # 探測請求依固定節奏排程，延遲從「預定送出時間」起算，event loop 被卡住的時間會完整反映出來
+    done = asyncio.Event()
+
+    async def login():
+        response = await client.post("/auth/token", data={"username": "bench", "password": "secret123"})
+        response.raise_for_status()
+
+    async def logins_then_stop():
+        await asyncio.gather(*(login() for _ in range(logins)))
+        done.set()
+
+    async def probe():
+        latencies = []
+        loop = asyncio.get_running_loop()
+        target = loop.time()
+        while not done.is_set() or len(latencies) < 20:
+            await asyncio.sleep(max(0, target - loop.time()))
+            (await client.get("/")).raise_for_status()
+            latencies.append(loop.time() - target)
+            target += interval
+        return latencies
+
+    latencies, _ = await asyncio.gather(probe(), logins_then_stop())
+    return sorted(latencies)
+
+
+async def main(logins: int, interval: float):
+    path = os.path.join(tempfile.mkdtemp(), "login.db")
+    engine = create_db_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Users).values(username="bench", email="bench@example.com", role="admin",
+                                          hashed_password=bcrypt_context.hash("secret123"), is_active=True))
+    async_engine = create_async_db_engine(f"sqlite:///{path}")
+    AsyncSessionLocal.configure(bind=async_engine)
+
+    from main import app
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        idle = await storm(client, 0, interval)
+        print(f"idle   p50={statistics.median(idle) * 1000:.1f}ms max={idle[-1] * 1000:.1f}ms")
+        original = auth.verify_password
+        for name, verify in (("inline", inline_verify), ("pool", original)):
+            auth.verify_password = verify
+            started = time.perf_counter()
+            latencies = await storm(client, logins, interval)
+            elapsed = time.perf_counter() - started
+            print(f"{name:6s} logins={logins} elapsed={elapsed:.1f}s probe p50={statistics.median(latencies) * 1000:.1f}ms "
+                  f"p95={latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms max={latencies[-1] * 1000:.1f}ms")
+        auth.verify_password = original
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--probe-interval-ms", type=float, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.probe_interval_ms / 1000))
@@ -0,0 +1,113 @@
+# 舊資料庫升級檢查：以加入 migration 之前的資料表結構建立有資料的資料庫，套用全部 migration，
+# 確認每個版本都執行成功、預期的索引都存在、報表彙總與訂單一致、庫存異動帳與 Product.stock 一致，
+# 且刪除最新的訂單 / 項目後，新資料不會重複使用其 id（重複的 id 會讓封存資料表的主鍵衝突）
+# migration 只能依賴當時的資料表結構，不能讀取目前 model 的欄位或索引；任一項失敗時以非零狀態結束
+# 用法：python -m benchmarks.migration_upgrade
+import os
+import sys
+import tempfile
+
+from sqlalchemy import inspect, text
+
+from databases import create_db_engine
+from utils.ledger import verify
+from utils.migrations import applied_versions, latest_version, run_migrations
+
+# 加入 migration 之前（create_all 建立）的資料表結構
+BASELINE_SCHEMA = [
+    """CREATE TABLE customers (
+        id INTEGER NOT NULL, name VARCHAR, email VARCHAR, phone VARCHAR, is_active BOOLEAN,
+        PRIMARY KEY (id), UNIQUE (email))""",
+    "CREATE INDEX ix_customers_id ON customers (id)",
+    """CREATE TABLE products (
+        id INTEGER NOT NULL, name VARCHAR, price FLOAT, stock INTEGER, category VARCHAR, is_active BOOLEAN,
+        PRIMARY KEY (id))""",
+    "CREATE INDEX ix_products_id ON products (id)",
+    """CREATE TABLE users (
+        id INTEGER NOT NULL, username VARCHAR, email VARCHAR, first_name VARCHAR, last_name VARCHAR,
+        phone VARCHAR, hashed_password VARCHAR, role VARCHAR, is_active BOOLEAN, customer_id INTEGER,
+        PRIMARY KEY (id), UNIQUE (email), FOREIGN KEY(customer_id) REFERENCES customers (id))""",
+    "CREATE INDEX ix_users_id ON users (id)",
+    "CREATE UNIQUE INDEX ix_users_username ON users (username)",
+    """CREATE TABLE orders (
+        id INTEGER NOT NULL, customer_id INTEGER, order_date DATETIME, total_amount FLOAT, payment_status VARCHAR,
+        PRIMARY KEY (id), FOREIGN KEY(customer_id) REFERENCES customers (id))""",
+    "CREATE INDEX ix_orders_id ON orders (id)",
+    """CREATE TABLE order_items (
+        id INTEGER NOT NULL, order_id INTEGER, product_id INTEGER, quantity INTEGER, unit_price FLOAT,
+        PRIMARY KEY (id), FOREIGN KEY(order_id) REFERENCES orders (id),
+        FOREIGN KEY(product_id) REFERENCES products (id))""",
+    "CREATE INDEX ix_order_items_id ON order_items (id)",
+]
+
+BASELINE_DATA = [
+    "INSERT INTO customers VALUES (1, 'Alice', 'alice@example.com', NULL, 1), (2, 'Bob', 'bob@example.com', NULL, 1)",
+    "INSERT INTO products VALUES (1, 'Bolt', 1.5, 100, 'tools', 1), (2, 'Nut', 0.5, 0, 'tools', 1)",
+    "INSERT INTO orders VALUES (1, 1, '2024-01-02 10:00:00', 3.0, 'paid'), (2, 2, '2024-02-03 11:00:00', 0.5, 'pending')",
+    "INSERT INTO order_items VALUES (1, 1, 1, 2, 1.5), (2, 2, 2, 1, 0.5)",
+]
+
+EXPECTED_INDEXES = [
+    "ix_orders_order_date_id", "ix_orders_customer_date", "ix_orders_status_date", "ix_order_items_order_id",
+    "ix_products_active_category_price", "ix_products_active_price",
+    "ix_customers_row_version", "ix_products_row_version", "ix_orders_row_version",
+    "ix_customer_sales_revenue", "ix_stock_movements_created_at", "ux_idempotency_keys_scope_key",
+    "ix_orders_archive_order_date_id", "ix_orders_id", "ix_order_items_id", "ix_order_items_product_id",
+]
+
+
+def run():
+    engine = create_db_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'upgrade.db')}")
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA + BASELINE_DATA:
+            conn.execute(text(statement))
+
+    failures = 0
+    try:
+        run_migrations(engine)
+    except Exception as e:
+        print(f"FAIL 套用 migration：{type(e).__name__}: {e}")
+        engine.dispose()
+        return 1
+
+    with engine.connect() as conn:
+        versions = applied_versions(conn)
+        ok = versions == set(range(1, latest_version() + 1))
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} 已套用 migration {sorted(versions)}")
+
+        indexes = {index["name"] for name in inspect(conn).get_table_names()
+                   for index in inspect(conn).get_indexes(name)}
+        missing = [name for name in EXPECTED_INDEXES if name not in indexes]
+        failures += bool(missing)
+        print(f"{'OK  ' if not missing else 'FAIL'} 索引{'：缺少 ' + ', '.join(missing) if missing else ''}")
+
+        revenue = conn.execute(text("SELECT sum(revenue) FROM customer_sales")).scalar()
+        ok = revenue == 3.5
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} 顧客彙總營收 {revenue}（預期 3.5）")
+
+        mismatches = verify(conn)
+        failures += bool(mismatches)
+        print(f"{'OK  ' if not mismatches else 'FAIL'} 異動帳與庫存{'一致' if not mismatches else f'有 {len(mismatches)} 個商品不一致'}")
+
+    with engine.begin() as conn:
+        reused = []
+        for table, insert_new in (
+            ("order_items", "INSERT INTO order_items (order_id, product_id, quantity, unit_price) VALUES (1, 1, 1, 1.5)"),
+            ("orders", "INSERT INTO orders (customer_id, order_date, total_amount, payment_status) "
+                       "VALUES (1, '2024-03-01 09:00:00', 0, 'pending')"),
+        ):
+            newest = conn.execute(text(f"SELECT max(id) FROM {table}")).scalar()
+            conn.execute(text(f"DELETE FROM {table} WHERE id = :id"), {"id": newest})
+            conn.execute(text(insert_new))
+            if conn.execute(text(f"SELECT max(id) FROM {table}")).scalar() <= newest:
+                reused.append(table)
+        failures += bool(reused)
+        print(f"{'OK  ' if not reused else 'FAIL'} 刪除最新資料後不重複配號{'：' + ', '.join(reused) if reused else ''}")
+    engine.dispose()
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if run() else 0)
@@ -0,0 +1,124 @@
+# 訂單封存前後比較：多年份的訂單資料，封存一年以前已結案的訂單（再 VACUUM）後，
+# 量測一般資料表（orders / order_items 與其索引）的大小、常用查詢與匯出的耗時，以及每批封存持有寫入鎖的時間
+# 用法：python -m benchmarks.order_archive --orders 100000 --days 1825 --repeat 5
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+# dbstat 統計 orders、order_items 與其索引使用的頁面數（未 VACUUM 前包含刪除後只剩部分資料的頁面）
+def hot_size(engine):
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(
+            "SELECT sum(s.pgsize) FROM dbstat s JOIN sqlite_master m ON m.name = s.name "
+            "WHERE m.tbl_name IN ('orders', 'order_items')"
+        ).scalar()
+
+
+async def _best(fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+async def measure(args, now: datetime):
+    from databases import AsyncSessionLocal
+    from routers.order import list_orders
+    from routers.exports import export_query
+    from utils.archive import includes_archive
+    from utils.csv_stream import stream_csv
+
+    admin = {"user_role": "admin", "customer_id": None}
+    customer = {"user_role": "customer", "customer_id": 7}
+    recent = now - timedelta(days=30)
+
+    async with AsyncSessionLocal() as db:
+        async def page(user, **filters):
+            params = dict(limit=50, cursor=None, payment_status=None, date_from=None, date_to=None, customer_id=None)
+            return await list_orders(db=db, user=user, **{**params, **filters})
+
+        async def export(kind, date_from=None):
+            params = {"kind": kind, "gzip": False}
+            if date_from:
+                params["date_from"] = date_from.isoformat()
+            if await includes_archive(db, date_from):
+                params["archive"] = True
+            header, stmt = export_query(params)
+            return sum([len(chunk) async for chunk in stream_csv(header, stmt)])
+
+        cases = {
+            "admin 第一頁": lambda: page(admin),
+            "顧客第一頁": lambda: page(customer),
+            "已付款第一頁": lambda: page(admin, payment_status="paid"),
+            "近 30 天第一頁": lambda: page(admin, date_from=recent),
+            "明細匯出近 30 天": lambda: export("orders_detailed", recent),
+            "訂單全部匯出": lambda: export("orders"),
+        }
+        return {name: await _best(fn, args.repeat) for name, fn in cases.items()}
+
+
+def archive(engine, cutoff: datetime):
+    from utils.archive import archive_batch
+
+    batches = []
+    while True:
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            moved = archive_batch(conn, cutoff)
+        if not moved:
+            return batches
+        batches.append((moved, time.perf_counter() - started))
+
+
+async def run(args):
+    from databases import engine, async_engine
+    from utils.archive import status, vacuum
+
+    now = datetime(2025, 1, 1)   # 與 benchmarks.seed 相同的基準時間
+    sizes, results = [hot_size(engine)], [await measure(args, now)]
+
+    started = time.perf_counter()
+    batches = archive(engine, now - timedelta(days=args.archive_days))
+    elapsed = time.perf_counter() - started
+    sizes.append(hot_size(engine))
+    results.append(await measure(args, now))
+
+    await async_engine.dispose()   # VACUUM 需要沒有其他連線
+    vacuum(engine)
+    sizes.append(hot_size(engine))
+    results.append(await measure(args, now))
+    await async_engine.dispose()
+
+    with engine.connect() as conn:
+        counts = status(conn)
+    moved = sum(n for n, _ in batches)
+    print(f"封存 {moved} 筆訂單（{len(batches)} 批，{elapsed:.1f}s），單批最長持有寫入鎖 "
+          f"{max((s for _, s in batches), default=0) * 1000:.1f} ms")
+    print(f"一般 / 封存訂單：{counts['orders']} / {counts['orders_archive']}，水位 {counts['watermark']}")
+    print("一般資料表（含索引）：" + " → ".join(f"{size / 2 ** 20:.1f} MiB" for size in sizes) + "（封存前 → 封存後 → VACUUM 後）")
+    for name in results[0]:
+        before, archived, vacuumed = (r[name] * 1000 for r in results)
+        print(f"{name:14s} 封存前 {before:8.2f} ms  封存後 {archived:8.2f} ms  VACUUM 後 {vacuumed:8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=1825, help="訂單日期分布的天數")
+    parser.add_argument("--archive-days", type=int, default=365, help="封存幾天以前已結案的訂單")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # 先設定 DATABASE_URL 再匯入 databases
+    path = os.path.join(tempfile.mkdtemp(), "archive.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from benchmarks.seed import seed_database
+    seed_database(os.environ["DATABASE_URL"], customers=2000, products=2000, orders=args.orders, users=1,
+                  days=args.days)
+    asyncio.run(run(args))
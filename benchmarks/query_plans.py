@@ -0,0 +1,92 @@
+# 查詢計畫回歸檢查：在套用 migration 的空資料庫上對熱門查詢執行 EXPLAIN QUERY PLAN，
+# 確認都有用到預期的索引；任一查詢退化成全表掃描時以非零狀態結束
+# 用法：python -m benchmarks.query_plans
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import select, delete, or_, and_
+
+from databases import create_db_engine
+from models import Order, OrderItem, Product, Customer, CustomerSales, IdempotencyKey, ArchivedOrder
+from routers.customers import customer_with_summary
+from routers.exports import detailed_orders_stmt, delta_stmt, EXPORTS
+from utils.cache import catalog_version_stmt
+from utils.ledger import position_stmt, stock_at_stmt
+from utils.archive import watermark_stmt
+from utils.migrations import run_migrations
+
+SINCE = datetime(2024, 1, 1)
+
+
+def hot_queries():
+    newest_first = (Order.order_date.desc(), Order.id.desc())
+    return [
+        ("orders: 顧客自己的訂單", "ix_orders_customer_date",
+         select(Order).where(Order.customer_id == 1).order_by(*newest_first).limit(51)),
+        ("orders: 依付款狀態", "ix_orders_status_date",
+         select(Order).where(Order.payment_status == "pending").order_by(*newest_first).limit(51)),
+        ("orders: admin keyset 下一頁", "ix_orders_order_date_id",
+         select(Order).where(or_(Order.order_date < SINCE, and_(Order.order_date == SINCE, Order.id < 100)))
+         .order_by(*newest_first).limit(51)),
+        ("order_items: selectinload", "ix_order_items_order_id",
+         select(OrderItem).where(OrderItem.order_id.in_([1, 2, 3]))),
+        ("products: 分類 + 價格區間", "ix_products_active_category_price",
+         select(Product).where(Product.is_active == True, Product.category == "tools",
+                               Product.price >= 10, Product.price <= 100)),
+        ("products: 價格區間", "ix_products_active_price",
+         select(Product).where(Product.is_active == True, Product.price >= 10, Product.price <= 100)),
+        ("exports: 訂單明細日期區間", "ix_orders_order_date_id",
+         detailed_orders_stmt(date_from=SINCE)),
+        ("exports: 商品增量", "ix_products_row_version",
+         delta_stmt([(EXPORTS["products"][1]({}), Product)], "products", 100, 200)),
+        ("exports: 增量 tombstone", "ix_deleted_rows_table_version",
+         delta_stmt([(EXPORTS["customers"][1]({}), Customer)], "customers", 100, 200)),
+        ("products: 目錄版本", "ix_products_row_version", catalog_version_stmt()),
+        ("products: 目錄版本 tombstone", "ix_deleted_rows_table_version", catalog_version_stmt()),
+        ("inventory: 時間點換算異動位置", "ix_stock_movements_created_at", position_stmt(SINCE)),
+        ("inventory: 時間點庫存（快照）", "ix_stock_snapshots_product_movement", stock_at_stmt(100, 200)),
+        ("orders: Idempotency-Key 查詢", "ux_idempotency_keys_scope_key",
+         select(IdempotencyKey).where(IdempotencyKey.scope == "1", IdempotencyKey.key == "k")),
+        ("idempotency: 清除過期 key", "ix_idempotency_keys_expires_at",
+         delete(IdempotencyKey).where(IdempotencyKey.expires_at < SINCE)),
+        ("orders: 封存水位", "ix_orders_archive_order_date_id", watermark_stmt()),
+        ("orders: 封存的顧客訂單", "ix_orders_archive_customer_date",
+         select(ArchivedOrder).where(ArchivedOrder.customer_id == 1)
+         .order_by(ArchivedOrder.order_date.desc(), ArchivedOrder.id.desc()).limit(51)),
+        ("exports: 封存訂單增量", "ix_orders_archive_row_version",
+         delta_stmt([(EXPORTS["orders"][1]({}), Order), (EXPORTS["orders"][1]({}, ArchivedOrder), ArchivedOrder)],
+                    "orders", 100, 200)),
+        ("customers: 消費金額前 100 名", "ix_customer_sales_revenue",
+         customer_with_summary(inner=True)
+         .order_by(CustomerSales.revenue.desc(), CustomerSales.customer_id.desc()).limit(100)),
+        ("customers: 最近下單區間", "ix_customer_sales_last_order_at",
+         customer_with_summary(inner=True).where(CustomerSales.last_order_at >= SINCE)),
+    ]
+
+
+def explain(conn, stmt):
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def run():
+    engine = create_db_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'plans.db')}")
+    run_migrations(engine)
+    failures = 0
+    with engine.connect() as conn:
+        for name, index, stmt in hot_queries():
+            plan = explain(conn, stmt)
+            ok = any(index in step for step in plan)
+            failures += not ok
+            print(f"{'OK  ' if ok else 'FAIL'} {name}: 預期 {index}")
+            if not ok:
+                for step in plan:
+                    print(f"       {step}")
+    engine.dispose()
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if run() else 0)
@@ -0,0 +1,146 @@
+# 讀寫分流：大量匯出同時進行時的下單延遲
+#   idle             沒有匯出
+#   primary / read   同一個行程內的匯出請求；primary 帶 X-Read-Primary: 1 與下單共用主資料庫連線池（分流之前），
+#                    read 走 async_read_engine（SQLite 為同一個檔案的 query_only 連線池）
+#   process-*        匯出在另一個行程執行（背景工作 worker 或其他 gunicorn worker），分別讀主資料庫 / 讀取來源
+# 讀取來源的連線池（--read-pool-size）同時限制了同一行程內能同時串流的匯出數
+# 用法：python -m benchmarks.read_routing --orders 20000 --writers 8 --exporters 4 --seconds 8 --pool-size 4 --read-pool-size 1
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+import httpx
+
+
+async def phase(client, headers, args, exporters: int, primary: bool):
+    rng = random.Random(1)
+    stop = asyncio.Event()
+    latencies, exports, errors = [], [], []
+    export_headers = {**headers, "X-Read-Primary": "1"} if primary else headers
+
+    async def writer():
+        while not stop.is_set():
+            body = {"customer_id": rng.randint(1, 2000),
+                    "items": [{"product_id": rng.randint(1, 2000), "quantity": 1}]}
+            started = time.perf_counter()
+            response = await client.post("/orders/", json=body, headers=headers)
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+            elif response.status_code >= 500:
+                errors.append(response.status_code)   # 等待寫入鎖超過 busy_timeout
+
+    async def exporter():
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = await client.get("/exports/orders/detailed", headers=export_headers)
+            response.raise_for_status()
+            exports.append(time.perf_counter() - started)
+
+    tasks = [asyncio.create_task(writer()) for _ in range(args.writers)]
+    tasks += [asyncio.create_task(exporter()) for _ in range(exporters)]
+    await asyncio.sleep(args.seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+    return {
+        "orders/s": len(latencies) / args.seconds,
+        "p50": statistics.median(latencies) * 1000 if latencies else 0,
+        "p95": p95 * 1000,
+        "max": latencies[-1] * 1000 if latencies else 0,
+        "exports": len(exports),
+        "errors": len(errors),
+    }
+
+
+# 另一個行程的匯出迴圈：直到 stop 設定為止重複串流訂單明細，完成次數寫入 done
+def _export_process(url, primary: bool, stop, done):
+    os.environ["DATABASE_URL"] = url
+
+    async def loop():
+        from databases import AsyncSessionLocal, AsyncReadSessionLocal, async_engine, async_read_engine
+        from routers.exports import export_query
+        from utils.csv_stream import stream_csv
+
+        header, stmt = export_query({"kind": "orders_detailed"})
+        while not stop.is_set():
+            async for _ in stream_csv(header, stmt, sessions=AsyncSessionLocal if primary else AsyncReadSessionLocal):
+                pass
+            with done.get_lock():
+                done.value += 1
+        await async_engine.dispose()
+        await async_read_engine.dispose()
+
+    asyncio.run(loop())
+
+
+async def process_phase(client, headers, args, primary: bool):
+    context = multiprocessing.get_context("spawn")
+    stop, done = context.Event(), context.Value("i", 0)
+    workers = [context.Process(target=_export_process, args=(os.environ["DATABASE_URL"], primary, stop, done))
+               for _ in range(args.exporters)]
+    for worker in workers:
+        worker.start()
+    await asyncio.sleep(2)   # 等子行程匯入完成、開始匯出
+    result = await phase(client, headers, args, 0, primary=True)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    result["exports"] = done.value
+    return result
+
+
+async def run(args):
+    import main
+    from databases import async_engine, async_read_engine
+    from routers.auth import create_access_token
+
+    headers = {"Authorization": "Bearer " + create_access_token("bench", 1, "admin", None, timedelta(minutes=30))}
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            results["idle"] = await phase(client, headers, args, 0, primary=True)
+            results["read"] = await phase(client, headers, args, args.exporters, primary=False)
+            results["primary"] = await phase(client, headers, args, args.exporters, primary=True)
+            results["process-primary"] = await process_phase(client, headers, args, primary=True)
+            results["process-read"] = await process_phase(client, headers, args, primary=False)
+
+    print(f"writers={args.writers} exporters={args.exporters} pool={args.pool_size}+{args.max_overflow} "
+          f"read pool={args.read_pool_size}+0 "
+          f"讀取來源{'為獨立連線池' if async_read_engine is not async_engine else '與主資料庫相同'}")
+    for name, r in results.items():
+        print(f"{name:16s} {r['orders/s']:7.1f} orders/s  p50 {r['p50']:7.2f} ms  p95 {r['p95']:8.2f} ms  "
+              f"max {r['max']:8.2f} ms  失敗 {r['errors']}  匯出 {r['exports']} 次")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--exporters", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=8)
+    parser.add_argument("--pool-size", type=int, default=4, help="主資料庫的連線池大小")
+    parser.add_argument("--max-overflow", type=int, default=0)
+    parser.add_argument("--read-pool-size", type=int, default=1, help="讀取來源的連線池大小")
+    args = parser.parse_args()
+
+    # 先設定 DATABASE_URL 與連線池大小再匯入 databases
+    path = os.path.join(tempfile.mkdtemp(), "read_routing.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["DB_POOL_SIZE"] = str(args.pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = str(args.max_overflow)
+    os.environ["DB_READ_POOL_SIZE"] = str(args.read_pool_size)
+    os.environ["DB_READ_MAX_OVERFLOW"] = "0"
+    os.environ.setdefault("JOB_WORKERS", "0")
+    os.environ.setdefault("SLOW_REQUEST_MS", "0")
+    from benchmarks.seed import seed_database
+    seed_database(os.environ["DATABASE_URL"], customers=2000, products=2000, orders=args.orders, users=1)
+    asyncio.run(run(args))
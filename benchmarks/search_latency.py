@@ -0,0 +1,69 @@
+# 商品搜尋延遲：比較 LIKE '%x%' 全表掃描與 FTS5 trigram 索引的 p50 / p95
+# 用法：python -m benchmarks.search_latency --products 500000 --queries 200
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+
+from databases import Base
+from models import Product
+from utils.search import ensure_search_index, search_subquery
+from sqlalchemy.orm import sessionmaker
+
+WORDS = ["steel", "bolt", "washer", "cable", "drill", "gear", "valve", "pump", "filter", "sensor",
+         "bracket", "hinge", "spring", "nozzle", "clamp", "socket", "relay", "motor", "panel", "switch"]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(products: int, queries: int, limit: int):
+    path = os.path.join(tempfile.mkdtemp(), "search.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        for start in range(0, products, 50000):
+            conn.execute(insert(Product), [
+                {"name": f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}", "price": 1 + i % 100, "stock": 10,
+                 "category": "bench", "is_active": True}
+                for i in range(start, min(start + 50000, products))
+            ])
+    ensure_search_index(engine)
+    Session = sessionmaker(bind=engine)
+
+    terms = [rng.choice(WORDS)[1:5] + " " if rng.random() < 0.3 else str(rng.randint(100, 99999)) for _ in range(queries)]
+    results = {}
+    with Session() as db:
+        for name in ("like", "fts5"):
+            timings = []
+            for term in terms:
+                term = term.strip()
+                query = db.query(Product).filter(Product.is_active == True)
+                if name == "fts5":
+                    matches = search_subquery("products", term)
+                    query = query.join(matches, matches.c.id == Product.id).order_by(matches.c.rank, Product.id)
+                else:
+                    query = query.filter(Product.name.contains(term))
+                started = time.perf_counter()
+                query.limit(limit).all()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = timings
+            print(f"{name:5s} products={products} p50={statistics.median(timings):.2f}ms "
+                  f"p95={percentile(timings, 95):.2f}ms")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=500000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    run(args.products, args.queries, args.limit)
@@ -0,0 +1,111 @@
+# 產生可重現的基準測試資料庫：固定亂數種子，依指定數量建立顧客、商品、訂單與登入帳號
+# 用法：python -m benchmarks.seed --db /tmp/bench.db --customers 2000 --products 5000 --orders 20000
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, func
+
+CATEGORIES = ["tools", "garden", "kitchen", "office", "toys", "sports", "books", "audio"]
+WORDS = ["Blue", "Steel", "Compact", "Deluxe", "Smart", "Classic", "Mini", "Pro", "Eco", "Ultra"]
+NOUNS = ["Widget", "Gadget", "Lamp", "Kettle", "Drill", "Chair", "Speaker", "Notebook", "Ball", "Shears"]
+PASSWORD = "bench-password"
+ADMIN_USERNAME = "bench_admin"
+CHUNK = 5000
+
+
+def _chunks(rows):
+    for start in range(0, len(rows), CHUNK):
+        yield rows[start:start + CHUNK]
+
+
+def seed_database(url: str, customers: int, products: int, orders: int, users: int = 20,
+                  items_per_order: int = 3, seed: int = 42, days: int = 365):
+    # 延後匯入：databases 在匯入時依 DATABASE_URL 建立 engine，benchmarks.suite 需先設定環境變數
+    from databases import create_db_engine
+    from models import Customer, Product, Order, OrderItem, Users
+    from utils.migrations import run_migrations
+    from utils.passwords import bcrypt_context
+    from utils.reports import rebuild_reports
+    from utils.ledger import record_opening_balances, take_snapshot
+
+    rng = random.Random(seed)
+    engine = create_db_engine(url)
+    run_migrations(engine)
+    now = datetime(2025, 1, 1)
+    started = time.perf_counter()
+
+    with engine.begin() as conn:
+        if conn.execute(select(func.count()).select_from(Product)).scalar():
+            raise SystemExit(f"{url} 已有資料，請指定新的資料庫檔案")
+
+        for rows in _chunks([
+            {"name": f"Customer {i}", "email": f"customer{i}@bench.example", "phone": f"09{i:08d}", "is_active": True}
+            for i in range(1, customers + 1)
+        ]):
+            conn.execute(insert(Customer), rows)
+
+        prices = {}
+        product_rows = []
+        for i in range(1, products + 1):
+            prices[i] = round(rng.uniform(1, 500), 2)
+            product_rows.append({
+                "name": f"{rng.choice(WORDS)} {rng.choice(NOUNS)} {i}",
+                "price": prices[i],
+                "stock": 99999,
+                "category": rng.choice(CATEGORIES),
+                "is_active": rng.random() > 0.05,
+            })
+        for rows in _chunks(product_rows):
+            conn.execute(insert(Product), rows)
+        record_opening_balances(conn)
+
+        # 訂單與項目：id 依序產生，讓項目可以直接指向訂單
+        order_rows, item_rows = [], []
+        for order_id in range(1, orders + 1):
+            items = [(rng.randint(1, products), rng.randint(1, 5)) for _ in range(rng.randint(1, items_per_order))]
+            order_rows.append({
+                "id": order_id,
+                "customer_id": rng.randint(1, customers),
+                "order_date": now - timedelta(minutes=rng.randint(0, days * 24 * 60)),
+                "total_amount": round(sum(prices[pid] * qty for pid, qty in items), 2),
+                "payment_status": rng.choices(["pending", "paid", "cancelled"], [3, 6, 1])[0],
+            })
+            item_rows += [{"order_id": order_id, "product_id": pid, "quantity": qty, "unit_price": prices[pid]}
+                          for pid, qty in items]
+        for rows in _chunks(order_rows):
+            conn.execute(insert(Order), rows)
+        for rows in _chunks(item_rows):
+            conn.execute(insert(OrderItem), rows)
+
+        # 登入帳號共用同一組密碼雜湊，避免 seed 花時間在 bcrypt 上
+        hashed = bcrypt_context.hash(PASSWORD)
+        conn.execute(insert(Users), [{
+            "username": ADMIN_USERNAME, "email": "admin@bench.example", "hashed_password": hashed,
+            "role": "admin", "is_active": True, "customer_id": None,
+        }] + [{
+            "username": f"bench_user{i}", "email": f"customer{i}@bench.example", "hashed_password": hashed,
+            "role": "customer", "is_active": True, "customer_id": i,
+        } for i in range(1, min(users, customers) + 1)])
+
+        rebuild_reports(conn)
+        take_snapshot(conn)
+
+    engine.dispose()
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="SQLite 檔案路徑")
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=365, help="訂單日期分布的天數")
+    args = parser.parse_args()
+    elapsed = seed_database(f"sqlite:///{args.db}", args.customers, args.products, args.orders, args.users,
+                            seed=args.seed, days=args.days)
+    print(f"已建立 {args.db}：{args.customers} 顧客 / {args.products} 商品 / {args.orders} 訂單，{elapsed:.1f}s")
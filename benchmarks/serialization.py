@@ -0,0 +1,89 @@
+# 列表回應序列化比較：ORM 物件 + Pydantic 逐筆驗證（FastAPI response_model 的作法） vs. 只查欄位 + orjson
+# 用法：python -m benchmarks.serialization --products 10000 --orders 5000 --repeat 5
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from pydantic import TypeAdapter
+
+
+def _fastapi_json(adapter: TypeAdapter, content):
+    # 與 FastAPI 處理 response_model 相同：from_attributes 驗證 → mode="json" 輸出 → JSONResponse 的 json.dumps
+    value = adapter.validate_python(content, from_attributes=True)
+    return json.dumps(adapter.dump_python(value, mode="json"), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode()
+
+
+async def _best(fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = await fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), body
+
+
+async def run(args):
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+    from databases import AsyncSessionLocal, async_engine
+    from models import Product, Order
+    from schemas import ProductRead, OrderPage
+    from routers.order import list_orders
+    from routers.products import _query_products
+    from utils.serialization import dump_json
+
+    products = TypeAdapter(list[ProductRead])
+    page = TypeAdapter(OrderPage)
+    admin = {"user_role": "admin", "customer_id": None}
+
+    async with AsyncSessionLocal() as db:
+        async def products_pydantic():
+            rows = (await db.execute(select(Product))).scalars().all()
+            return _fastapi_json(products, rows)
+
+        async def products_fast():
+            return dump_json(await _query_products(db, False, None, None, None, None, None, 0))
+
+        async def orders_pydantic():
+            query = (select(Order).options(selectinload(Order.items))
+                     .order_by(Order.order_date.desc(), Order.id.desc()).limit(args.orders))
+            orders = (await db.execute(query)).scalars().all()
+            return _fastapi_json(page, {"items": orders, "next_cursor": None})
+
+        async def orders_fast():
+            response = await list_orders(db=db, user=admin, limit=args.orders, cursor=None, payment_status=None,
+                                         date_from=None, date_to=None, customer_id=None)
+            return response.body
+
+        for name, old, new in (("products", products_pydantic, products_fast),
+                               ("orders", orders_pydantic, orders_fast)):
+            # 每次都從資料庫重新載入，避免 identity map 讓 ORM 路徑少算載入成本
+            db.expunge_all()
+            old_seconds, old_body = await _best(old, args.repeat)
+            new_seconds, new_body = await _best(new, args.repeat)
+            same = json.loads(old_body) == json.loads(new_body)
+            print(f"{name:9s} pydantic={old_seconds * 1000:8.1f} ms  orjson={new_seconds * 1000:8.1f} ms  "
+                  f"x{old_seconds / new_seconds:.1f}  bytes={len(new_body)}  identical={same}")
+            if not same:
+                raise SystemExit(f"{name} 兩種輸出不一致")
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--orders", type=int, default=5000, help="訂單列表一次回傳的筆數")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # 先設定 DATABASE_URL 再匯入 databases
+    path = os.path.join(tempfile.mkdtemp(), "serialization.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from benchmarks.seed import seed_database
+    seed_database(os.environ["DATABASE_URL"], customers=1000, products=args.products, orders=args.orders, users=1)
+    asyncio.run(run(args))
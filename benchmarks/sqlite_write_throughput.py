@@ -0,0 +1,72 @@
+# SQLite 寫入吞吐量：比較舊設定（預設 rollback journal、synchronous=FULL）與 WAL + PRAGMA 設定
+# 用法：python -m benchmarks.sqlite_write_throughput --threads 8 --seconds 5
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, update
+from sqlalchemy.exc import OperationalError
+
+from databases import Base, create_db_engine
+from models import Order, Product
+
+
+def legacy_engine(url):
+    # databases.py 原本的設定
+    return create_engine(url, connect_args={"check_same_thread": False})
+
+
+def run_one(name, engine, threads: int, seconds: float):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Product), [{"name": f"P{i}", "price": 1, "stock": 10 ** 9, "is_active": True} for i in range(50)])
+
+    counts = {"ok": 0, "locked": 0}
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(n):
+        i = 0
+        while time.perf_counter() < deadline:
+            i += 1
+            started = time.perf_counter()
+            try:
+                # 模擬下單：一筆訂單 insert 加一次庫存 update
+                with engine.begin() as conn:
+                    conn.execute(insert(Order).values(customer_id=1, order_date=datetime.utcnow(),
+                                                      total_amount=1, payment_status="pending"))
+                    conn.execute(update(Product).where(Product.id == 1 + (n * 7 + i) % 50)
+                                 .values(stock=Product.stock - 1))
+            except OperationalError:
+                with lock:
+                    counts["locked"] += 1
+                continue
+            with lock:
+                counts["ok"] += 1
+                latencies.append(time.perf_counter() - started)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    engine.dispose()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+    print(f"{name:8s} threads={threads} tx/s={counts['ok'] / seconds:.0f} "
+          f"locked_errors={counts['locked']} p95={p95:.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+    for name, factory in (("legacy", legacy_engine), ("tuned", create_db_engine)):
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'writes.db')}"
+        run_one(name, factory(url), args.threads, args.seconds)
@@ -0,0 +1,75 @@
+# 庫存預留併發壓力測試：大量協程同時對同一批商品下單，驗證 SQLite 檔案上不會超賣
+# 用法：python -m benchmarks.stock_concurrency --workers 16 --orders 400 --stock 100
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from databases import Base, create_async_db_engine
+from models import Product
+from utils.stock import reserve_stock, StockError
+
+
+async def run(workers: int, orders: int, stock: int, products: int):
+    path = os.path.join(tempfile.mkdtemp(), "stock.db")
+    engine = create_async_db_engine(f"sqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async with Session() as db:
+        db.add_all([Product(name=f"P{i}", price=10, stock=stock, category="bench", is_active=True) for i in range(products)])
+        await db.commit()
+        ids = list((await db.execute(select(Product.id))).scalars())
+
+    sold = {pid: 0 for pid in ids}
+    counts = {"ok": 0, "rejected": 0, "locked": 0}
+
+    async def worker(n):
+        for i in range(n, orders, workers):
+            # 每筆訂單購買所有商品，數量 1~3
+            items = [SimpleNamespace(product_id=pid, quantity=1 + (i + pid) % 3) for pid in ids]
+            async with Session() as db:
+                try:
+                    await reserve_stock(db, items)
+                    await db.commit()
+                except StockError:
+                    counts["rejected"] += 1
+                    continue
+                except OperationalError:
+                    await db.rollback()
+                    counts["locked"] += 1
+                    continue
+            counts["ok"] += 1
+            for item in items:
+                sold[item.product_id] += item.quantity
+
+    await asyncio.gather(*(worker(n) for n in range(workers)))
+
+    async with Session() as db:
+        final = {p.id: p.stock for p in (await db.execute(select(Product))).scalars()}
+    await engine.dispose()
+
+    oversold = [pid for pid in ids if final[pid] < 0 or final[pid] != stock - sold[pid]]
+    print(f"orders ok={counts['ok']} rejected={counts['rejected']} locked={counts['locked']}")
+    print(f"final stock={final}")
+    return not oversold
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--orders", type=int, default=400)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--products", type=int, default=5)
+    args = parser.parse_args()
+    if not asyncio.run(run(args.workers, args.orders, args.stock, args.products)):
+        print("FAIL: 庫存出現超賣或與成交數量不一致")
+        sys.exit(1)
+    print("OK: 無超賣")
@@ -0,0 +1,151 @@
+# 庫存異動帳寫入競爭：大量協程同時對少數熱門商品下單，比較三種寫法的吞吐量、鎖定錯誤與是否超賣
+#   update  只有條件式 UPDATE（加入異動帳之前的做法）
+#   ledger  條件式 UPDATE + 同一交易寫入異動（目前的 reserve_stock）
+#   append  不維護 Product.stock，只追加異動，再以「快照 + 之後的異動」檢查是否為負
+# 另外量測異動累積後的時間點庫存查詢，以及寫入快照後的差異
+# 用法：python -m benchmarks.stock_ledger --workers 16 --orders 2000 --stock 100000 --products 5
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import func, select, update, case
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from databases import Base, create_async_db_engine
+from models import Product, StockMovement
+from utils.changes import change_version
+from utils.ledger import record_movements, take_snapshot, checkpoint_stmt, stock_at_stmt, SALE
+from utils.stock import reserve_stock, StockError, _aggregate
+
+VARIANTS = ("update", "ledger", "append")
+
+
+async def _update_only(db, items):
+    quantities = _aggregate(items)
+    delta = case(quantities, value=Product.id)
+    stmt = update(Product).where(Product.id.in_(list(quantities)), Product.stock >= delta).values(
+        stock=Product.stock - delta, row_version=await change_version(db), updated_at=datetime.utcnow(),
+    ).execution_options(synchronize_session=False)
+    if (await db.execute(stmt)).rowcount != len(quantities):
+        await db.rollback()
+        raise StockError([])
+
+
+# 先寫入再檢查：寫入後持有寫入鎖，之後讀到的餘額已包含所有已 commit 的異動
+async def _append_only(db, items):
+    quantities = _aggregate(items)
+    await record_movements(db, quantities, -1, SALE)
+    checkpoint = (await db.execute(checkpoint_stmt())).scalar() or 0
+    balances = (await db.execute(stock_at_stmt(checkpoint).where(Product.id.in_(list(quantities))))).mappings()
+    if any(row["stock"] < 0 for row in balances):
+        await db.rollback()
+        raise StockError([])
+
+
+async def _ledger_stock(db, ids):
+    checkpoint = (await db.execute(checkpoint_stmt())).scalar() or 0
+    rows = (await db.execute(stock_at_stmt(checkpoint).where(Product.id.in_(ids)))).mappings()
+    return {row["product_id"]: row["stock"] for row in rows}
+
+
+async def _time_stock_at(Session, ids, repeat: int = 20):
+    async with Session() as db:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            await _ledger_stock(db, ids)
+        return (time.perf_counter() - started) / repeat * 1000
+
+
+async def run(variant: str, workers: int, orders: int, stock: int, products: int):
+    path = os.path.join(tempfile.mkdtemp(), "ledger.db")
+    engine = create_async_db_engine(f"sqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    # ORM 新增商品時會自動寫入期初異動；先寫一次快照作為 append 的檢查起點
+    async with Session() as db:
+        db.add_all([Product(name=f"P{i}", price=10, stock=stock, category="bench", is_active=True) for i in range(products)])
+        await db.commit()
+        ids = list((await db.execute(select(Product.id))).scalars())
+        await db.run_sync(lambda session: take_snapshot(session.connection()))
+        await db.commit()
+
+    reserve = {"update": _update_only, "ledger": reserve_stock, "append": _append_only}[variant]
+    sold = {pid: 0 for pid in ids}
+    counts = {"ok": 0, "rejected": 0, "locked": 0}
+
+    async def worker(n):
+        for i in range(n, orders, workers):
+            items = [SimpleNamespace(product_id=pid, quantity=1 + (i + pid) % 3) for pid in ids]
+            async with Session() as db:
+                try:
+                    await reserve(db, items)
+                    await db.commit()
+                except StockError:
+                    counts["rejected"] += 1
+                    continue
+                except OperationalError:
+                    await db.rollback()
+                    counts["locked"] += 1
+                    continue
+            counts["ok"] += 1
+            for item in items:
+                sold[item.product_id] += item.quantity
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(workers)))
+    elapsed = time.perf_counter() - started
+
+    async with Session() as db:
+        if variant == "append":
+            final = await _ledger_stock(db, ids)
+        else:
+            final = {p.id: p.stock for p in (await db.execute(select(Product))).scalars()}
+        movements = (await db.execute(select(func.count()).select_from(StockMovement))).scalar()
+    oversold = [pid for pid in ids if final[pid] < 0 or final[pid] != stock - sold[pid]]
+
+    print(f"{variant:<7s} {counts['ok'] / elapsed:8.1f} orders/s  ok={counts['ok']} rejected={counts['rejected']} "
+          f"locked={counts['locked']}  movements={movements}  {'OVERSOLD' if oversold else 'consistent'}")
+
+    if variant != "update":
+        before = await _time_stock_at(Session, ids)
+        async with Session() as db:
+            await db.run_sync(lambda session: take_snapshot(session.connection()))
+            await db.commit()
+        after = await _time_stock_at(Session, ids)
+        print(f"{'':<7s} 時間點庫存查詢 {before:.2f} ms（快照後 {after:.2f} ms）")
+    await engine.dispose()
+    return not oversold
+
+
+async def main(args):
+    ok = True
+    for variant in args.variants:
+        ok = await run(variant, args.workers, args.orders, args.stock, args.products) and ok
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--variants", default=",".join(VARIANTS))
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--stock", type=int, default=100000)
+    parser.add_argument("--products", type=int, default=5)
+    args = parser.parse_args()
+    args.variants = [name.strip() for name in args.variants.split(",") if name.strip()]
+    unknown = [name for name in args.variants if name not in VARIANTS]
+    if unknown:
+        parser.error(f"未知的寫法：{', '.join(unknown)}")
+    print(f"workers={args.workers} orders={args.orders} products={args.products}")
+    if not asyncio.run(main(args)):
+        print("FAIL: 庫存出現超賣或與成交數量不一致")
+        sys.exit(1)
+    print("OK: 無超賣")
@@ -0,0 +1,315 @@
+# API 負載測試套件：以 benchmarks.seed 建立固定資料，對真正的 FastAPI app 執行各端點與混合負載
+# 每個情境先單獨跑（取得吞吐量、p50/p95/p99 延遲與伺服器峰值 RSS），最後依權重混合同時執行
+# --mode asgi 在同一行程內以 ASGI 呼叫；--mode uvicorn 啟動 uvicorn 子行程走 localhost HTTP
+# 結果輸出為 JSON，可用 --compare 與先前的結果比較，退化超過 --threshold 時以非零狀態結束
+# 用法：python -m benchmarks.suite --mode both --duration 5 --concurrency 16 --out bench.json [--compare old.json]
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import httpx
+
+from benchmarks.seed import seed_database, PASSWORD, ADMIN_USERNAME, CATEGORIES
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# --- 情境：名稱 → (混合負載權重, 發出請求的函式) ---
+def _list_products(client, rng, ctx):
+    params = {"limit": 50, "category": rng.choice(CATEGORIES), "min_price": rng.randint(1, 200)}
+    return client.get("/products/", params=params, headers=ctx["admin"])
+
+def _search_products(client, rng, ctx):
+    return client.get("/products/", params={"search": f"Widget {rng.randint(1, 99)}", "limit": 20}, headers=ctx["admin"])
+
+def _create_order(client, rng, ctx):
+    items = [{"product_id": rng.randint(1, ctx["products"]), "quantity": rng.randint(1, 3)} for _ in range(rng.randint(1, 3))]
+    return client.post("/orders/", json={"customer_id": 0, "items": items}, headers=rng.choice(ctx["users"]))
+
+def _list_orders(client, rng, ctx):
+    return client.get("/orders/", params={"limit": 20}, headers=rng.choice(ctx["users"]))
+
+def _login(client, rng, ctx):
+    username = f"bench_user{rng.randint(1, ctx['user_count'])}"
+    return client.post("/auth/token", data={"username": username, "password": PASSWORD})
+
+def _export_orders(client, rng, ctx):
+    return client.get("/exports/orders", headers=ctx["admin"])
+
+def _daily_report(client, rng, ctx):
+    return client.get("/reports/daily", headers=ctx["admin"])
+
+SCENARIOS = {
+    "products.list": (30, _list_products),
+    "products.search": (15, _search_products),
+    "orders.create": (15, _create_order),
+    "orders.list": (25, _list_orders),
+    "auth.login": (5, _login),
+    "reports.daily": (8, _daily_report),
+    "exports.orders": (2, _export_orders),
+}
+
+
+# --- 伺服器行程的 RSS 取樣：Linux 讀 /proc，其他平台退回 ru_maxrss（僅限同一行程） ---
+class RssSampler:
+    def __init__(self, pid: int, interval: float = 0.02):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def rss(self):
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        if self.pid == os.getpid():
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        return 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start_rss = self.rss()
+        self.peak = self.start_rss
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(sorted_values, p: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors: int, elapsed: float):
+    ordered = sorted(latencies)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p95_ms": ms(percentile(ordered, 95)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1] if ordered else None),
+    }
+
+
+# --- 以固定併發數持續發送請求 duration 秒；names 有多個時依權重隨機挑選情境 ---
+async def run_phase(client, names, ctx, duration: float, concurrency: int, seed: int):
+    weights = [SCENARIOS[name][0] for name in names]
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    deadline = time.perf_counter() + duration
+
+    async def worker(n):
+        rng = random.Random(seed * 1000 + n)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0] if len(names) > 1 else names[0]
+            started = time.perf_counter()
+            try:
+                response = await SCENARIOS[name][1](client, rng, ctx)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies[name].append(time.perf_counter() - started)
+            else:
+                errors[name] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {name: summarize(latencies[name], errors[name], elapsed) for name in names}
+
+
+async def prepare_context(client, args):
+    async def login(username):
+        response = await client.post("/auth/token", data={"username": username, "password": PASSWORD})
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return {
+        "admin": await login(ADMIN_USERNAME),
+        "users": [await login(f"bench_user{i}") for i in range(1, args.users + 1)],
+        "user_count": args.users,
+        "products": args.products,
+    }
+
+
+async def run_suite(client, pid: int, args):
+    ctx = await prepare_context(client, args)
+    # 暖機：填滿連線池與快取，避免第一個情境吃到啟動成本
+    await run_phase(client, ["products.list", "orders.list"], ctx, 1.0, args.concurrency, args.seed)
+
+    results = {}
+    for name in args.scenarios:
+        with RssSampler(pid) as sampler:
+            stats = (await run_phase(client, [name], ctx, args.duration, args.concurrency, args.seed))[name]
+        stats["peak_rss_mb"] = round(sampler.peak / 2**20, 1)
+        stats["rss_growth_mb"] = round((sampler.peak - sampler.start_rss) / 2**20, 1)
+        results[name] = stats
+        print(f"  {name:18s} {stats['rps']:8.1f} req/s  p50 {stats['p50_ms']} ms  p95 {stats['p95_ms']} ms  "
+              f"p99 {stats['p99_ms']} ms  errors {stats['errors']}  peak RSS {stats['peak_rss_mb']} MB")
+
+    with RssSampler(pid) as sampler:
+        mixed = await run_phase(client, args.scenarios, ctx, args.duration, args.concurrency, args.seed)
+    total = sum(s["requests"] for s in mixed.values())
+    print(f"  {'mixed':18s} {total / args.duration:8.1f} req/s  peak RSS {sampler.peak / 2**20:.1f} MB")
+    return {"scenarios": results, "mixed": {"scenarios": mixed, "rps": round(total / args.duration, 1),
+                                            "peak_rss_mb": round(sampler.peak / 2**20, 1)}}
+
+
+async def run_asgi(args):
+    import main  # DATABASE_URL 已在 run() 設定，匯入時才會建立 engine
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            return await run_suite(client, os.getpid(), args)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run_uvicorn(args):
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT, env=os.environ.copy(),
+    )
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+            for _ in range(200):
+                try:
+                    if (await client.get("/")).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise SystemExit("uvicorn 未能啟動")
+            return await run_suite(client, server.pid, args)
+    finally:
+        server.terminate()
+        server.wait(10)
+
+
+# --- 與先前結果比較：吞吐量下降或 p95 上升超過門檻即視為退化 ---
+def compare(current, baseline, threshold: float):
+    regressions = []
+    for mode, result in current["modes"].items():
+        before = baseline.get("modes", {}).get(mode, {}).get("scenarios", {})
+        for name, stats in result["scenarios"].items():
+            old = before.get(name)
+            if not old:
+                continue
+            if old["rps"] and stats["rps"] < old["rps"] * (1 - threshold):
+                regressions.append(f"{mode} {name}: rps {old['rps']} → {stats['rps']}")
+            if old["p95_ms"] and stats["p95_ms"] and stats["p95_ms"] > old["p95_ms"] * (1 + threshold):
+                regressions.append(f"{mode} {name}: p95 {old['p95_ms']} ms → {stats['p95_ms']} ms")
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="erp-bench-")
+    db_path = args.db or os.path.join(workdir, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("JOB_RESULT_DIR", os.path.join(workdir, "jobs"))
+    os.environ.setdefault("SLOW_REQUEST_MS", "0")  # 壓測時不輸出慢請求 log
+    if not args.db or not os.path.exists(db_path):
+        elapsed = seed_database(os.environ["DATABASE_URL"], args.customers, args.products, args.orders,
+                                args.users, seed=args.seed)
+        print(f"seed：{db_path}（{elapsed:.1f}s）")
+
+    modes = ["asgi", "uvicorn"] if args.mode == "both" else [args.mode]
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "volumes": {"customers": args.customers, "products": args.products, "orders": args.orders},
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+        },
+        "modes": {},
+    }
+    for mode in modes:
+        print(f"[{mode}]")
+        runner = run_asgi if mode == "asgi" else run_uvicorn
+        report["modes"][mode] = asyncio.run(runner(args))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["asgi", "uvicorn", "both"], default="asgi")
+    parser.add_argument("--db", help="沿用既有的 seed 資料庫（不存在時建立）")
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=5.0, help="每個情境執行秒數")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="以逗號分隔的情境名稱")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="結果 JSON 輸出路徑")
+    parser.add_argument("--compare", help="作為比較基準的先前結果 JSON")
+    parser.add_argument("--threshold", type=float, default=0.15, help="視為退化的相對變化比例")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知的情境：{', '.join(unknown)}")
+
+    report = run(args)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"結果已寫入 {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("OK: 未發現超過門檻的退化")
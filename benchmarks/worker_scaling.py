@@ -0,0 +1,128 @@
+# 多 worker 擴展性：以 gunicorn.conf.py 依序啟動 1、2、4… 個 worker，對同一份 seed 資料庫（SQLite WAL）
+# 以多個壓測行程發送讀取為主的負載，比較吞吐量與理想線性擴展的比例
+# 壓測行程與伺服器在同一台機器上會互相搶 CPU：--clients 應讓壓測端不成為瓶頸，結果以核心數足夠的機器為準
+# SQLite 同一時間只有一個寫入者，含 orders.create 的負載不會隨 worker 線性成長，預設只用讀取情境
+# 用法：python -m benchmarks.worker_scaling --workers 1,2,4 --duration 10 --concurrency 32 --clients 4
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import httpx
+
+from benchmarks.seed import seed_database
+from benchmarks.suite import SCENARIOS, REPO_ROOT, run_phase, prepare_context, _free_port
+
+DEFAULT_SCENARIOS = "products.list,products.search,orders.list,reports.daily"
+
+
+async def _client_phase(base_url, names, ctx, duration, concurrency, seed):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        return await run_phase(client, names, ctx, duration, concurrency, seed)
+
+
+def client_process(base_url, names, ctx, duration, concurrency, seed):
+    return asyncio.run(_client_phase(base_url, names, ctx, duration, concurrency, seed))
+
+
+# 等到每個 worker 都回報就緒（以 /health/ready 回傳的 pid 區分；每次探測都開新連線才會分散到不同 worker）
+def wait_ready(base_url: str, workers: int, timeout: float = 60):
+    pids = set()
+    deadline = time.monotonic() + timeout
+    with httpx.Client(base_url=base_url, timeout=5, headers={"Connection": "close"}) as client:
+        while time.monotonic() < deadline:
+            try:
+                response = client.get("/health/ready")
+                if response.status_code == 200:
+                    pids.add(response.json()["pid"])
+                    if len(pids) >= workers:
+                        return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.05)
+    raise SystemExit(f"{workers} 個 worker 未在 {timeout}s 內就緒（已就緒 {len(pids)}）")
+
+
+def run_workers(args, workers: int):
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), "BIND": f"127.0.0.1:{port}"}
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+                              cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(base_url, workers)
+        ctx = asyncio.run(_context(base_url, args))
+        per_client = max(1, args.concurrency // args.clients)
+        with ProcessPoolExecutor(args.clients) as pool:
+            # 暖機：填滿各 worker 的連線池與快取
+            list(pool.map(client_process, *zip(*[(base_url, args.scenarios, ctx, 1.0, per_client, n)
+                                                   for n in range(args.clients)])))
+            phases = list(pool.map(client_process, *zip(*[(base_url, args.scenarios, ctx, args.duration,
+                                                            per_client, args.seed + n) for n in range(args.clients)])))
+    finally:
+        server.terminate()
+        server.wait(30)
+
+    requests = sum(stats["requests"] for phase in phases for stats in phase.values())
+    errors = sum(stats["errors"] for phase in phases for stats in phase.values())
+    p95 = max(stats["p95_ms"] or 0 for phase in phases for stats in phase.values())
+    return {"rps": requests / args.duration, "errors": errors, "p95_ms": p95}
+
+
+async def _context(base_url, args):
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        return await prepare_context(client, SimpleNamespace(users=args.users, products=args.products))
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="erp-scaling-")
+    db_path = args.db or os.path.join(workdir, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("JOB_WORKERS", "0")
+    os.environ.setdefault("JOB_RESULT_DIR", os.path.join(workdir, "jobs"))
+    os.environ.setdefault("SLOW_REQUEST_MS", "0")
+    if not args.db or not os.path.exists(db_path):
+        elapsed = seed_database(os.environ["DATABASE_URL"], args.customers, args.products, args.orders,
+                                args.users, seed=args.seed)
+        print(f"seed：{db_path}（{elapsed:.1f}s）")
+
+    print(f"cpu_count={os.cpu_count()} clients={args.clients} concurrency={args.concurrency} "
+          f"scenarios={','.join(args.scenarios)}")
+    baseline = None
+    for workers in args.workers:
+        result = run_workers(args, workers)
+        baseline = baseline or result["rps"]
+        speedup = result["rps"] / baseline
+        print(f"workers={workers:<3d} {result['rps']:8.1f} req/s  x{speedup:.2f}  "
+              f"efficiency {speedup / (workers / args.workers[0]):5.0%}  worst-client p95 {result['p95_ms']} ms  "
+              f"errors {result['errors']}")
+
+
+if __name__ == "__main__":
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default=",".join(str(2 ** n) for n in range(cpus.bit_length()) if 2 ** n <= cpus),
+                        help="以逗號分隔的 worker 數，預設為 1、2、4… 到 CPU 核心數")
+    parser.add_argument("--db", help="沿用既有的 seed 資料庫（不存在時建立）")
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=32, help="所有壓測行程合計的併發數")
+    parser.add_argument("--clients", type=int, default=max(1, cpus // 2), help="壓測行程數")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    args.workers = [int(n) for n in args.workers.split(",")]
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知的情境：{', '.join(unknown)}")
+    run(args)
@@ -1,11 +1,124 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
-DATABASE_URL = "sqlite:///./erp.db"  
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./erp.db")
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# 同步 URL 對應的非同步驅動
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+# --- SQLite 連線設定：WAL、busy timeout、mmap 與 page cache ---
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000),
+    "mmap_size": _env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+    "cache_size": -_env_int("SQLITE_CACHE_SIZE_KB", 64 * 1024),  # 負值代表 KiB
+    "temp_store": "MEMORY",
+}
+
+
+def _apply_sqlite_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+# 讀取來源的連線池可另外以 DB_READ_POOL_SIZE / DB_READ_MAX_OVERFLOW 設定，未設定時與主資料庫相同
+def _pool_sizes(read_only: bool = False):
+    size, overflow = _env_int("DB_POOL_SIZE", 10), _env_int("DB_MAX_OVERFLOW", 20)
+    if read_only:
+        size, overflow = _env_int("DB_READ_POOL_SIZE", size), _env_int("DB_READ_MAX_OVERFLOW", overflow)
+    return {"pool_size": size, "max_overflow": overflow}
+
+
+def _pool_options(read_only: bool = False):
+    return {
+        **_pool_sizes(read_only),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+    }
+
+
+# 唯讀連線：其餘 PRAGMA 與主連線相同，query_only 放在最後套用
+SQLITE_READ_PRAGMAS = {**SQLITE_PRAGMAS, "query_only": "ON"}
+
+
+def _listen_sqlite_pragmas(engine, pragmas=SQLITE_PRAGMAS):
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        _apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+
+# --- 依 DATABASE_URL 建立 engine：SQLite 套用 PRAGMA，其餘資料庫設定連線池 ---
+def create_db_engine(url: str = DATABASE_URL):
+    if make_url(url).get_backend_name() == "sqlite":
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+        _listen_sqlite_pragmas(engine)
+        return engine
+    return create_engine(url, **_pool_options())
+
+
+# --- 非同步 engine：SQLite 走 aiosqlite、PostgreSQL 走 asyncpg，設定與同步 engine 相同 ---
+def async_database_url(url: str = DATABASE_URL):
+    parsed = make_url(url)
+    return parsed.set(drivername=ASYNC_DRIVERS.get(parsed.get_backend_name(), parsed.drivername))
+
+
+def create_async_db_engine(url: str = DATABASE_URL, read_only: bool = False):
+    async_url = async_database_url(url)
+    if async_url.get_backend_name() == "sqlite":
+        # aiosqlite 預設為 NullPool，每次請求都重新連線（新執行緒 + PRAGMA），改用連線池
+        engine = create_async_engine(async_url, poolclass=AsyncAdaptedQueuePool, **_pool_sizes(read_only))
+        _listen_sqlite_pragmas(engine.sync_engine, SQLITE_READ_PRAGMAS if read_only else SQLITE_PRAGMAS)
+        return engine
+    return create_async_engine(async_url, **_pool_options(read_only))
+
+
+# --- 讀取用的資料庫：列表與匯出走這裡，寫入維持主資料庫 ---
+# PostgreSQL 以 READ_DATABASE_URL 指定 replica；SQLite 未指定時對同一個檔案另開 query_only 連線池
+# （記憶體資料庫無法另開連線）；DB_READ_ROUTING=false 或沒有可用的讀取來源時全部走主資料庫
+def read_database_url(url: str = DATABASE_URL):
+    if not _env_bool("DB_READ_ROUTING", True):
+        return None
+    if os.getenv("READ_DATABASE_URL"):
+        return os.getenv("READ_DATABASE_URL")
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:"):
+        return url
+    return None
+
+
+# 同步 engine 保留給背景腳本與建表使用
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+READ_DATABASE_URL = read_database_url()
+async_read_engine = create_async_db_engine(READ_DATABASE_URL, read_only=True) if READ_DATABASE_URL else async_engine
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
+
+
+# --- 共用的非同步 DB session 依賴 ---
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,38 @@
+# gunicorn 正式環境設定，用法：gunicorn -c gunicorn.conf.py main:app
+# 每個 worker 是獨立的 uvicorn 行程：商品目錄快取、token 快取、/metrics 各自獨立（shared-nothing），
+# 目錄快取以資料庫版本為 key，其他 worker 寫入後不會讀到舊資料
+# 平滑重啟：kill -HUP <master pid> 先套用 migration，再逐一以新程式碼的 worker 取代舊 worker
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '10000')}")
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))   # 關閉時等待進行中的請求與背景工作收尾
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))           # 0 表示不定期重啟 worker
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "0"))
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+# migration 在子行程執行：master 不匯入應用程式模組，平滑重啟時 worker 才會載入新版程式碼
+def _migrate(server):
+    subprocess.run([sys.executable, "-m", "utils.migrations", "upgrade"], cwd=ROOT, check=True)
+    server.log.info("schema migrations applied")
+
+
+# 在 fork 任何 worker 之前執行一次；失敗時不啟動
+def on_starting(server):
+    _migrate(server)
+
+
+def on_reload(server):
+    try:
+        _migrate(server)
+    except subprocess.CalledProcessError:
+        # 新 worker 啟動時仍會再試一次，失敗時 /health/ready 回 503
+        server.log.exception("schema migration failed during reload")
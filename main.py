@@ -1,18 +1,44 @@
 # main.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from routers.customers import router as customer_router
 from routers.auth import router as auth_router
 from routers.products import router as product_router
 from routers.order import router as order_router
 from routers.exports import router as export_router
-from databases import Base, engine  # 自動建表需要
-import models  # 確保所有 model 被載入
+from routers.reports import router as report_router
+from routers.imports import router as import_router
+from routers.jobs import router as job_router
+from routers.inventory import router as inventory_router
+from routers.health import router as health_router, set_ready
+from databases import engine, async_engine, async_read_engine
+from utils.migrations import run_migrations
+from utils.search import detect_search_index
+from utils.jobs import start_workers
+import utils.changes  # noqa: F401  註冊 row_version / tombstone 的 flush 事件
+from utils.metrics import MetricsMiddleware, instrument_engine, registry
+from utils.read_routing import ReadYourWritesMiddleware
 
-# 建立資料表（若尚未建立）
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 套用尚未執行的 schema migration（取代原本 import 時的 create_all）
+    # 以跨行程鎖保護；gunicorn 由 master 在 fork worker 前先執行過，這裡通常只確認版本
+    run_migrations(engine)
+    detect_search_index(engine)
+    # 背景工作 worker（JOB_WORKERS=0 時改由 python -m utils.jobs worker 執行）
+    stop_workers = start_workers()
+    set_ready(True)
+    yield
+    set_ready(False)
+    await stop_workers()
+    # 關閉非同步連線池（aiosqlite 每條連線各有一個執行緒）
+    await async_engine.dispose()
+    await async_read_engine.dispose()
 
 app = FastAPI(
+    lifespan=lifespan,
     title="簡易 ERP 系統 API",
     description="支援顧客、商品、訂單、管理員與 JWT 驗證的 ERP 系統",
     version="1.0.0"
@@ -27,15 +53,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- 效能量測：每個請求的耗時與 SQL 用量（Server-Timing 標頭、/metrics、慢請求 log） ---
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+if async_read_engine is not async_engine:
+    instrument_engine(async_read_engine.sync_engine)
+app.add_middleware(MetricsMiddleware)
+
+# --- 讀寫分流：列表、報表與匯出讀 async_read_engine；寫入後短時間內改讀主資料庫 ---
+app.add_middleware(ReadYourWritesMiddleware)
+
 # --- 路由導入 ---
 app.include_router(auth_router)            # /auth → 使用者註冊、登入
 app.include_router(customer_router)        # /customer → 顧客資料相關 
 app.include_router(export_router)          # /export  →  報表
+app.include_router(import_router)          # /imports → 批次匯入商品、顧客
+app.include_router(job_router)             # /jobs → 背景工作進度與結果下載
 app.include_router(product_router)         # /products → 商品查詢
 app.include_router(order_router)           # /order → 訂單操作
+app.include_router(report_router)          # /reports → 營收與庫存統計
+app.include_router(inventory_router)       # /inventory → 庫存異動帳與歷史庫存
+app.include_router(health_router)          # /health → 各 worker 的存活與就緒檢查
 
 # --- 健康檢查 ---
 @app.get("/")
 def root():
     return {"message": "ERP 系統 API 正常運作中"}
 
+# --- Prometheus 文字格式指標 ---
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,5 +1,5 @@
 from databases import Base
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Float
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, ForeignKey, DateTime, Date, Float, Index, Text, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -26,6 +26,8 @@ class Customer(Base):
     email = Column(String, unique=True)
     phone = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
+    updated_at = Column(DateTime, nullable=True)
+    row_version = Column(BigInteger, nullable=False, default=0, index=True)
     orders = relationship("Order", back_populates="customer")
 
 class Product(Base):
@@ -36,6 +38,14 @@ class Product(Base):
     stock = Column(Integer)
     category = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
+    updated_at = Column(DateTime, nullable=True)
+    row_version = Column(BigInteger, nullable=False, default=0, index=True)
+
+    # 商品列表：啟用狀態 + 分類 + 價格區間；未指定分類時走 (is_active, price)
+    __table_args__ = (
+        Index("ix_products_active_category_price", "is_active", "category", "price"),
+        Index("ix_products_active_price", "is_active", "price"),
+    )
 
 class Order(Base):
     __tablename__ = "orders"
@@ -44,17 +54,190 @@ class Order(Base):
     order_date = Column(DateTime, default=datetime.utcnow)
     total_amount = Column(Float)
     payment_status = Column(String, default="pending")
+    updated_at = Column(DateTime, nullable=True)
+    row_version = Column(BigInteger, nullable=False, default=0, index=True)
 
     customer = relationship("Customer", back_populates="orders")
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
 
+    # 訂單列表以 (order_date, id) keyset 分頁；顧客 / 付款狀態篩選各自搭配日期排序
+    # SQLite 使用 AUTOINCREMENT：id 不會重複配號，封存後的訂單 id 不會被新訂單再用到
+    __table_args__ = (
+        Index("ix_orders_order_date_id", "order_date", "id"),
+        Index("ix_orders_customer_date", "customer_id", "order_date", "id"),
+        Index("ix_orders_status_date", "payment_status", "order_date", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
 class OrderItem(Base):
     __tablename__ = "order_items"
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
-    product_id = Column(Integer, ForeignKey("products.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
     quantity = Column(Integer)
     unit_price = Column(Float)
 
     order = relationship("Order", back_populates="items")
     product = relationship("Product")
+
+    __table_args__ = ({"sqlite_autoincrement": True},)
+
+# --- 訂單封存：已結案（已付款 / 已取消）且超過 ORDER_ARCHIVE_DAYS 的訂單由 utils.archive 分批搬入 ---
+# 欄位與 orders / order_items 相同並保留原 id，不設外鍵；一般資料表只留近期與未結案的訂單
+class ArchivedOrder(Base):
+    __tablename__ = "orders_archive"
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer, nullable=True)
+    order_date = Column(DateTime)
+    total_amount = Column(Float)
+    payment_status = Column(String)
+    updated_at = Column(DateTime, nullable=True)
+    row_version = Column(BigInteger, nullable=False, default=0, index=True)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    # 與 orders 相同的 keyset 分頁索引，查詢區間涵蓋封存資料時各自依索引取一頁再合併
+    __table_args__ = (
+        Index("ix_orders_archive_order_date_id", "order_date", "id"),
+        Index("ix_orders_archive_customer_date", "customer_id", "order_date", "id"),
+        Index("ix_orders_archive_status_date", "payment_status", "order_date", "id"),
+    )
+
+class ArchivedOrderItem(Base):
+    __tablename__ = "order_items_archive"
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, nullable=False, index=True)
+    product_id = Column(Integer)
+    quantity = Column(Integer)
+    unit_price = Column(Float)
+
+# --- 報表彙總表：由訂單路由在同一交易內增量維護，可用 utils.reports 重建 ---
+# 只統計未取消的訂單；paid_revenue 為其中已付款的金額
+class DailySales(Base):
+    __tablename__ = "daily_sales"
+    day = Column(Date, primary_key=True)
+    order_count = Column(Integer, default=0, nullable=False)
+    items_sold = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0, nullable=False)
+    paid_revenue = Column(Float, default=0, nullable=False)
+
+class ProductSales(Base):
+    __tablename__ = "product_sales"
+    product_id = Column(Integer, primary_key=True)  # 不設外鍵：商品刪除後仍保留銷售紀錄
+    order_count = Column(Integer, default=0, nullable=False)
+    units_sold = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0, nullable=False)
+
+class CustomerSales(Base):
+    __tablename__ = "customer_sales"
+    customer_id = Column(Integer, primary_key=True)
+    order_count = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0, nullable=False)
+    paid_revenue = Column(Float, default=0, nullable=False)
+    last_order_at = Column(DateTime, nullable=True)
+
+    # 顧客列表依消費排序、篩選（例如消費金額前 100 名）：每個排序欄位一個 (欄位, customer_id) 索引，可反向掃描
+    __table_args__ = (
+        Index("ix_customer_sales_order_count", "order_count", "customer_id"),
+        Index("ix_customer_sales_revenue", "revenue", "customer_id"),
+        Index("ix_customer_sales_paid_revenue", "paid_revenue", "customer_id"),
+        Index("ix_customer_sales_last_order_at", "last_order_at", "customer_id"),
+    )
+
+# --- 背景工作：匯出與報表重建排入佇列，由 worker 領取執行，結果檔寫在 JOB_RESULT_DIR ---
+# status：queued → running → done / failed；結果檔過期後為 expired
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(String(32), primary_key=True)
+    type = Column(String, nullable=False)
+    params = Column(Text, nullable=False, default="{}")
+    cache_key = Column(String(64), nullable=False)
+    status = Column(String, nullable=False, default="queued")
+    progress = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=True)
+    result_path = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+    worker = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True)
+
+    # worker 依 (status, created_at) 領取；重複請求依 cache_key 找可重用的結果
+    __table_args__ = (
+        Index("ix_jobs_status_created", "status", "created_at"),
+        Index("ix_jobs_cache_key", "cache_key"),
+    )
+
+# --- 異動追蹤：全域遞增的版本號，每個寫入交易取一個；刪除的資料留下 tombstone ---
+# SQLite 的版本號來自 change_sequence 計數器；PostgreSQL 以交易 id 配號，value 為位移（見 utils.changes）
+# Customer / Product / Order 的 row_version 與 updated_at 由 utils.changes 在 flush 前寫入
+class ChangeSequence(Base):
+    __tablename__ = "change_sequence"
+    id = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class DeletedRow(Base):
+    __tablename__ = "deleted_rows"
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    row_version = Column(BigInteger, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_deleted_rows_table_version", "table_name", "row_version"),
+    )
+
+# --- 庫存異動帳：只新增不修改，銷售、取消、改單、調整、匯入各留一筆（正數入庫、負數出庫） ---
+# Product.stock 仍是目前庫存（預留時以條件式 UPDATE 防止超賣），異動與庫存在同一交易內寫入
+class StockMovement(Base):
+    __tablename__ = "stock_movements"
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=False)  # 不設外鍵：商品刪除後仍保留異動紀錄
+    quantity = Column(Integer, nullable=False)
+    reason = Column(String, nullable=False)
+    order_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    # 單一商品的異動依 id 範圍查詢；時間點先換算成異動 id 再查
+    __table_args__ = (
+        Index("ix_stock_movements_product_id", "product_id", "id"),
+        Index("ix_stock_movements_created_at", "created_at", "id"),
+    )
+
+# 快照：各商品累計到 last_movement_id 為止的庫存，同一次快照的列共用 last_movement_id
+# 只為上次快照後有異動的商品寫入新列；歷史庫存 = 最近一次快照 + 其後的少量異動
+class StockSnapshot(Base):
+    __tablename__ = "stock_snapshots"
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=False)
+    stock = Column(Integer, nullable=False)
+    last_movement_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_stock_snapshots_product_movement", "product_id", "last_movement_id"),
+        Index("ix_stock_snapshots_movement", "last_movement_id"),
+    )
+
+# --- 冪等鍵：用戶端以 Idempotency-Key 標頭重試訂單異動時，直接回傳第一次執行的結果 ---
+# status：in_progress（執行中，locked_until 前其他請求等待）→ completed（已存回應，expires_at 後清除）
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    id = Column(Integer, primary_key=True)
+    scope = Column(String, nullable=False)              # 使用者 id，不同使用者的 key 互不影響
+    key = Column(String(255), nullable=False)
+    fingerprint = Column(String(64), nullable=False)    # method + path + body 的 SHA-256
+    status = Column(String, nullable=False, default="in_progress")
+    status_code = Column(Integer, nullable=True)
+    media_type = Column(String, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ux_idempotency_keys_scope_key", "scope", "key", unique=True),
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
@@ -1,16 +1,20 @@
 from dotenv import load_dotenv
 from fastapi import APIRouter, Depends, HTTPException
+import hashlib
 import os
-from passlib.context import CryptContext
+import time
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from databases import SessionLocal
+from databases import get_db
 from typing import Annotated
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import Users, Customer
 from jose import jwt, JWTError
 from datetime import timedelta, datetime, timezone
 from starlette import status
 from schemas import UserCreate, Token
+from utils.passwords import hash_password, verify_password
+from utils.cache import TTLCache
 
 load_dotenv()
 
@@ -18,25 +22,24 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))     # 0 表示不快取
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
 
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
 
-def authenticate_user(username: str, password: str, db):
-    user = db.query(Users).filter(Users.username == username).first()
+async def authenticate_user(username: str, password: str, db: AsyncSession):
+    user = (await db.execute(select(Users).where(Users.username == username))).scalars().first()
     if not user:
         return False
-    if not bcrypt_context.verify(password, user.hashed_password):
+    verified, new_hash = await verify_password(password, user.hashed_password)
+    if not verified:
         return False
+    if new_hash:
+        # 舊雜湊的成本係數低於目前設定，登入成功時順便升級
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
 def create_access_token(username: str, user_id: int, role: str, customer_id: int | None, expires_delta: timedelta):
@@ -50,31 +53,44 @@ def create_access_token(username: str, user_id: int, role: str, customer_id: int
     encode.update({"exp": expires})
     return jwt.encode(encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
+# --- 已驗證 token 的使用者資料快取：以 token 的 SHA-256 為 key，存活時間不超過 token 的 exp ---
+# 只快取驗證成功的 token；同一請求內的多個 dependency 由 FastAPI 的 dependency 快取共用同一次結果
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+def _decode_token(token: str):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        user_id: int = payload.get("id")
-        user_role: str = payload.get("role")
-        customer_id: int | None = payload.get("customer_id")
-        if username is None or user_id is None:
-            raise HTTPException(status_code=401, detail="使用者驗證失敗")
-        return {
-            "username": username,
-            "id": user_id,
-            "user_role": user_role,
-            "customer_id": customer_id
-        }
     except JWTError:
         raise HTTPException(status_code=403, detail="Token 驗證失敗")
+    username: str = payload.get("sub")
+    user_id: int = payload.get("id")
+    user_role: str = payload.get("role")
+    customer_id: int | None = payload.get("customer_id")
+    if username is None or user_id is None:
+        raise HTTPException(status_code=401, detail="使用者驗證失敗")
+    user = {
+        "username": username,
+        "id": user_id,
+        "user_role": user_role,
+        "customer_id": customer_id
+    }
+    return user, payload.get("exp")
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
+    key = hashlib.sha256(token.encode()).digest()
+    user = token_cache.get(key)
+    if user is None:
+        user, exp = _decode_token(token)
+        token_cache.set(key, user, ttl=exp - time.time() if exp is not None else None)
+    return dict(user)
 
 @router.post("/", status_code=201)
 async def create_user(db: db_dependency, create_user_request: UserCreate):
-    existing_user = db.query(Users).filter(Users.email == create_user_request.email).first()
+    existing_user = (await db.execute(select(Users).where(Users.email == create_user_request.email))).scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="此 email 已被註冊")
 
-    customer = db.query(Customer).filter(Customer.email == create_user_request.email).first()
+    customer = (await db.execute(select(Customer).where(Customer.email == create_user_request.email))).scalars().first()
 
     create_user_model = Users(
         email=create_user_request.email,
@@ -82,22 +98,21 @@ async def create_user(db: db_dependency, create_user_request: UserCreate):
         first_name=create_user_request.first_name,
         last_name=create_user_request.last_name,
         role=create_user_request.role,
-        hashed_password=bcrypt_context.hash(create_user_request.password),
+        hashed_password=await hash_password(create_user_request.password),
         is_active=True,
         customer_id=customer.id if customer else None
     )
     db.add(create_user_model)
-    db.commit()
-    db.refresh(create_user_model)
+    await db.commit()
     return {"message": "帳號建立成功", "username": create_user_model.username}
 
 @router.post("/register_with_customer", status_code=201)
-def register_with_customer(user_data: UserCreate, db: db_dependency):
-    existing_user = db.query(Users).filter(Users.email == user_data.email).first()
+async def register_with_customer(user_data: UserCreate, db: db_dependency):
+    existing_user = (await db.execute(select(Users).where(Users.email == user_data.email))).scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="此 email 已被註冊")
 
-    existing_customer = db.query(Customer).filter(Customer.email == user_data.email).first()
+    existing_customer = (await db.execute(select(Customer).where(Customer.email == user_data.email))).scalars().first()
     if not existing_customer:
         new_customer = Customer(
             name=f"{user_data.first_name} {user_data.last_name}",
@@ -106,8 +121,7 @@ def register_with_customer(user_data: UserCreate, db: db_dependency):
             is_active=True
         )
         db.add(new_customer)
-        db.commit()
-        db.refresh(new_customer)
+        await db.commit()
         customer_id = new_customer.id
     else:
         customer_id = existing_customer.id
@@ -118,13 +132,12 @@ def register_with_customer(user_data: UserCreate, db: db_dependency):
         first_name=user_data.first_name,
         last_name=user_data.last_name,
         role=user_data.role,
-        hashed_password=bcrypt_context.hash(user_data.password),
+        hashed_password=await hash_password(user_data.password),
         is_active=True,
         customer_id=customer_id
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     return {"message": "帳號與顧客建立成功", "username": new_user.username}
 
 @router.post("/token", response_model=Token)
@@ -132,7 +145,7 @@ async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
     db: db_dependency
 ):
-    user = authenticate_user(form_data.username, form_data.password, db)
+    user = await authenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(status_code=401, detail="使用者驗證失敗")
     token = create_access_token(user.username, user.id, user.role, user.customer_id, timedelta(minutes=20))
@@ -1,33 +1,86 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
-from databases import SessionLocal
-from models import Customer
+from datetime import datetime
+from databases import get_db
+from models import Customer, CustomerSales
 from schemas import CustomerCreate, CustomerUpdate
 from routers.auth import get_current_user
 from utils.permissions import roles_required
+from utils.search import use_search_index, search_subquery, rank_window
+from utils.read_routing import get_read_db
 
 router = APIRouter(prefix="/customers", tags=["customers"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# --- 訂單彙總：讀 customer_sales（下單、付款、取消、修改訂單時在同一交易內更新），不在請求時加總訂單 ---
+# 重建：python -m utils.reports rebuild
+SUMMARY_COLUMNS = (CustomerSales.order_count, CustomerSales.revenue, CustomerSales.paid_revenue,
+                   CustomerSales.last_order_at)
+EMPTY_SUMMARY = {"order_count": 0, "revenue": 0.0, "paid_revenue": 0.0, "last_order_at": None}
+
+
+# 依彙總排序、篩選時用 inner join（每位顧客都有彙總列），SQLite 才能從 customer_sales 的索引開始掃描
+def customer_with_summary(inner: bool = False):
+    return select(*Customer.__table__.columns, *SUMMARY_COLUMNS).join(
+        CustomerSales, CustomerSales.customer_id == Customer.id, isouter=not inner)
+
+
+def _with_summary(row):
+    customer = {column.name: row[column.name] for column in Customer.__table__.columns}
+    customer["summary"] = {column.name: row[column.name] for column in SUMMARY_COLUMNS} \
+        if row["order_count"] is not None else dict(EMPTY_SUMMARY)
+    return customer
 
 # --- 查詢所有顧客（限 admin） ---
+# sort / 篩選條件只用 customer_sales 的欄位，走 (欄位, customer_id) 索引，例如 sort=revenue&limit=100 為消費前 100 名
 @router.get("/", dependencies=[Depends(roles_required("admin"))])
-def list_customers(db: Session = Depends(get_db), search: Optional[str] = Query(None)):
-    query = db.query(Customer)
-    if search:
-        query = query.filter(Customer.name.contains(search))
-    return query.all()
+async def list_customers(
+    db: AsyncSession = Depends(get_read_db),
+    search: Optional[str] = Query(None, description="顧客名稱或 Email 關鍵字"),
+    sort: Optional[str] = Query(None, pattern="^(order_count|revenue|paid_revenue|last_order_at)$",
+                                description="依訂單彙總排序"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="排序方向"),
+    min_orders: Optional[int] = Query(None, ge=0, description="訂單數下限（不含已取消）"),
+    min_revenue: Optional[float] = Query(None, ge=0, description="消費金額下限"),
+    last_order_from: Optional[datetime] = Query(None, description="最近下單時間起（含）"),
+    last_order_to: Optional[datetime] = Query(None, description="最近下單時間迄（含）"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="回傳筆數上限"),
+    offset: int = Query(0, ge=0, description="略過筆數")
+):
+    by_summary = sort or min_orders is not None or min_revenue is not None or last_order_from or last_order_to
+    query = customer_with_summary(inner=bool(by_summary))
+    if search and use_search_index(db, search):
+        matches = search_subquery("customers", search, rank_window(limit, offset, bool(by_summary)))
+        query = query.join(matches, matches.c.id == Customer.id)
+        if not sort:
+            query = query.order_by(matches.c.rank, Customer.id)
+    elif search:
+        query = query.where(or_(Customer.name.contains(search), Customer.email.contains(search)))
+    if min_orders is not None:
+        query = query.where(CustomerSales.order_count >= min_orders)
+    if min_revenue is not None:
+        query = query.where(CustomerSales.revenue >= min_revenue)
+    if last_order_from:
+        query = query.where(CustomerSales.last_order_at >= last_order_from)
+    if last_order_to:
+        query = query.where(CustomerSales.last_order_at <= last_order_to)
+    if sort:
+        column = getattr(CustomerSales, sort)
+        if order == "desc":
+            query = query.order_by(column.desc(), CustomerSales.customer_id.desc())
+        else:
+            query = query.order_by(column, CustomerSales.customer_id)
+    if offset:
+        query = query.offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return [_with_summary(row) for row in (await db.execute(query)).mappings()]
 
 # --- 新增顧客（限 admin） ---
 @router.post("/", dependencies=[Depends(roles_required("admin"))])
-def create_customer(new_customer: CustomerCreate, db: Session = Depends(get_db)):
-    existing = db.query(Customer).filter(Customer.email == new_customer.email).first()
+async def create_customer(new_customer: CustomerCreate, db: AsyncSession = Depends(get_db)):
+    existing = (await db.execute(select(Customer).where(Customer.email == new_customer.email))).scalars().first()
     if existing:
         raise HTTPException(status_code=400, detail="此 Email 已存在，無法新增")
     customer = Customer(
@@ -37,60 +90,60 @@ def create_customer(new_customer: CustomerCreate, db: Session = Depends(get_db))
         is_active=True
     )
     db.add(customer)
-    db.commit()
-    db.refresh(customer)
+    await db.commit()
+    await db.refresh(customer)
     return customer
 
 # --- 更新顧客（限 admin） ---
 @router.put("/{customer_id}", dependencies=[Depends(roles_required("admin"))])
-def update_customer(customer_id: int, update_data: CustomerUpdate, db: Session = Depends(get_db)):
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+async def update_customer(customer_id: int, update_data: CustomerUpdate, db: AsyncSession = Depends(get_db)):
+    customer = await db.get(Customer, customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="查無此顧客")
     for field, value in update_data.dict(exclude_unset=True).items():
         setattr(customer, field, value)
-    db.commit()
-    db.refresh(customer)
+    await db.commit()
+    await db.refresh(customer)
     return customer
 
 # --- 刪除顧客（限 admin） ---
 @router.delete("/{customer_id}", dependencies=[Depends(roles_required("admin"))])
-def delete_customer(customer_id: int, confirm: bool = Query(False), db: Session = Depends(get_db)):
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+async def delete_customer(customer_id: int, confirm: bool = Query(False), db: AsyncSession = Depends(get_db)):
+    customer = await db.get(Customer, customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="找不到此客戶")
     if not confirm:
         raise HTTPException(status_code=400, detail="請加上 confirm=true 才能執行刪除")
-    db.delete(customer)
-    db.commit()
+    await db.delete(customer)
+    await db.commit()
     return {"message": f"客戶 ID {customer_id} 已刪除"}
 
 # --- 加入黑名單（限 admin） ---
 @router.patch("/{customer_id}/blacklist", dependencies=[Depends(roles_required("admin"))])
-def blacklist_customer(customer_id: int, db: Session = Depends(get_db)):
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+async def blacklist_customer(customer_id: int, db: AsyncSession = Depends(get_db)):
+    customer = await db.get(Customer, customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="找不到此顧客")
     customer.is_active = False
-    db.commit()
+    await db.commit()
     return {"message": f"客戶 ID {customer_id} 已加入黑名單"}
 
 # --- 顧客查詢自己資料 ---
 @router.get("/me")
-def get_my_info(db: Session = Depends(get_db), user: dict = Depends(get_current_user)):
+async def get_my_info(db: AsyncSession = Depends(get_read_db), user: dict = Depends(get_current_user)):
     if not user["customer_id"]:
         raise HTTPException(status_code=400, detail="尚未綁定顧客資料")
-    customer = db.query(Customer).filter(Customer.id == user["customer_id"]).first()
-    if not customer:
+    row = (await db.execute(customer_with_summary().where(Customer.id == user["customer_id"]))).mappings().first()
+    if not row:
         raise HTTPException(status_code=404, detail="找不到對應顧客")
-    return customer
+    return _with_summary(row)
 
 # --- 顧客更新自己資料（僅可改 name 與 phone） ---
 @router.put("/me")
-def update_my_info(update_data: CustomerUpdate, db: Session = Depends(get_db), user: dict = Depends(get_current_user)):
+async def update_my_info(update_data: CustomerUpdate, db: AsyncSession = Depends(get_db), user: dict = Depends(get_current_user)):
     if not user["customer_id"]:
         raise HTTPException(status_code=400, detail="尚未綁定顧客資料")
-    customer = db.query(Customer).filter(Customer.id == user["customer_id"]).first()
+    customer = await db.get(Customer, user["customer_id"])
     if not customer:
         raise HTTPException(status_code=404, detail="找不到顧客資料")
     if not customer.is_active:
@@ -105,6 +158,6 @@ def update_my_info(update_data: CustomerUpdate, db: Session = Depends(get_db), u
     for field, value in updates.items():
         setattr(customer, field, value)
 
-    db.commit()
-    db.refresh(customer)
+    await db.commit()
+    await db.refresh(customer)
     return customer
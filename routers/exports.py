@@ -1,66 +1,209 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from databases import SessionLocal
-from typing import Annotated
-from models import Customer, Order, Product
-from fastapi.responses import StreamingResponse
-from io import StringIO
-import csv
-from utils.permissions import roles_required 
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select, union_all, literal, null, cast
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from datetime import datetime
+from databases import get_db
+from models import Customer, Order, OrderItem, Product, DeletedRow, ArchivedOrder, ArchivedOrderItem
+from fastapi.responses import StreamingResponse, JSONResponse
+from utils.permissions import roles_required
+from utils.csv_stream import stream_csv, csv_response_headers
+from utils.jobs import job_type, enqueue, count_rows
+from utils.changes import current_version, table_versions
+from utils.archive import includes_archive
+from utils.read_routing import read_sessionmaker
 
 router = APIRouter(prefix="/exports", tags=["export"])
 
-# --- 取得 DB session ---
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+gzip_query = Query(False, description="以 gzip 壓縮串流輸出")
+background_query = Query(False, description="改為排入背景工作，回傳 job id 供查詢進度與下載")
+since_query = Query(None, ge=0, description="增量匯出：只輸出版本號大於此值的異動（含刪除），游標見回應標頭 X-Change-Cursor")
 
-db_dependency = Annotated[Session, Depends(get_db)]
+# --- 訂單明細：每個 OrderItem 一列，單一 SQL 串接 Order / Customer / Product ---
+# 顧客與商品都以 outer join 串接：顧客刪除後（customer_id 為 NULL）的訂單項目仍會匯出，與 /exports/orders 一致
+# orders / items 可換成封存資料表，欄位相同
+def detailed_orders_stmt(date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                         payment_status: Optional[str] = None, orders=Order, items=OrderItem):
+    stmt = (
+        select(
+            orders.id, orders.order_date, orders.payment_status,
+            orders.customer_id, Customer.name, Customer.email,
+            items.product_id, Product.name, Product.category,
+            items.quantity, items.unit_price, items.quantity * items.unit_price
+        )
+        .select_from(items)
+        .join(orders, orders.id == items.order_id)
+        .outerjoin(Customer, Customer.id == orders.customer_id)
+        .outerjoin(Product, Product.id == items.product_id)
+    )
+    if date_from:
+        stmt = stmt.where(orders.order_date >= date_from)
+    if date_to:
+        stmt = stmt.where(orders.order_date < date_to)
+    if payment_status:
+        stmt = stmt.where(orders.payment_status == payment_status)
+    return stmt.order_by(orders.order_date, orders.id, items.id)
 
-# --- 匯出顧客資料（限 admin） ---
-@router.get("/customers", dependencies=[Depends(roles_required("admin"))])
-def export_customers(db: db_dependency):
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["ID", "Name", "Email", "Phone"])
-    for customer in db.query(Customer).all():
-        writer.writerow([customer.id, customer.name, customer.email, customer.phone])
-    output.seek(0)
+DETAILED_ORDER_HEADER = [
+    "Order ID", "Order Date", "Payment Status", "Customer ID", "Customer Name", "Customer Email",
+    "Product ID", "Product Name", "Category", "Quantity", "Unit Price", "Line Total"
+]
+
+def _parse_date(value):
+    return datetime.fromisoformat(value) if value else None
+
+DELTA_HEADER = ["Row Version", "Updated At", "Deleted"]
+
+# --- 增量查詢：(since, until] 區間內有異動的資料，加上同區間的刪除 tombstone，依版本排序 ---
+# sources 為 [(查詢, model)]，第一個欄位必須是 model 的 id；tombstone 除 id 外其餘欄位為空
+def delta_stmt(sources, table_name: str, since: int, until: int):
+    columns = list(sources[0][0].selected_columns)
+    changed = [
+        stmt.order_by(None)
+        .add_columns(model.row_version, model.updated_at, literal(0))
+        .where(model.row_version > since, model.row_version <= until)
+        for stmt, model in sources
+    ]
+    tombstones = select(
+        DeletedRow.row_id, *[cast(null(), column.type) for column in columns[1:]],
+        DeletedRow.row_version, DeletedRow.deleted_at, literal(1)
+    ).where(
+        DeletedRow.table_name == table_name,
+        DeletedRow.row_version > since,
+        DeletedRow.row_version <= until
+    )
+    rows = union_all(*changed, tombstones).subquery()
+    return select(rows).order_by(rows.c[len(columns)], rows.c[0])
+
+# --- 各匯出項目：(標題列, 依參數產生查詢, 檔名, 追蹤版本的 model)；串流端點與背景工作共用 ---
+# 訂單類的查詢另外接受 (訂單, 項目) 資料表，封存資料表以相同的查詢產生
+EXPORTS = {
+    "customers": (
+        ["ID", "Name", "Email", "Phone"],
+        lambda p: select(Customer.id, Customer.name, Customer.email, Customer.phone).order_by(Customer.id),
+        "customers.csv",
+        Customer,
+    ),
+    "orders": (
+        ["ID", "Customer ID", "Total Amount"],
+        lambda p, orders=Order, items=OrderItem: select(orders.id, orders.customer_id, orders.total_amount)
+        .order_by(orders.id),
+        "orders.csv",
+        Order,
+    ),
+    "orders_detailed": (
+        DETAILED_ORDER_HEADER,
+        lambda p, orders=Order, items=OrderItem: detailed_orders_stmt(
+            _parse_date(p.get("date_from")), _parse_date(p.get("date_to")), p.get("payment_status"), orders, items),
+        "orders_detailed.csv",
+        Order,
+    ),
+    "products": (
+        ["ID", "Name", "Price", "Stock"],
+        lambda p: select(Product.id, Product.name, Product.price, Product.stock).order_by(Product.id),
+        "products.csv",
+        Product,
+    ),
+}
+
+# 訂單明細另外帶出顧客與商品名稱，三個資料表任一有異動都視為資料已變
+FINGERPRINT_MODELS = {"orders_detailed": (Order, Customer, Product)}
+
+# 訂單類匯出涵蓋封存資料時，兩個資料表的結果以 UNION ALL 合併，再依這些欄位（位置）排序
+# 訂單明細沒有輸出項目 id，同一訂單內的項目改依商品 id 排序
+ARCHIVE_ORDER = {"orders": (0,), "orders_detailed": (1, 0, 6)}
+
+def export_query(params):
+    kind = params["kind"]
+    header, build, _, model = EXPORTS[kind]
+    sources = [(build(params), model)]
+    if params.get("archive"):
+        sources.append((build(params, ArchivedOrder, ArchivedOrderItem), ArchivedOrder))
+    if params.get("since") is not None:
+        return header + DELTA_HEADER, delta_stmt(sources, model.__tablename__, params["since"], params["until"])
+    if len(sources) == 1:
+        return header, sources[0][0]
+    rows = union_all(*[stmt.order_by(None) for stmt, _ in sources]).subquery()
+    return header, select(rows).order_by(*[rows.c[i] for i in ARCHIVE_ORDER[kind]])
+
+def _filename(params):
+    name = EXPORTS[params["kind"]][2]
+    if params.get("since") is not None:
+        name = name.replace(".csv", f"_{params['since']}_{params['until']}.csv")
+    return name + (".gz" if params.get("gzip") else "")
+
+async def _export_fingerprint(db: AsyncSession, params):
+    kind = params["kind"]
+    return await table_versions(db, FINGERPRINT_MODELS.get(kind, (EXPORTS[kind][3],)))
+
+# --- 背景匯出工作：寫入結果檔；資料未變時重複請求直接使用既有結果檔 ---
+@job_type("export", concurrency=2, fingerprint=_export_fingerprint)
+async def _export_job(params, ctx):
+    header, stmt = export_query(params)
+    await ctx.set_total(await count_rows(stmt))
+    chunks = stream_csv(header, stmt, params.get("gzip", False), progress=ctx.advance)
+    return await ctx.write_file(_filename(params), chunks)
+
+# 游標取自目前已 commit 的版本：增量匯出只輸出到此版本，下次以此值作為 since
+# 資料從讀取來源串流，游標也從讀取來源取得，replica 落後時不會跳過尚未同步的異動
+# db（主資料庫）只用於排入背景工作
+async def _export(db: AsyncSession, sessions, kind: str, gzip: bool, background: bool, since: Optional[int] = None,
+                  **filters):
+    params = {"kind": kind, "gzip": gzip, **{k: v for k, v in filters.items() if v is not None}}
+    async with sessions() as reader:
+        cursor = await current_version(reader)
+        # 起日早於封存水位（或未指定）時一併匯出封存的訂單
+        if kind in ARCHIVE_ORDER and await includes_archive(reader, _parse_date(params.get("date_from"))):
+            params["archive"] = True
+    if since is not None:
+        params.update(since=since, until=cursor)
+    if background:
+        job, reused = await enqueue(db, "export", params)
+        return JSONResponse(status_code=202, headers={"X-Change-Cursor": str(cursor)}, content={
+            "job_id": job.id, "status": job.status, "reused": reused, "change_cursor": cursor,
+            "status_url": f"/jobs/{job.id}", "download_url": f"/jobs/{job.id}/download",
+        })
+    header, stmt = export_query(params)
     return StreamingResponse(
-        output,
+        stream_csv(header, stmt, gzip, sessions=sessions),
         media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=customers.csv"}
+        headers={**csv_response_headers(_filename({**params, "gzip": False}), gzip), "X-Change-Cursor": str(cursor)}
     )
 
+# --- 匯出顧客資料（限 admin） ---
+@router.get("/customers", dependencies=[Depends(roles_required("admin"))])
+async def export_customers(gzip: bool = gzip_query, background: bool = background_query,
+                           since: Optional[int] = since_query, db: AsyncSession = Depends(get_db),
+                           sessions=Depends(read_sessionmaker)):
+    return await _export(db, sessions, "customers", gzip, background, since)
+
 # --- 匯出訂單資料（限 admin） ---
 @router.get("/orders", dependencies=[Depends(roles_required("admin"))])
-def export_orders(db: db_dependency):
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["ID", "Customer ID", "Total Amount"])
-    for order in db.query(Order).all():
-        writer.writerow([order.id, order.customer_id, order.total_amount])
-    output.seek(0)
-    return StreamingResponse(
-        output,
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=orders.csv"}
-    )
+async def export_orders(gzip: bool = gzip_query, background: bool = background_query,
+                        since: Optional[int] = since_query, db: AsyncSession = Depends(get_db),
+                        sessions=Depends(read_sessionmaker)):
+    return await _export(db, sessions, "orders", gzip, background, since)
+
+# --- 匯出訂單明細（限 admin） ---
+@router.get("/orders/detailed", dependencies=[Depends(roles_required("admin"))])
+async def export_orders_detailed(
+    date_from: Optional[datetime] = Query(None, description="訂單日期起（含）"),
+    date_to: Optional[datetime] = Query(None, description="訂單日期迄（不含）"),
+    payment_status: Optional[str] = Query(None, description="付款狀態 pending / paid / cancelled"),
+    gzip: bool = gzip_query,
+    background: bool = background_query,
+    since: Optional[int] = since_query,
+    db: AsyncSession = Depends(get_db),
+    sessions=Depends(read_sessionmaker)
+):
+    return await _export(db, sessions, "orders_detailed", gzip, background, since,
+                         date_from=date_from.isoformat() if date_from else None,
+                         date_to=date_to.isoformat() if date_to else None,
+                         payment_status=payment_status)
 
 # --- 匯出商品資料（限 admin） ---
 @router.get("/products", dependencies=[Depends(roles_required("admin"))])
-def export_products(db: db_dependency):
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["ID", "Name", "Price", "Stock"])
-    for product in db.query(Product).all():
-        writer.writerow([product.id, product.name, product.price, product.stock])
-    output.seek(0)
-    return StreamingResponse(
-        output,
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=products.csv"}
-    )
+async def export_products(gzip: bool = gzip_query, background: bool = background_query,
+                          since: Optional[int] = since_query, db: AsyncSession = Depends(get_db),
+                        sessions=Depends(read_sessionmaker)):
+    return await _export(db, sessions, "products", gzip, background, since)
@@ -0,0 +1,48 @@
+import os
+import time
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Annotated
+from databases import get_db
+from utils.migrations import latest_version
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+
+# 本 worker 行程的狀態：lifespan 啟動完成後 ready，開始關閉時取消，負載平衡器就不再導入新請求
+_state = {"ready": False, "started_at": None}
+
+
+def set_ready(ready: bool):
+    _state["ready"] = ready
+    if ready:
+        _state["started_at"] = time.time()
+
+
+def _worker():
+    started_at = _state["started_at"]
+    return {"pid": os.getpid(), "uptime_seconds": round(time.time() - started_at, 1) if started_at else None}
+
+
+# --- 存活檢查：行程能回應即可，不碰資料庫 ---
+@router.get("/live")
+async def live():
+    return {"status": "ok", **_worker()}
+
+
+# --- 就緒檢查：啟動完成、資料庫可連線且 schema 已是最新版本 ---
+@router.get("/ready")
+async def ready(db: db_dependency):
+    if not _state["ready"]:
+        return JSONResponse({"status": "not_ready", **_worker()}, status_code=503)
+    try:
+        version = (await db.execute(text("SELECT max(version) FROM schema_migrations"))).scalar()
+    except SQLAlchemyError as e:
+        return JSONResponse({"status": "database_unavailable", "error": type(e).__name__, **_worker()}, status_code=503)
+    if version != latest_version():
+        return JSONResponse({"status": "migrations_pending", "schema_version": version, **_worker()}, status_code=503)
+    return {"status": "ready", "schema_version": version, **_worker()}
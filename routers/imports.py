@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends, File, Query, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Annotated, Optional
+from databases import get_db
+from utils.permissions import roles_required
+from utils.imports import detect_format, read_rows, import_products, import_customers, IMPORT_CHUNK_SIZE
+
+router = APIRouter(prefix="/imports", tags=["imports"], dependencies=[Depends(roles_required("admin"))])
+
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+
+format_query = Query(None, pattern="^(csv|ndjson)$", description="檔案格式，未指定時依副檔名判斷（.ndjson / .jsonl 為 NDJSON）")
+chunk_query = Query(IMPORT_CHUNK_SIZE, ge=1, le=10000, description="每批寫入並 commit 的筆數")
+
+# --- 批次匯入商品：欄位同 ProductCreate，回傳逐列錯誤與每秒處理筆數 ---
+@router.post("/products")
+async def import_product_file(
+    db: db_dependency,
+    file: UploadFile = File(..., description="CSV（含標題列）或 NDJSON"),
+    format: Optional[str] = format_query,
+    chunk_size: int = chunk_query
+):
+    rows = read_rows(file.file, detect_format(file.filename, format))
+    return await import_products(db, rows, chunk_size)
+
+# --- 批次匯入顧客：欄位同 CustomerCreate，Email 已存在或檔案內重複的列會列入錯誤 ---
+@router.post("/customers")
+async def import_customer_file(
+    db: db_dependency,
+    file: UploadFile = File(..., description="CSV（含標題列）或 NDJSON"),
+    format: Optional[str] = format_query,
+    chunk_size: int = chunk_query
+):
+    rows = read_rows(file.file, detect_format(file.filename, format))
+    return await import_customers(db, rows, chunk_size)
@@ -0,0 +1,134 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Annotated, List, Optional
+from datetime import datetime
+from databases import get_db, AsyncSessionLocal
+from models import Product, StockMovement
+from utils.permissions import roles_required
+from utils.ledger import take_snapshot_async, movement_position, checkpoint_stmt, stock_at_stmt, product_stock_at
+from utils.jobs import job_type, enqueue, periodic
+from utils.read_routing import get_read_db
+
+STOCK_SNAPSHOT_INTERVAL = float(os.getenv("STOCK_SNAPSHOT_INTERVAL", "3600"))   # 秒，0 表示只手動執行
+
+router = APIRouter(prefix="/inventory", tags=["inventory"], dependencies=[Depends(roles_required("admin"))])
+
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
+
+# --- 某時間點的庫存（at 之前、不含 at 的異動）：最近一次快照 + 其後的少量異動 ---
+# 不指定 at 時直接讀 Product.stock
+@router.get("/stock")
+async def stock_at(
+    db: read_db_dependency,
+    at: Optional[datetime] = Query(None, description="時間點（UTC），不指定為目前庫存"),
+    product_id: Optional[List[int]] = Query(None, description="商品 ID，可重複指定"),
+    category: Optional[str] = Query(None, description="商品分類"),
+    limit: int = Query(100, ge=1, le=1000, description="回傳筆數"),
+    offset: int = Query(0, ge=0, description="略過筆數")
+):
+    if at is None:
+        query = select(Product.id.label("product_id"), Product.name, Product.category, Product.stock.label("stock"))
+        position = None
+    else:
+        position = await movement_position(db, at)
+        checkpoint = (await db.execute(checkpoint_stmt(position))).scalar() or 0
+        query = stock_at_stmt(checkpoint, position)
+    if product_id:
+        query = query.where(Product.id.in_(product_id))
+    if category:
+        query = query.where(Product.category == category)
+    rows = (await db.execute(query.order_by(Product.id).offset(offset).limit(limit))).mappings().all()
+    return {
+        "at": at,
+        "movement_position": position,
+        "items": [{"product_id": r["product_id"], "name": r["name"], "category": r["category"], "stock": r["stock"]}
+                  for r in rows],
+    }
+
+# --- 單一商品在期間內的庫存變化：期初、每日入庫 / 出庫、期末，以及依原因的合計 ---
+@router.get("/products/{product_id}/history")
+async def stock_history(
+    product_id: int,
+    db: read_db_dependency,
+    date_from: datetime = Query(..., description="期間起（含）"),
+    date_to: datetime = Query(..., description="期間迄（不含）")
+):
+    if date_to <= date_from:
+        raise HTTPException(400, detail="date_to 必須晚於 date_from")
+    start = await movement_position(db, date_from)
+    end = await movement_position(db, date_to)
+    opening = await product_stock_at(db, product_id, start)
+
+    in_period = (StockMovement.product_id == product_id, StockMovement.id > start, StockMovement.id <= end)
+    day = func.date(StockMovement.created_at)
+    daily = (await db.execute(
+        select(day.label("day"),
+               func.sum(case((StockMovement.quantity > 0, StockMovement.quantity), else_=0)).label("in"),
+               func.sum(case((StockMovement.quantity < 0, -StockMovement.quantity), else_=0)).label("out"))
+        .where(*in_period).group_by(day).order_by(day)
+    )).all()
+    by_reason = (await db.execute(
+        select(StockMovement.reason, func.sum(StockMovement.quantity)).where(*in_period).group_by(StockMovement.reason)
+    )).all()
+
+    days, stock = [], opening
+    for d, received, shipped in daily:
+        stock += received - shipped
+        days.append({"day": d, "in": received, "out": shipped, "net": received - shipped, "closing": stock})
+    return {
+        "product_id": product_id,
+        "date_from": date_from,
+        "date_to": date_to,
+        "opening_stock": opening,
+        "closing_stock": stock,
+        "by_reason": dict(by_reason),
+        "days": days,
+    }
+
+# --- 異動明細：依 id 由新到舊，before_id 為上一頁最後一筆的 id ---
+@router.get("/movements")
+async def list_movements(
+    db: read_db_dependency,
+    product_id: Optional[int] = Query(None, description="商品 ID"),
+    reason: Optional[str] = Query(None, description="sale / cancel / order_update / adjustment / import / opening_balance"),
+    order_id: Optional[int] = Query(None, description="訂單 ID"),
+    before_id: Optional[int] = Query(None, description="上一頁回傳的 next_before_id"),
+    limit: int = Query(100, ge=1, le=1000, description="每頁筆數")
+):
+    query = select(StockMovement)
+    if product_id is not None:
+        query = query.where(StockMovement.product_id == product_id)
+    if reason:
+        query = query.where(StockMovement.reason == reason)
+    if order_id is not None:
+        query = query.where(StockMovement.order_id == order_id)
+    if before_id is not None:
+        query = query.where(StockMovement.id < before_id)
+    rows = (await db.execute(query.order_by(StockMovement.id.desc()).limit(limit + 1))).scalars().all()
+    next_before_id = rows[limit - 1].id if len(rows) > limit else None
+    return {
+        "items": [{"id": m.id, "product_id": m.product_id, "quantity": m.quantity, "reason": m.reason,
+                   "order_id": m.order_id, "created_at": m.created_at} for m in rows[:limit]],
+        "next_before_id": next_before_id,
+    }
+
+# --- 立即寫入快照（平常由背景 worker 每 STOCK_SNAPSHOT_INTERVAL 秒執行一次） ---
+@router.post("/snapshot")
+async def snapshot(db: db_dependency, background: bool = Query(False, description="改為排入背景工作")):
+    if background:
+        job, reused = await enqueue(db, "stock.snapshot", {})
+        return JSONResponse(status_code=202, content={"job_id": job.id, "status": job.status, "reused": reused,
+                                                      "status_url": f"/jobs/{job.id}"})
+    return await take_snapshot_async(db)
+
+@job_type("stock.snapshot", concurrency=1)
+async def _snapshot_job(params, ctx):
+    async with AsyncSessionLocal() as db:
+        await take_snapshot_async(db)
+    return None
+
+periodic("stock.snapshot", STOCK_SNAPSHOT_INTERVAL)
@@ -0,0 +1,71 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Annotated, Optional
+import os
+from databases import get_db
+from models import Job
+from utils.permissions import roles_required
+
+router = APIRouter(prefix="/jobs", tags=["jobs"], dependencies=[Depends(roles_required("admin"))])
+
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+
+def _job_status(job: Job):
+    return {
+        "id": job.id,
+        "type": job.type,
+        "status": job.status,
+        "progress": job.progress,
+        "total": job.total,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "expires_at": job.expires_at,
+        "download_url": f"/jobs/{job.id}/download" if job.status == "done" and job.result_path else None,
+    }
+
+# --- 最近的背景工作 ---
+@router.get("/")
+async def list_jobs(
+    db: db_dependency,
+    status: Optional[str] = Query(None, description="queued / running / done / failed / expired"),
+    type: Optional[str] = Query(None, description="工作類型"),
+    limit: int = Query(50, ge=1, le=500, description="回傳筆數")
+):
+    query = select(Job)
+    if status:
+        query = query.where(Job.status == status)
+    if type:
+        query = query.where(Job.type == type)
+    jobs = (await db.execute(query.order_by(Job.created_at.desc()).limit(limit))).scalars().all()
+    return [_job_status(job) for job in jobs]
+
+# --- 工作狀態與進度 ---
+@router.get("/{job_id}")
+async def get_job(job_id: str, db: db_dependency):
+    job = await db.get(Job, job_id)
+    if not job:
+        raise HTTPException(404, detail="找不到此工作")
+    return _job_status(job)
+
+# --- 下載結果檔 ---
+@router.get("/{job_id}/download")
+async def download_job(job_id: str, db: db_dependency):
+    job = await db.get(Job, job_id)
+    if not job:
+        raise HTTPException(404, detail="找不到此工作")
+    if job.status != "done" or not job.result_path:
+        raise HTTPException(409, detail=f"工作尚未完成（{job.status}）")
+    if not os.path.exists(job.result_path):
+        raise HTTPException(410, detail="結果檔已過期，請重新匯出")
+    filename = os.path.basename(job.result_path).split("-", 1)[1]
+    gzip = filename.endswith(".gz")
+    return FileResponse(
+        job.result_path,
+        media_type="text/csv",
+        filename=filename[:-3] if gzip else filename,
+        headers={"Content-Encoding": "gzip"} if gzip else None
+    )
@@ -1,50 +1,70 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List, Annotated, Optional
-from databases import SessionLocal
-from models import Order, OrderItem, Product, Customer
-from schemas import OrderCreate, OrderRead, OrderUpdate, OrderItemCreate
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse
+from sqlalchemy import select, or_, and_
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Annotated, Optional
+from databases import get_db
+from models import Order, OrderItem, Customer, ArchivedOrder, ArchivedOrderItem
+from schemas import OrderCreate, OrderRead, OrderUpdate, OrderItemRead, OrderPage, OrderBatchCreate
 from routers.auth import get_current_user
 from utils.permissions import roles_required
+from utils.stock import reserve_stock, reserve_stock_batch, release_stock, StockError
+from utils.pagination import encode_cursor, decode_cursor
+from utils.reports import order_figures, record_orders, record_payment
+from utils.serialization import schema_columns, rows_as_dicts, json_response
+from utils.ledger import SALE, CANCEL, ORDER_UPDATE
+from utils.idempotency import IdempotentRoute
+from utils.archive import archive_watermark, archive_orders, archive_cutoff, ORDER_ARCHIVE_DAYS
+from utils.jobs import enqueue
+from utils.read_routing import get_read_db
 from datetime import datetime
 
 
-router = APIRouter(prefix="/orders", tags=["orders"])
+# 寫入類 endpoint 支援 Idempotency-Key 標頭：逾時重試時回傳第一次的結果，不會重複建立訂單或扣庫存
+router = APIRouter(prefix="/orders", tags=["orders"], route_class=IdempotentRoute)
 
-def get_db():
-    db = SessionLocal()
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
+current_user = Annotated[dict, Depends(get_current_user)]
+
+async def _reserve(db: AsyncSession, items, reason: str = SALE, order_id=None):
     try:
-        yield db
-    finally:
-        db.close()
+        return await reserve_stock(db, items, reason, order_id)
+    except StockError as e:
+        raise HTTPException(400, detail={"message": str(e), "items": e.failures})
 
-db_dependency = Annotated[Session, Depends(get_db)]
-current_user = Annotated[dict, Depends(get_current_user)]
+# 訂單回應需要 items，非同步 session 不能延遲載入，一律以 selectinload 取出
+async def _get_order(db: AsyncSession, order_id: int):
+    result = await db.execute(select(Order).options(selectinload(Order.items)).where(Order.id == order_id))
+    return result.scalars().first()
+
+def _build_items(items, products):
+    total = 0
+    order_items = []
+    for item in items:
+        product = products[item.product_id]
+        total += product.price * item.quantity
+        order_items.append(OrderItem(product_id=item.product_id, quantity=item.quantity, unit_price=product.price))
+    return total, order_items
 
 # --- 建立訂單（顧客或管理員） ---
 @router.post("/", response_model=OrderRead)
-def create_order(order_data: OrderCreate, db: db_dependency, user: current_user):
+async def create_order(order_data: OrderCreate, db: db_dependency, user: current_user):
     if user["user_role"] == "admin":
-        customer = db.query(Customer).filter(Customer.id == order_data.customer_id).first()
+        customer = await db.get(Customer, order_data.customer_id)
     else:
         if not user["customer_id"]:
             raise HTTPException(400, detail="目前帳號尚未綁定顧客資料")
-        customer = db.query(Customer).filter(Customer.id == user["customer_id"]).first()
+        customer = await db.get(Customer, user["customer_id"])
 
     if not customer:
         raise HTTPException(404, detail="找不到顧客")
     if not customer.is_active:
         raise HTTPException(403, detail="此顧客帳號已停用，無法建立訂單")
 
-    total = 0
-    items = []
-    for item in order_data.items:
-        product = db.query(Product).filter(Product.id == item.product_id).first()
-        if not product or product.stock < item.quantity:
-            raise HTTPException(400, detail=f"商品 {item.product_id} 不存在或庫存不足")
-        total += product.price * item.quantity
-        items.append(OrderItem(product_id=item.product_id, quantity=item.quantity, unit_price=product.price))
-        product.stock -= item.quantity
+    products = await _reserve(db, order_data.items)
+    total, items = _build_items(order_data.items, products)
 
     new_order = Order(
         customer_id=customer.id,
@@ -54,33 +74,165 @@ def create_order(order_data: OrderCreate, db: db_dependency, user: current_user)
         items=items
     )
     db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
+    await record_orders(db, [order_figures(new_order)])
+    await db.commit()
     return new_order
 
-# --- 查詢訂單（顧客：自己的 / 管理員：全部） ---
-@router.get("/", response_model=List[OrderRead])
-def list_orders(db: db_dependency, user: current_user):
-    if user["user_role"] == "admin":
-        return db.query(Order).all()
-    if not user["customer_id"]:
-        raise HTTPException(400, detail="目前帳號尚未綁定顧客資料")
-    return db.query(Order).filter(Order.customer_id == user["customer_id"]).all()
+# --- 批次建立訂單（限 admin，POS 結帳等整批匯入） ---
+# 顧客與商品各以一次 IN 查詢取得，庫存合併後以條件式批次 UPDATE 預留
+# all_or_nothing：單一交易，任一筆失敗即全部不建立；best_effort：每 chunk_size 筆 commit 一次
+@router.post("/batch", dependencies=[Depends(roles_required("admin"))])
+async def create_orders_batch(batch: OrderBatchCreate, db: db_dependency):
+    all_or_nothing = batch.mode == "all_or_nothing"
+    results = [None] * len(batch.orders)
+
+    # 只保留需要的欄位：rollback 後 ORM 物件會過期，非同步 session 不能延遲載入
+    customer_ids = {o.customer_id for o in batch.orders}
+    rows = await db.execute(select(Customer.id, Customer.is_active).where(Customer.id.in_(customer_ids)))
+    active = dict(rows.all())
+
+    pending = []
+    for index, order_data in enumerate(batch.orders):
+        if order_data.customer_id not in active:
+            results[index] = {"index": index, "status": "failed", "error": "找不到顧客"}
+        elif not active[order_data.customer_id]:
+            results[index] = {"index": index, "status": "failed", "error": "此顧客帳號已停用，無法建立訂單"}
+        else:
+            pending.append(index)
+
+    if all_or_nothing and len(pending) < len(batch.orders):
+        raise HTTPException(400, detail={"message": "部分訂單無法建立，整批未執行", "results": [r for r in results if r]})
+
+    chunk_size = len(pending) if all_or_nothing else batch.chunk_size
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        try:
+            products, accepted, rejected = await reserve_stock_batch(db, [batch.orders[i].items for i in chunk])
+        except StockError as e:
+            rejected = {n: e.failures for n in range(len(chunk))}
+            accepted = []
+        for n, failures in rejected.items():
+            results[chunk[n]] = {"index": chunk[n], "status": "failed", "error": "商品不存在或庫存不足", "items": failures}
+        if all_or_nothing and rejected:
+            await db.rollback()
+            raise HTTPException(400, detail={"message": "部分訂單無法建立，整批未執行", "results": [r for r in results if r]})
+
+        order_date = datetime.utcnow()
+        created = []
+        for n in accepted:
+            order_data = batch.orders[chunk[n]]
+            total, items = _build_items(order_data.items, products)
+            created.append((chunk[n], Order(
+                customer_id=order_data.customer_id,
+                total_amount=total,
+                order_date=order_date,
+                payment_status="pending",
+                items=items
+            )))
+        db.add_all([order for _, order in created])
+        await record_orders(db, [order_figures(order) for _, order in created])
+        await db.commit()
+        for index, order in created:
+            results[index] = {"index": index, "status": "created", "order_id": order.id, "total_amount": order.total_amount}
+
+    created_count = sum(1 for r in results if r["status"] == "created")
+    return {"created": created_count, "failed": len(results) - created_count, "results": results}
+
+# --- 查詢訂單（顧客：自己的 / 管理員：全部），依 (order_date, id) 由新到舊 keyset 分頁 ---
+# 只查回應需要的欄位，項目以一次 IN 查詢取回後組成 dict，直接以 orjson 輸出
+# 起日早於封存水位（或未指定）且這一頁會排到封存資料時，再依索引從封存資料表取一頁合併
+@router.get("/", response_model=OrderPage)
+async def list_orders(
+    db: read_db_dependency,
+    user: current_user,
+    limit: int = Query(50, ge=1, le=500, description="每頁筆數"),
+    cursor: Optional[str] = Query(None, description="上一頁回傳的 next_cursor"),
+    payment_status: Optional[str] = Query(None, description="付款狀態 pending / paid / cancelled"),
+    date_from: Optional[datetime] = Query(None, description="訂單日期起（含）"),
+    date_to: Optional[datetime] = Query(None, description="訂單日期迄（不含）"),
+    customer_id: Optional[int] = Query(None, description="顧客 ID（限 admin）")
+):
+    if user["user_role"] != "admin":
+        if not user["customer_id"]:
+            raise HTTPException(400, detail="目前帳號尚未綁定顧客資料")
+        customer_id = user["customer_id"]
+    last = decode_cursor(cursor) if cursor else None
+
+    def page(orders):
+        query = select(*schema_columns(orders, OrderRead))
+        if customer_id is not None:
+            query = query.where(orders.customer_id == customer_id)
+        if payment_status:
+            query = query.where(orders.payment_status == payment_status)
+        if date_from:
+            query = query.where(orders.order_date >= date_from)
+        if date_to:
+            query = query.where(orders.order_date < date_to)
+        if last:
+            last_date, last_id = last
+            query = query.where(or_(
+                orders.order_date < last_date,
+                and_(orders.order_date == last_date, orders.id < last_id)
+            ))
+        return query.order_by(orders.order_date.desc(), orders.id.desc()).limit(limit + 1)
+
+    orders = rows_as_dicts(await db.execute(page(Order)))
+    # 一般資料表這一頁已滿且最後一筆晚於封存水位時，封存的訂單都排在這一頁之後，不必查詢
+    archived = set()
+    watermark = await archive_watermark(db)
+    if watermark is not None and (date_from is None or date_from <= watermark) and \
+            (len(orders) <= limit or orders[limit]["order_date"] <= watermark):
+        rows = rows_as_dicts(await db.execute(page(ArchivedOrder)))
+        archived = {order["id"] for order in rows}
+        orders = sorted(orders + rows, key=lambda o: (o["order_date"], o["id"]), reverse=True)[:limit + 1]
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = encode_cursor(orders[-1]["order_date"], orders[-1]["id"])
+
+    items = {order["id"]: [] for order in orders}
+    for order in orders:
+        order["items"] = items[order["id"]]
+    for order_items, ids in ((OrderItem, items.keys() - archived), (ArchivedOrderItem, items.keys() & archived)):
+        if ids:
+            rows = await db.execute(
+                select(order_items.order_id.label("_order_id"), *schema_columns(order_items, OrderItemRead))
+                .where(order_items.order_id.in_(ids))
+                .order_by(order_items.id)
+            )
+            for item in rows_as_dicts(rows):
+                items[item.pop("_order_id")].append(item)
+    return json_response({"items": orders, "next_cursor": next_cursor})
+
+# --- 封存已結案的舊訂單（限 admin；平常由背景 worker 每 ORDER_ARCHIVE_INTERVAL 秒執行一次） ---
+@router.post("/archive", dependencies=[Depends(roles_required("admin"))])
+async def archive(
+    db: db_dependency,
+    days: int = Query(ORDER_ARCHIVE_DAYS, ge=0, description="封存訂單日期早於幾天前的已付款 / 已取消訂單"),
+    background: bool = Query(False, description="改為排入背景工作")
+):
+    if background:
+        job, reused = await enqueue(db, "orders.archive", {"days": days})
+        return JSONResponse(status_code=202, content={"job_id": job.id, "status": job.status, "reused": reused,
+                                                      "status_url": f"/jobs/{job.id}"})
+    cutoff = archive_cutoff(days)
+    return {"archived": await archive_orders(db, cutoff), "cutoff": cutoff}
 
 # --- 標記為已付款（限 admin） ---
 @router.patch("/{order_id}/pay", dependencies=[Depends(roles_required("admin"))])
-def mark_paid(order_id: int, db: db_dependency):
-    order = db.query(Order).filter(Order.id == order_id).first()
+async def mark_paid(order_id: int, db: db_dependency):
+    order = await db.get(Order, order_id)
     if not order or order.payment_status != "pending":
         raise HTTPException(400, detail="訂單無法付款")
     order.payment_status = "paid"
-    db.commit()
+    await record_payment(db, order)
+    await db.commit()
     return {"message": f"訂單 {order_id} 已付款"}
 
 # --- 取消訂單（顧客：只能取消自己的，管理員可取消所有） ---
 @router.patch("/{order_id}/cancel")
-def cancel_order(order_id: int, db: db_dependency, user: current_user):
-    order = db.query(Order).filter(Order.id == order_id).first()
+async def cancel_order(order_id: int, db: db_dependency, user: current_user):
+    order = await _get_order(db, order_id)
     if not order or order.payment_status != "pending":
         raise HTTPException(400, detail="訂單無法取消")
 
@@ -89,42 +241,34 @@ def cancel_order(order_id: int, db: db_dependency, user: current_user):
         if not user["customer_id"] or order.customer_id != user["customer_id"]:
             raise HTTPException(403, detail="您無權取消此訂單")
 
-    for item in order.items:
-        product = db.query(Product).filter(Product.id == item.product_id).first()
-        if product:
-            product.stock += item.quantity
+    await release_stock(db, order.items, CANCEL, order.id)
+    await record_orders(db, [order_figures(order)], -1)
     order.payment_status = "cancelled"
-    db.commit()
+    await db.commit()
     return {"message": f"訂單 {order_id} 已取消"}
 
 # --- 修改訂單項目（限 admin） ---
 @router.patch("/{order_id}", response_model=OrderRead, dependencies=[Depends(roles_required("admin"))])
-def update_order(order_id: int, update_data: OrderUpdate, db: db_dependency):
-    order = db.query(Order).filter(Order.id == order_id).first()
+async def update_order(order_id: int, update_data: OrderUpdate, db: db_dependency):
+    order = await _get_order(db, order_id)
     if not order:
+        if await db.get(ArchivedOrder, order_id):
+            raise HTTPException(409, detail="訂單已封存，無法修改")
         raise HTTPException(404, detail="找不到訂單")
 
     if update_data.items is not None:
-        # 回補原商品庫存
-        for item in order.items:
-            product = db.query(Product).filter(Product.id == item.product_id).first()
-            if product:
-                product.stock += item.quantity
-        order.items.clear()
-
-        new_items = []
-        total = 0
-        for item in update_data.items:
-            product = db.query(Product).filter(Product.id == item.product_id).first()
-            if not product or product.stock < item.quantity:
-                raise HTTPException(400, detail="商品不存在或庫存不足")
-            total += product.price * item.quantity
-            new_items.append(OrderItem(product_id=item.product_id, quantity=item.quantity, unit_price=product.price))
-            product.stock -= item.quantity
+        # 回補原商品庫存，再批次預留新項目
+        old_figures = order_figures(order)
+        await release_stock(db, order.items, ORDER_UPDATE, order.id)
+        products = await _reserve(db, update_data.items, ORDER_UPDATE, order.id)
+        total, new_items = _build_items(update_data.items, products)
 
         order.items = new_items
         order.total_amount = total
+        # 已取消的訂單不在彙總表內；其餘以舊項目扣除、新項目計入，訂單數不變
+        if order.payment_status != "cancelled":
+            await record_orders(db, [old_figures], -1, count=False)
+            await record_orders(db, [order_figures(order)], 1, count=False)
 
-    db.commit()
-    db.refresh(order)
+    await db.commit()
     return order
@@ -1,88 +1,138 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Annotated
-from databases import SessionLocal
+import hashlib
+from databases import get_db
 from models import Product
 from schemas import ProductRead, ProductCreate, ProductUpdate
 from routers.auth import get_current_user
 from utils.permissions import roles_required
+from utils.search import use_search_index, search_subquery, rank_window
+from utils.cache import catalog_cache, catalog_version, mark_catalog_dirty
+from utils.serialization import schema_columns, rows_as_dicts, dump_json
+from utils.read_routing import get_read_db
 
 router = APIRouter(prefix="/products", tags=["products"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
 current_user = Annotated[dict, Depends(get_current_user)]
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
 # --- 查詢商品（所有人可用，顧客只看啟用商品） ---
+# 相同查詢條件的結果序列化一次後快取，並以 ETag 支援 304 Not Modified
 @router.get("/", response_model=List[ProductRead])
-def list_products(
-    db: db_dependency,
+async def list_products(
+    request: Request,
+    db: read_db_dependency,
     search: Optional[str] = Query(None, description="商品名稱關鍵字"),
     min_price: Optional[float] = Query(None, ge=0, description="最低價格"),
     max_price: Optional[float] = Query(None, ge=0, description="最高價格"),
     category: Optional[str] = Query(None, description="商品分類"),
     include_inactive: bool = Query(False, description="是否包含下架商品"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="回傳筆數上限"),
+    offset: int = Query(0, ge=0, description="略過筆數"),
     user: dict = Depends(get_current_user)
 ):
-    query = db.query(Product)
+    active_only = user["user_role"] != "admin" or not include_inactive
+    # 關鍵字正規化一次，快取鍵與查詢使用同一個值；查詢以小寫比對（FTS5 trigram 與 LIKE 後備查詢都不分大小寫）
+    search = (search or "").strip().lower() or None
+    # 目錄版本尚未穩定（None）時直接查詢，不讀寫快取
+    version = await catalog_version(db)
+    key = (version, active_only, search, min_price, max_price, category, limit, offset)
+    cached = catalog_cache.get(key) if version is not None else None
+    if cached is None:
+        body = dump_json(await _query_products(db, active_only, search, min_price, max_price, category, limit, offset))
+        cached = (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        if version is not None:
+            catalog_cache.set(key, cached)
 
-    if user["user_role"] != "admin" or not include_inactive:
-        query = query.filter(Product.is_active == True)
-    if search:
-        query = query.filter(Product.name.contains(search))
+    body, etag = cached
+    headers = {"ETag": etag}
+    if version is not None:
+        headers["X-Catalog-Version"] = str(version)
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# 只查 ProductRead 需要的欄位，回傳 dict 清單
+async def _query_products(db: AsyncSession, active_only: bool, search, min_price, max_price, category, limit, offset):
+    query = select(*schema_columns(Product, ProductRead))
+
+    if active_only:
+        query = query.where(Product.is_active == True)
+    if search and use_search_index(db, search):
+        # 走 FTS5 trigram 索引，依相關度排序
+        filtered = active_only or min_price is not None or max_price is not None or bool(category)
+        matches = search_subquery("products", search, rank_window(limit, offset, filtered))
+        query = query.join(matches, matches.c.id == Product.id).order_by(matches.c.rank, Product.id)
+    elif search:
+        # PostgreSQL 的 LIKE 區分大小寫，與小寫的關鍵字比對前先把商品名稱轉小寫
+        query = query.where(func.lower(Product.name).contains(search))
     if min_price is not None:
-        query = query.filter(Product.price >= min_price)
+        query = query.where(Product.price >= min_price)
     if max_price is not None:
-        query = query.filter(Product.price <= max_price)
+        query = query.where(Product.price <= max_price)
     if category:
-        query = query.filter(Product.category == category)
+        query = query.where(Product.category == category)
 
-    return query.all()
+    if offset:
+        query = query.offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return rows_as_dicts(await db.execute(query))
 
 # --- 新增商品（限 admin） ---
 @router.post("/", response_model=ProductRead, dependencies=[Depends(roles_required("admin"))])
-def create_product(product_data: ProductCreate, db: db_dependency):
+async def create_product(product_data: ProductCreate, db: db_dependency):
     product = Product(**product_data.dict())
     db.add(product)
-    db.commit()
-    db.refresh(product)
+    mark_catalog_dirty(db)
+    await db.commit()
+    await db.refresh(product)
     return product
 
 # --- 修改商品（限 admin） ---
 @router.patch("/{product_id}", response_model=ProductRead, dependencies=[Depends(roles_required("admin"))])
-def update_product(product_id: int, product_data: ProductUpdate, db: db_dependency):
-    product = db.query(Product).filter(Product.id == product_id).first()
+async def update_product(product_id: int, product_data: ProductUpdate, db: db_dependency):
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(404, detail="找不到此商品")
 
     for field, value in product_data.dict(exclude_unset=True).items():
         setattr(product, field, value)
 
-    db.commit()
-    db.refresh(product)
+    mark_catalog_dirty(db)
+    await db.commit()
+    await db.refresh(product)
     return product
     
 # --- 刪除商品（限 admin） ---
 @router.delete("/{product_id}", dependencies=[Depends(roles_required("admin"))])
-def delete_product(
+async def delete_product(
     product_id: int,
-    confirm: bool = Query(False, description="是否確認刪除商品"),
-    db: db_dependency = Depends()
+    db: db_dependency,
+    confirm: bool = Query(False, description="是否確認刪除商品")
 ):
     if not confirm:
         raise HTTPException(status_code=400, detail="請加上 confirm=true 才能執行刪除")
 
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="找不到此商品")
 
-    db.delete(product)
-    db.commit()
+    await db.delete(product)
+    mark_catalog_dirty(db)
+    await db.commit()
     return {"message": f"商品 ID {product_id} 已刪除"}
 
+# --- 商品目錄快取統計（限 admin） ---
+@router.get("/cache/stats", dependencies=[Depends(roles_required("admin"))])
+async def catalog_cache_stats(db: db_dependency):
+    return {"catalog_version": await catalog_version(db), **catalog_cache.stats()}
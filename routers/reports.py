@@ -0,0 +1,101 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import JSONResponse
+from sqlalchemy import case, select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Annotated, Optional
+from datetime import date
+from databases import get_db, AsyncSessionLocal
+from models import DailySales, ProductSales, CustomerSales, Product, Customer
+from utils.permissions import roles_required
+from utils.reports import rebuild_reports_async
+from utils.jobs import job_type, enqueue
+from utils.read_routing import get_read_db
+
+router = APIRouter(prefix="/reports", tags=["reports"], dependencies=[Depends(roles_required("admin"))])
+
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]
+
+# --- 每日營收（讀彙總表，成本與天數成正比） ---
+@router.get("/daily")
+async def daily_report(
+    db: read_db_dependency,
+    date_from: Optional[date] = Query(None, description="起日（含）"),
+    date_to: Optional[date] = Query(None, description="迄日（含）")
+):
+    query = select(DailySales)
+    if date_from:
+        query = query.where(DailySales.day >= date_from)
+    if date_to:
+        query = query.where(DailySales.day <= date_to)
+    rows = (await db.execute(query.order_by(DailySales.day))).scalars().all()
+    return [
+        {"day": r.day, "order_count": r.order_count, "items_sold": r.items_sold,
+         "revenue": r.revenue, "paid_revenue": r.paid_revenue}
+        for r in rows
+    ]
+
+# --- 商品銷售排行 ---
+@router.get("/products")
+async def product_report(
+    db: read_db_dependency,
+    sort: str = Query("revenue", pattern="^(revenue|units_sold|order_count)$", description="排序欄位"),
+    limit: int = Query(50, ge=1, le=1000, description="回傳筆數")
+):
+    query = (
+        select(ProductSales.product_id, Product.name, Product.category,
+               ProductSales.order_count, ProductSales.units_sold, ProductSales.revenue)
+        .outerjoin(Product, Product.id == ProductSales.product_id)
+        .order_by(getattr(ProductSales, sort).desc(), ProductSales.product_id)
+        .limit(limit)
+    )
+    return (await db.execute(query)).mappings().all()
+
+# --- 顧客消費排行 ---
+@router.get("/customers")
+async def customer_report(
+    db: read_db_dependency,
+    sort: str = Query("revenue", pattern="^(revenue|order_count|last_order_at)$", description="排序欄位"),
+    limit: int = Query(50, ge=1, le=1000, description="回傳筆數")
+):
+    query = (
+        select(CustomerSales.customer_id, Customer.name, Customer.email, CustomerSales.order_count,
+               CustomerSales.revenue, CustomerSales.paid_revenue, CustomerSales.last_order_at)
+        .outerjoin(Customer, Customer.id == CustomerSales.customer_id)
+        .order_by(getattr(CustomerSales, sort).desc(), CustomerSales.customer_id)
+        .limit(limit)
+    )
+    return (await db.execute(query)).mappings().all()
+
+# --- 庫存概況：依分類統計商品數、總庫存、庫存金額與低庫存商品數 ---
+@router.get("/inventory")
+async def inventory_report(
+    db: read_db_dependency,
+    low_stock: int = Query(5, ge=0, description="低於或等於此數量視為低庫存")
+):
+    query = (
+        select(Product.category, func.count().label("product_count"),
+               func.coalesce(func.sum(Product.stock), 0).label("total_stock"),
+               func.coalesce(func.sum(Product.stock * Product.price), 0).label("stock_value"),
+               func.sum(case((Product.stock <= low_stock, 1), else_=0)).label("low_stock_count"))
+        .where(Product.is_active == True)
+        .group_by(Product.category)
+        .order_by(Product.category)
+    )
+    return (await db.execute(query)).mappings().all()
+
+# --- 從訂單資料重建彙總表 ---
+@router.post("/rebuild")
+async def rebuild(db: db_dependency, background: bool = Query(False, description="改為排入背景工作")):
+    if background:
+        job, reused = await enqueue(db, "reports.rebuild", {})
+        return JSONResponse(status_code=202, content={"job_id": job.id, "status": job.status, "reused": reused,
+                                                      "status_url": f"/jobs/{job.id}"})
+    await rebuild_reports_async(db)
+    return {"message": "報表彙總表已重建"}
+
+@job_type("reports.rebuild", concurrency=1)
+async def _rebuild_job(params, ctx):
+    async with AsyncSessionLocal() as db:
+        await rebuild_reports_async(db)
+    return None
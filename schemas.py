@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from typing import List, Optional, Literal
 from datetime import datetime
 
 class CustomerCreate(BaseModel):
@@ -86,11 +86,21 @@ class OrderRead(BaseModel):
     customer_id: int
     order_date: datetime
     total_amount: float
+    payment_status: str
     items: List[OrderItemRead]
 
     class Config:
         orm_mode = True
 
+class OrderPage(BaseModel):
+    items: List[OrderRead]
+    next_cursor: Optional[str] = Field(None, description="下一頁游標，沒有下一頁時為 null")
+
+class OrderBatchCreate(BaseModel):
+    orders: List[OrderCreate] = Field(..., min_length=1, max_length=5000, description="訂單清單")
+    mode: Literal["all_or_nothing", "best_effort"] = Field("best_effort", description="all_or_nothing：任一筆失敗全部不建立；best_effort：逐筆回報成功與失敗")
+    chunk_size: int = Field(200, ge=1, le=1000, description="best_effort 模式每批 commit 的訂單數")
+
 class UserCreate(BaseModel):
     username: str = Field(..., min_length=3, max_length=30)
     email: EmailStr
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, literal, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from databases import AsyncSessionLocal
+from models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+from utils.jobs import job_type, periodic
+
+ORDER_ARCHIVE_DAYS = int(os.getenv("ORDER_ARCHIVE_DAYS", "365"))              # 結案超過此天數的訂單才封存
+ORDER_ARCHIVE_BATCH = int(os.getenv("ORDER_ARCHIVE_BATCH", "500"))            # 每個交易搬移的訂單數
+ORDER_ARCHIVE_INTERVAL = float(os.getenv("ORDER_ARCHIVE_INTERVAL", "86400"))  # 秒，0 表示只手動執行
+
+CLOSED_STATUSES = ("paid", "cancelled")
+
+# (訂單, 訂單項目)：一般資料表與封存資料表欄位相同，查詢依區間決定要查哪些來源
+ORDER_TABLES = ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem))
+
+_ORDER_COLUMNS = [column.name for column in Order.__table__.columns]
+_ITEM_COLUMNS = [column.name for column in OrderItem.__table__.columns]
+
+
+def archive_cutoff(days: int = ORDER_ARCHIVE_DAYS):
+    return datetime.utcnow() - timedelta(days=days)
+
+
+# --- 搬移一批：選出可封存的訂單，複製訂單與項目到封存資料表後刪除，在同一交易內完成 ---
+# 每批各自 commit，中斷後重新執行會從剩下的訂單繼續；搬移不是刪除，不寫 tombstone、不動報表與異動帳
+# orders / order_items 的 id 不會重複配號（SQLite 為 AUTOINCREMENT，見 migration 11），封存資料保留原 id
+def archive_batch(conn, cutoff: datetime, batch_size: int = ORDER_ARCHIVE_BATCH):
+    ids = conn.execute(
+        select(Order.id)
+        .where(Order.payment_status.in_(CLOSED_STATUSES), Order.order_date < cutoff)
+        .limit(batch_size)
+    ).scalars().all()
+    if not ids:
+        return 0
+
+    orders = Order.__table__
+    items = OrderItem.__table__
+    conn.execute(insert(ArchivedOrder).from_select(
+        _ORDER_COLUMNS + ["archived_at"],
+        select(*[orders.c[name] for name in _ORDER_COLUMNS], literal(datetime.utcnow())).where(orders.c.id.in_(ids))
+    ))
+    conn.execute(insert(ArchivedOrderItem).from_select(
+        _ITEM_COLUMNS, select(*[items.c[name] for name in _ITEM_COLUMNS]).where(items.c.order_id.in_(ids))
+    ))
+    conn.execute(delete(items).where(items.c.order_id.in_(ids)))
+    conn.execute(delete(orders).where(orders.c.id.in_(ids)))
+    return len(ids)
+
+
+async def archive_orders(db: AsyncSession, cutoff: datetime, batch_size: int = ORDER_ARCHIVE_BATCH, progress=None):
+    total = 0
+    while True:
+        moved = await db.run_sync(lambda session: archive_batch(session.connection(), cutoff, batch_size))
+        await db.commit()
+        if not moved:
+            return total
+        total += moved
+        if progress:
+            await progress(moved)
+        await asyncio.sleep(0)  # 批次之間釋放寫入鎖，讓下單等請求先執行
+
+
+# --- 封存水位：封存資料中最新的訂單日期；查詢起日晚於此值時只需查一般資料表 ---
+def watermark_stmt():
+    return select(func.max(ArchivedOrder.order_date))
+
+
+async def archive_watermark(db: AsyncSession):
+    return (await db.execute(watermark_stmt())).scalar()
+
+
+async def includes_archive(db: AsyncSession, date_from: datetime = None):
+    watermark = await archive_watermark(db)
+    return watermark is not None and (date_from is None or date_from <= watermark)
+
+
+@job_type("orders.archive", concurrency=1)
+async def _archive_job(params, ctx):
+    async with AsyncSessionLocal() as db:
+        await archive_orders(db, archive_cutoff(params.get("days", ORDER_ARCHIVE_DAYS)), progress=ctx.advance)
+    return None
+
+
+periodic("orders.archive", ORDER_ARCHIVE_INTERVAL)
+
+
+# 第一次封存大量訂單後，一般資料表的頁面多半只剩部分資料；VACUUM 重新整理後工作集才會變小
+# 之後每天少量封存，空出的頁面會由新訂單重複使用
+def vacuum(engine):
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("VACUUM ANALYZE orders, order_items"))
+        else:
+            conn.execute(text("VACUUM"))
+
+
+def status(conn):
+    counts = {}
+    for orders, items in ORDER_TABLES:
+        counts[orders.__tablename__] = conn.execute(select(func.count()).select_from(orders)).scalar()
+        counts[items.__tablename__] = conn.execute(select(func.count()).select_from(items)).scalar()
+    counts["watermark"] = conn.execute(watermark_stmt()).scalar()
+    return counts
+
+
+if __name__ == "__main__":
+    # 用法：python -m utils.archive run [天數] | vacuum | status
+    from databases import engine
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "run":
+        days = int(sys.argv[2]) if len(sys.argv) > 2 else ORDER_ARCHIVE_DAYS
+        cutoff, total = archive_cutoff(days), 0
+        while True:
+            with engine.begin() as conn:
+                moved = archive_batch(conn, cutoff)
+            if not moved:
+                break
+            total += moved
+            print(f"已封存 {total} 筆訂單", end="\r")
+        print(f"已封存 {total} 筆 {cutoff:%Y-%m-%d} 之前結案的訂單")
+    elif command == "vacuum":
+        vacuum(engine)
+        print("VACUUM 完成")
+    elif command == "status":
+        with engine.connect() as conn:
+            for name, value in status(conn).items():
+                print(f"{name}: {value}")
+    else:
+        print("用法：python -m utils.archive run [天數] | vacuum | status")
+        sys.exit(1)
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from models import Product, DeletedRow
+from utils.changes import versions_settled
+
+
+# --- 有上限的 LRU + TTL 快取，記錄命中 / 未命中次數 ---
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    # ttl 可逐筆指定較短的存活時間（例如 token 剩餘效期），不會超過快取本身的 ttl
+    def set(self, key, value, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+# --- 商品目錄快取：以資料庫中的目錄版本為 key 的一部分 ---
+# 多 worker 時各行程的快取互不共享；版本取商品與其 tombstone 的最大 row_version，
+# 任何行程寫入商品都會推進版本，其他 worker 的下一次查詢就會換用新的 key
+catalog_cache = TTLCache(
+    maxsize=int(os.getenv("CATALOG_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("CATALOG_CACHE_TTL", "60")),
+)
+
+
+def catalog_version_stmt():
+    products = select(func.max(Product.row_version)).scalar_subquery()
+    deleted = select(func.max(DeletedRow.row_version)).where(DeletedRow.table_name == "products").scalar_subquery()
+    return select(products, deleted)
+
+
+# 最大版本之下仍有進行中的交易（PostgreSQL 依交易 id 配號）時回傳 None：該交易 commit 後最大版本可能不變，不能當快取 key
+async def catalog_version(db):
+    row = (await db.execute(catalog_version_stmt())).one()
+    version = max(row[0] or 0, row[1] or 0)
+    return version if await versions_settled(db, [version]) else None
+
+
+# 本行程寫入後立即清掉舊版本的項目，不必等 TTL 到期才釋放記憶體
+def invalidate_catalog():
+    catalog_cache.clear()
+
+
+# 在 session 上標記商品資料已變動，實際清除延後到 commit 成功之後
+def mark_catalog_dirty(db):
+    db.info["catalog_dirty"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop("catalog_dirty", False):
+        invalidate_catalog()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("catalog_dirty", None)
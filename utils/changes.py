@@ -0,0 +1,92 @@
+from datetime import datetime
+from sqlalchemy import event, func, insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models import ChangeSequence, DeletedRow, Customer, Product, Order
+
+TRACKED_MODELS = (Customer, Product, Order)
+
+_sequence = ChangeSequence.__table__
+
+
+# --- 取下一個版本號 ---
+# SQLite：單列計數器 +1，寫入交易依 commit 順序取得遞增的版本；SQLite 同時只有一個寫入交易，計數器的鎖不會多出等待
+# PostgreSQL：交易 id（txid_current）加上 change_sequence.value 的位移（migration 12 設定，讓版本接續在舊計數器之後），
+# 不鎖任何資料列，寫入交易不會在同一列上排隊；版本依交易開始寫入的順序配發，commit 順序不一定相同，見 current_version
+# 以 pg_dump 還原到新的叢集後交易 id 會重新計算，需重新設定位移
+PG_VERSION_SQL = "SELECT txid_current() + value FROM change_sequence WHERE id = 1"
+PG_CURSOR_SQL = "SELECT txid_snapshot_xmin(txid_current_snapshot()) - 1 + value FROM change_sequence WHERE id = 1"
+
+
+def next_version(connection):
+    if connection.dialect.name == "postgresql":
+        return connection.execute(text(PG_VERSION_SQL)).scalar_one()
+    if connection.execute(update(_sequence).where(_sequence.c.id == 1).values(value=_sequence.c.value + 1)).rowcount == 0:
+        connection.execute(insert(_sequence).values(id=1, value=1))
+    return connection.execute(select(_sequence.c.value).where(_sequence.c.id == 1)).scalar_one()
+
+
+# 同一交易內共用一個版本號，交易結束後清除
+def transaction_version(session: Session):
+    version = session.info.get("change_version")
+    if version is None:
+        version = session.info["change_version"] = next_version(session.connection())
+    return version
+
+
+# 非同步 session 版本：給批次 UPDATE / INSERT 等不經過 ORM flush 的寫入使用
+async def change_version(db: AsyncSession):
+    return await db.run_sync(transaction_version)
+
+
+# 目前已 commit 的最新版本，作為增量匯出的游標上限：小於等於此值的版本都已結束（commit 或 rollback）
+# PostgreSQL 取快照中仍在進行的最小交易 id - 1，晚 commit 的舊交易不會落在已匯出的游標之前
+async def current_version(db: AsyncSession):
+    if db.bind.dialect.name == "postgresql":
+        return (await db.execute(text(PG_CURSOR_SQL))).scalar() or 0
+    return (await db.execute(select(_sequence.c.value).where(_sequence.c.id == 1))).scalar() or 0
+
+
+# 最大版本之下沒有進行中的交易：之後 commit 的異動版本一定更大，以最大版本判斷資料是否改變才可靠
+# SQLite 依 commit 順序配號，一定成立
+async def versions_settled(db: AsyncSession, versions):
+    if db.bind.dialect.name != "postgresql":
+        return True
+    cursor = await current_version(db)
+    return all(version is None or version <= cursor for version in versions)
+
+
+# 各資料表目前的最大版本（含 tombstone），資料未變時結果不變
+# 尚未穩定時加上游標，較舊的交易晚 commit 後結果也會改變
+async def table_versions(db: AsyncSession, models):
+    versions = []
+    for model in models:
+        versions.append((await db.execute(select(func.max(model.row_version)))).scalar())
+        versions.append((await db.execute(
+            select(func.max(DeletedRow.row_version)).where(DeletedRow.table_name == model.__tablename__)
+        )).scalar())
+    if not await versions_settled(db, versions):
+        versions.append(await current_version(db))
+    return versions
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_changes(session, flush_context, instances):
+    changed = [obj for obj in session.new if isinstance(obj, TRACKED_MODELS)]
+    changed += [obj for obj in session.dirty if isinstance(obj, TRACKED_MODELS) and session.is_modified(obj)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, TRACKED_MODELS)]
+    if not changed and not deleted:
+        return
+    version = transaction_version(session)
+    now = datetime.utcnow()
+    for obj in changed:
+        obj.updated_at = now
+        obj.row_version = version
+    for obj in deleted:
+        session.add(DeletedRow(table_name=obj.__tablename__, row_id=obj.id, row_version=version, deleted_at=now))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _clear_version(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("change_version", None)
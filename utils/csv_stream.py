@@ -0,0 +1,46 @@
+import csv
+import zlib
+from io import StringIO
+from databases import AsyncReadSessionLocal
+
+CHUNK_SIZE = 2000
+
+
+# --- 以 yield_per 分批讀取欄位（不建立 ORM 物件），每批編碼後立即送出 ---
+# 產生器自行開關 session：FastAPI 會在回應開始串流前就結束 yield 依賴
+# progress 為選用的 callback，每批寫出後以該批筆數呼叫（背景工作回報進度用）
+# 預設讀 async_read_engine，不與下單等寫入共用主資料庫的連線池
+async def stream_csv(header, stmt, gzip: bool = False, chunk_size: int = CHUNK_SIZE, progress=None,
+                     sessions=AsyncReadSessionLocal):
+    compressor = zlib.compressobj(wbits=31) if gzip else None
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    writer.writerow(header)
+    yield flush()
+
+    async with sessions() as db:
+        result = await db.stream(stmt.execution_options(yield_per=chunk_size))
+        async for rows in result.partitions():
+            writer.writerows(rows)
+            if progress:
+                await progress(len(rows))
+            chunk = flush()
+            if chunk:
+                yield chunk
+
+    if compressor:
+        yield compressor.flush()
+
+
+def csv_response_headers(filename: str, gzip: bool = False):
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return headers
@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from fastapi import HTTPException
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+from fastapi.security.utils import get_authorization_scheme_param
+from sqlalchemy import and_, delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from databases import AsyncSessionLocal
+from models import IdempotencyKey
+from routers.auth import get_current_user
+from utils.cache import TTLCache
+from utils.jobs import job_type, periodic
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))                       # 已完成回應保留秒數
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))        # 執行中超過此秒數未續約視為已中斷，可重新執行
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))      # 重送等待執行中請求的上限，逾時回 409
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "4096"))
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "3600"))  # 秒，0 表示不定期清除
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+MUTATING_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+# 已完成的回應在本行程再留一份，重送時不必查資料庫；多 worker 時以資料表為準
+response_cache = TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL)
+
+# 本行程執行中的請求：(scope, key) → (fingerprint, Future)，相同 key 的重送等待同一個 Future
+_inflight = {}
+
+
+def _fingerprint(request, body: bytes):
+    digest = hashlib.sha256(f"{request.method} {request.url.path}\0".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+async def _request_user(request):
+    scheme, token = get_authorization_scheme_param(request.headers.get("Authorization"))
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return await get_current_user(token)
+
+
+def _stored(row):
+    return SimpleNamespace(fingerprint=row.fingerprint, status_code=row.status_code,
+                           media_type=row.media_type, body=row.body)
+
+
+def _replay(stored, fingerprint: str):
+    if stored.fingerprint != fingerprint:
+        raise HTTPException(422, detail=f"{IDEMPOTENCY_HEADER} 已用於內容不同的請求")
+    headers = {"Idempotent-Replayed": "true"}
+    if stored.media_type:
+        headers["content-type"] = stored.media_type
+    return Response(content=stored.body, status_code=stored.status_code, headers=headers)
+
+
+# --- 取得 key 的執行權：成功新增 in_progress 列即由本請求執行，回傳 None ---
+# 先讀再寫，重送只需一次查詢；key 已存在時回傳該列，
+# 已過期或執行中卻超過 locked_until（worker 中斷、不再續約）的列以條件式 UPDATE 接手
+# now 同時寫入 created_at，作為這次執行權的識別，續約、完成與釋放都只更新仍屬於本次執行的列
+async def _claim(scope: str, key: str, fingerprint: str, now: datetime):
+    values = dict(fingerprint=fingerprint, status="in_progress", status_code=None, media_type=None, body=None,
+                  created_at=now, locked_until=now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+                  expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL))
+    async with AsyncSessionLocal() as db:
+        while True:
+            row = (await db.execute(
+                select(IdempotencyKey).where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+            )).scalars().first()
+            if row is None:
+                db.add(IdempotencyKey(scope=scope, key=key, **values))
+                try:
+                    await db.commit()
+                    return None
+                except IntegrityError:
+                    await db.rollback()     # 其他請求同時新增，重新讀取
+                    continue
+            if row.expires_at > now and (row.status == "completed" or row.locked_until > now):
+                return row
+            taken = await db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.id == row.id, IdempotencyKey.status == row.status,
+                       IdempotencyKey.locked_until == row.locked_until)
+                .values(**values)
+            )
+            await db.commit()
+            if taken.rowcount == 1:
+                return None
+            db.expunge_all()
+
+
+def _owned(scope: str, key: str, claimed_at: datetime):
+    return and_(IdempotencyKey.scope == scope, IdempotencyKey.key == key,
+                IdempotencyKey.status == "in_progress", IdempotencyKey.created_at == claimed_at)
+
+
+# --- 執行期間每 1/3 個 IDEMPOTENCY_LOCK_SECONDS 延長 locked_until，執行再久重送也不會接手 ---
+# 執行權已被接手（續約更新不到資料列）時中止 handler，不與接手的請求同時執行
+async def _keep_lock(scope: str, key: str, claimed_at: datetime, running: asyncio.Future, lost: asyncio.Event):
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_LOCK_SECONDS / 3)
+        try:
+            async with AsyncSessionLocal() as db:
+                renewed = await db.execute(
+                    update(IdempotencyKey).where(_owned(scope, key, claimed_at))
+                    .values(locked_until=datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS))
+                )
+                await db.commit()
+        except Exception:
+            continue   # 資料庫暫時忙碌，下一輪再續約；locked_until 還有 2/3 的餘裕
+        if renewed.rowcount != 1:
+            lost.set()
+            running.cancel()
+            return
+
+
+async def _complete(scope: str, key: str, claimed_at: datetime, response):
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(IdempotencyKey)
+            .where(_owned(scope, key, claimed_at))
+            .values(status="completed", status_code=response.status_code,
+                    media_type=response.headers.get("content-type"), body=response.body)
+        )
+        await db.commit()
+
+
+async def _release(scope: str, key: str, claimed_at: datetime):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(IdempotencyKey).where(_owned(scope, key, claimed_at)))
+        await db.commit()
+
+
+# --- 帶 Idempotency-Key 的請求：同一使用者、同一 key 只執行一次 ---
+# 已完成：直接回傳存下的回應（不碰商品、訂單資料表）；執行中：等待結果；內容不同：422
+# 只保存成功的回應；失敗（HTTPException、4xx/5xx）時刪除 key，用戶端可用同一個 key 重試
+# 回應在業務交易 commit 之後才寫入，兩者之間 worker 中斷時 key 會在 locked_until 後被重新執行；
+# 執行中持續續約，只有停止續約（worker 中斷）的 key 才會被接手，續約失敗的請求中止並回 409
+async def idempotent_call(request, handler, key: str):
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(400, detail=f"{IDEMPOTENCY_HEADER} 長度不可超過 {MAX_KEY_LENGTH}")
+    user = await _request_user(request)
+    if user is None:
+        return await handler(request)
+
+    scope = str(user["id"])
+    fingerprint = _fingerprint(request, await request.body())
+    cache_key = (scope, key)
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        stored = response_cache.get(cache_key)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+
+        inflight = _inflight.get(cache_key)
+        if inflight is None:
+            claimed_at = datetime.utcnow()
+            row = await _claim(scope, key, fingerprint, claimed_at)
+            if row is None:
+                break
+            if row.status == "completed":
+                stored = _stored(row)
+                response_cache.set(cache_key, stored, ttl=(row.expires_at - datetime.utcnow()).total_seconds())
+                return _replay(stored, fingerprint)
+            in_progress = row.fingerprint
+        else:
+            in_progress = inflight[0]
+        if in_progress != fingerprint:
+            raise HTTPException(422, detail=f"{IDEMPOTENCY_HEADER} 已用於內容不同的請求")
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise HTTPException(409, detail=f"相同 {IDEMPOTENCY_HEADER} 的請求仍在執行中，請稍後重試")
+        if inflight is not None:
+            await asyncio.wait({inflight[1]}, timeout=remaining)
+        else:
+            await asyncio.sleep(min(POLL_INTERVAL, remaining))
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[cache_key] = (fingerprint, future)
+    running = asyncio.ensure_future(handler(request))
+    lost = asyncio.Event()
+    keeper = asyncio.create_task(_keep_lock(scope, key, claimed_at, running, lost))
+    try:
+        try:
+            response = await running
+        finally:
+            keeper.cancel()
+        if response.status_code < 400 and hasattr(response, "body"):
+            await _complete(scope, key, claimed_at, response)
+            response_cache.set(cache_key, SimpleNamespace(
+                fingerprint=fingerprint, status_code=response.status_code,
+                media_type=response.headers.get("content-type"), body=response.body))
+        else:
+            await _release(scope, key, claimed_at)
+        return response
+    except asyncio.CancelledError:
+        await _release(scope, key, claimed_at)
+        if lost.is_set():
+            raise HTTPException(409, detail=f"相同 {IDEMPOTENCY_HEADER} 的請求已由其他程序接手，本次執行已中止")
+        raise
+    except BaseException:
+        await _release(scope, key, claimed_at)
+        raise
+    finally:
+        del _inflight[cache_key]
+        future.set_result(None)
+
+
+# --- 路由類別：router 內所有寫入類 endpoint 支援 Idempotency-Key，沒帶標頭時照常執行 ---
+class IdempotentRoute(APIRoute):
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key or request.method not in MUTATING_METHODS:
+                return await handler(request)
+            return await idempotent_call(request, handler, key)
+
+        return route_handler
+
+
+# --- 清除過期的 key（背景 worker 每 IDEMPOTENCY_PURGE_INTERVAL 秒執行一次） ---
+async def purge_expired(db: AsyncSession):
+    result = await db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.utcnow()))
+    await db.commit()
+    return result.rowcount
+
+
+@job_type("idempotency.purge", concurrency=1)
+async def _purge_job(params, ctx):
+    async with AsyncSessionLocal() as db:
+        await purge_expired(db)
+    return None
+
+
+periodic("idempotency.purge", IDEMPOTENCY_PURGE_INTERVAL)
@@ -0,0 +1,211 @@
+import codecs
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from itertools import islice
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Customer, Product
+from schemas import CustomerCreate, ProductCreate
+from utils.cache import mark_catalog_dirty
+from utils.changes import change_version
+from utils.ledger import record_movements, IMPORT
+from utils.reports import open_customer_sales
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+MAX_REPORTED_ERRORS = int(os.getenv("IMPORT_MAX_REPORTED_ERRORS", "1000"))
+IMPORT_READ_ROWS = 1000   # 每次在執行緒中讀取的列數
+
+
+def detect_format(filename: str, fmt: str = None):
+    if fmt:
+        return fmt
+    return "ndjson" if (filename or "").lower().endswith((".ndjson", ".jsonl")) else "csv"
+
+
+# --- 逐列讀取上傳檔（不整份載入記憶體），回傳 (行號, 欄位 dict 或錯誤訊息) ---
+# CSV 空字串視為未填（None）；NDJSON 每行一個 JSON 物件，空行略過
+# 不是 UTF-8 的行、CSV / JSON 格式錯誤的列都以錯誤訊息回報，其餘的列照常匯入
+def iter_rows(file, fmt: str):
+    bad_lines = set()
+    lines = _decoded_lines(file, bad_lines)
+    return _ndjson_rows(lines, bad_lines) if fmt == "ndjson" else _csv_rows(lines, bad_lines)
+
+
+# 逐行解碼：UTF-8 的多位元組字元不含換行位元組，以 \n 切行不會切斷字元；解碼失敗的行記下行號
+def _decoded_lines(file, bad_lines):
+    for line_no, raw in enumerate(file, start=1):
+        if line_no == 1 and raw.startswith(codecs.BOM_UTF8):
+            raw = raw[len(codecs.BOM_UTF8):]
+        try:
+            yield raw.decode("utf-8")
+        except UnicodeDecodeError:
+            bad_lines.add(line_no)
+            yield raw.decode("utf-8", errors="replace")
+
+
+def _encoding_error(line_no: int):
+    return f"第 {line_no} 行不是 UTF-8 編碼"
+
+
+def _ndjson_rows(lines, bad_lines):
+    for line_no, line in enumerate(lines, start=1):
+        if line_no in bad_lines:
+            yield line_no, _encoding_error(line_no)
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, f"JSON 格式錯誤：{e}"
+            continue
+        yield line_no, row if isinstance(row, dict) else "每行必須是 JSON 物件"
+
+
+# 一列可能跨多行（引號內換行），行號取該列最後一行，與 csv 的 line_num 相同
+# csv 模組解析失敗時不更新 line_num，錯誤列的行號自行往下推算
+def _csv_rows(lines, bad_lines):
+    reader = csv.DictReader(lines)
+    last = 0
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            last = max(reader.line_num, last) + 1
+            yield last, f"CSV 格式錯誤：{e}"
+            continue
+        first, last = last + 1, reader.line_num
+        bad = [line_no for line_no in range(first, last + 1) if line_no in bad_lines]
+        if bad:
+            yield last, _encoding_error(bad[0])
+            continue
+        yield last, {k: (v if v != "" else None) for k, v in row.items() if k is not None}
+
+
+# 上傳檔可能已寫入磁碟暫存檔：在執行緒中每次讀取一批列，不阻塞 event loop
+async def read_rows(file, fmt: str, batch_size: int = IMPORT_READ_ROWS):
+    rows = iter_rows(file, fmt)
+    while True:
+        batch = await run_in_threadpool(lambda: list(islice(rows, batch_size)))
+        if not batch:
+            return
+        for row in batch:
+            yield row
+
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def error(self, line: int, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def result(self):
+        elapsed = time.perf_counter() - self.started
+        total = self.inserted + self.failed
+        return {
+            "rows": total,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda e: e["line"]),
+            "errors_truncated": self.failed > len(self.errors),
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(total / elapsed, 1) if elapsed else None,
+        }
+
+
+def _validation_errors(e: ValidationError):
+    return [{"field": ".".join(str(p) for p in err["loc"]), "message": err["msg"]} for err in e.errors()]
+
+
+# --- 共用流程：逐列驗證，累積到 chunk_size 後呼叫 flush 批次寫入並 commit ---
+async def _run_import(db: AsyncSession, rows, schema, flush, chunk_size: int):
+    report = ImportReport()
+    batch = []
+    async for line_no, row in rows:
+        if isinstance(row, str):
+            report.error(line_no, row)
+            continue
+        try:
+            batch.append((line_no, schema.model_validate(row)))
+        except ValidationError as e:
+            report.error(line_no, _validation_errors(e))
+            continue
+        if len(batch) >= chunk_size:
+            await flush(db, batch, report)
+            batch = []
+    if batch:
+        await flush(db, batch, report)
+    return report.result()
+
+
+# 批次 INSERT 不經過 ORM flush，版本號與異動時間需自行帶入
+async def _stamped(db: AsyncSession, rows):
+    stamp = {"row_version": await change_version(db), "updated_at": datetime.utcnow()}
+    return [{**row, **stamp} for row in rows]
+
+
+async def _flush_products(db: AsyncSession, batch, report: ImportReport):
+    # RETURNING 取回新商品 id，期初庫存以 import 記入異動帳
+    result = await db.execute(insert(Product).returning(Product.id, Product.stock),
+                              await _stamped(db, [data.model_dump() for _, data in batch]))
+    await record_movements(db, dict(result.all()), 1, IMPORT)
+    mark_catalog_dirty(db)
+    await db.commit()
+    report.inserted += len(batch)
+
+
+async def _new_customers(db: AsyncSession, batch):
+    # 一次 IN 查詢比對整批 Email，檔案內重複的 Email 只保留第一筆
+    emails = {data.email for _, data in batch}
+    seen = set((await db.execute(select(Customer.email).where(Customer.email.in_(emails)))).scalars())
+    rows, duplicates = [], []
+    for line_no, data in batch:
+        if data.email in seen:
+            duplicates.append((line_no, data.email))
+            continue
+        seen.add(data.email)
+        rows.append(data.model_dump())
+    return rows, duplicates
+
+
+async def _flush_customers(db: AsyncSession, batch, report: ImportReport):
+    for attempt in range(2):
+        rows, duplicates = await _new_customers(db, batch)
+        try:
+            if rows:
+                # 新顧客的彙總列與顧客在同一交易內建立
+                result = await db.execute(insert(Customer).returning(Customer.id), await _stamped(db, rows))
+                ids = list(result.scalars())
+                await db.run_sync(lambda session: open_customer_sales(session.connection(), ids))
+            await db.commit()
+            break
+        except IntegrityError:
+            # 比對後被其他請求搶先寫入相同 Email：整批 rollback 後重新比對一次
+            await db.rollback()
+            if attempt:
+                raise
+    for line_no, email in duplicates:
+        report.error(line_no, f"Email {email} 已存在")
+    report.inserted += len(rows)
+
+
+async def import_products(db: AsyncSession, rows, chunk_size: int = IMPORT_CHUNK_SIZE):
+    return await _run_import(db, rows, ProductCreate, _flush_products, chunk_size)
+
+
+async def import_customers(db: AsyncSession, rows, chunk_size: int = IMPORT_CHUNK_SIZE):
+    return await _run_import(db, rows, CustomerCreate, _flush_customers, chunk_size)
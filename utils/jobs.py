@@ -0,0 +1,287 @@
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import select, update, func, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from databases import AsyncSessionLocal
+from models import Job
+
+JOB_RESULT_DIR = os.getenv("JOB_RESULT_DIR", "./job_results")
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))          # 結果檔保留秒數
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))                    # API 行程內的 worker 數，0 表示只用獨立 worker
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))      # 超過此秒數沒有心跳的 running 工作可被重新領取
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", str(max(JOB_STALE_SECONDS / 5, 1))))  # 執行中的心跳間隔
+PROGRESS_INTERVAL = 1.0
+CLEANUP_INTERVAL = 60.0
+
+# --- 工作類型註冊：handler、同時執行上限（可用 JOB_CONCURRENCY_<TYPE> 覆寫）、資料指紋 ---
+JOB_TYPES = {}
+
+
+def job_type(name: str, concurrency: int = 1, fingerprint=None):
+    def register(fn):
+        env = "JOB_CONCURRENCY_" + name.upper().replace(".", "_")
+        JOB_TYPES[name] = SimpleNamespace(handler=fn, concurrency=int(os.getenv(env, str(concurrency))),
+                                          fingerprint=fingerprint)
+        return fn
+    return register
+
+
+_wakeup = asyncio.Event()
+
+
+# --- 定期工作：worker 閒置時檢查是否到期，到期就排入佇列 ---
+# 每個行程各自計時；相同工作仍在排隊 / 執行中時 enqueue 會重用，多個行程不會同時重複執行
+PERIODIC = []
+
+
+def periodic(type_: str, interval: float, params: dict = None):
+    if interval > 0:
+        PERIODIC.append(SimpleNamespace(type=type_, interval=interval, params=params or {},
+                                        due=time.monotonic() + interval))
+
+
+async def count_rows(stmt):
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(func.count()).select_from(stmt.order_by(None).subquery()))).scalar()
+
+
+def _cache_key(type_: str, params: dict, fingerprint):
+    raw = json.dumps({"type": type_, "params": params, "fingerprint": fingerprint}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+# --- 排入工作：相同參數的工作若仍在排隊 / 執行中，或資料未變且結果檔未過期，直接回傳既有工作 ---
+async def enqueue(db: AsyncSession, type_: str, params: dict):
+    spec = JOB_TYPES[type_]
+    fingerprint = await spec.fingerprint(db, params) if spec.fingerprint else None
+    key = _cache_key(type_, params, fingerprint)
+    reusable = ["queued", "running"] + (["done"] if spec.fingerprint else [])
+    now = datetime.utcnow()
+    existing = (await db.execute(
+        select(Job)
+        .where(Job.cache_key == key, Job.status.in_(reusable), or_(Job.expires_at.is_(None), Job.expires_at > now))
+        .order_by(Job.created_at.desc())
+        .limit(1)
+    )).scalars().first()
+    if existing and (existing.status != "done" or not existing.result_path or os.path.exists(existing.result_path)):
+        return existing, True
+
+    job = Job(id=uuid.uuid4().hex, type=type_, params=json.dumps(params, default=str), cache_key=key,
+              status="queued", progress=0, created_at=now)
+    db.add(job)
+    await db.commit()
+    _wakeup.set()
+    return job, False
+
+
+# 只更新仍由此 worker 執行中的工作：逾時被其他 worker 重新領取後，原 worker 的寫入不會覆蓋新的執行狀態
+def _owned(job_id: str, worker: str):
+    return and_(Job.id == job_id, Job.worker == worker, Job.status == "running")
+
+
+async def _update_owned(job_id: str, worker: str, values: dict):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(update(Job).where(_owned(job_id, worker)).values(**values))
+        await db.commit()
+    return result.rowcount == 1
+
+
+# --- 工作執行時的進度回報與結果檔寫入 ---
+class JobContext:
+    def __init__(self, job_id: str, worker: str):
+        self.job_id = job_id
+        self.worker = worker
+        self.done = 0
+        self._reported = time.monotonic()
+
+    async def _update(self, **values):
+        await _update_owned(self.job_id, self.worker, {"heartbeat_at": datetime.utcnow(), **values})
+
+    async def set_total(self, total: int):
+        await self._update(total=total)
+
+    # 每秒最多寫一次進度（心跳由 execute 另外定期寫入）
+    async def advance(self, count: int):
+        self.done += count
+        if time.monotonic() - self._reported >= PROGRESS_INTERVAL:
+            self._reported = time.monotonic()
+            await self._update(progress=self.done)
+
+    # 先寫入 .part 暫存檔，完成後再改名，下載端不會讀到寫一半的檔案
+    async def write_file(self, filename: str, chunks):
+        os.makedirs(JOB_RESULT_DIR, exist_ok=True)
+        path = os.path.join(JOB_RESULT_DIR, f"{self.job_id}-{filename}")
+        try:
+            with open(path + ".part", "wb") as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+            os.replace(path + ".part", path)
+        finally:
+            if os.path.exists(path + ".part"):
+                os.remove(path + ".part")
+        return path
+
+
+# --- 領取工作：先挑出最早的候選，再以條件式 UPDATE 搶佔 ---
+# UPDATE 條件同時檢查狀態與該類型執行中的數量，多個 worker（含不同行程）同時領取時只有一個會成功
+async def claim(db: AsyncSession, worker: str):
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=JOB_STALE_SECONDS)
+    claimable = or_(Job.status == "queued", and_(Job.status == "running", Job.heartbeat_at < stale))
+    running = select(Job.type, func.count().label("n")).where(Job.status == "running", Job.heartbeat_at >= stale).group_by(Job.type)
+    busy = {type_: n for type_, n in (await db.execute(running)).all()}
+    types = [name for name, spec in JOB_TYPES.items() if busy.get(name, 0) < spec.concurrency]
+    if not types:
+        return None
+
+    candidate = (await db.execute(
+        select(Job.id, Job.type).where(claimable, Job.type.in_(types)).order_by(Job.created_at).limit(1)
+    )).first()
+    if candidate is None:
+        return None
+
+    job_id, type_ = candidate
+    jobs = Job.__table__.alias("running_jobs")
+    running_count = (
+        select(func.count()).select_from(jobs)
+        .where(jobs.c.type == type_, jobs.c.status == "running", jobs.c.heartbeat_at >= stale)
+        .scalar_subquery()
+    )
+    claimed = await db.execute(
+        update(Job)
+        .where(Job.id == job_id, claimable, running_count < JOB_TYPES[type_].concurrency)
+        .values(status="running", worker=worker, started_at=now, heartbeat_at=now, progress=0, error=None)
+    )
+    await db.commit()
+    if claimed.rowcount != 1:
+        return None
+    return await db.get(Job, job_id, populate_existing=True)
+
+
+async def _finish(ctx: JobContext, **values):
+    values.setdefault("finished_at", datetime.utcnow())
+    await _update_owned(ctx.job_id, ctx.worker, values)
+
+
+# --- 執行期間定期寫入心跳：handler 不回報進度、或第一次回報前耗時較久時，也不會被當成逾時而重複執行 ---
+# 工作已被其他 worker 領走（更新不到資料列）時停止
+async def _heartbeat(ctx: JobContext):
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        try:
+            if not await _update_owned(ctx.job_id, ctx.worker, {"heartbeat_at": datetime.utcnow()}):
+                return
+        except Exception:
+            continue   # 資料庫暫時忙碌，下一輪再寫
+
+
+async def execute(job: Job):
+    ctx = JobContext(job.id, job.worker)
+    heartbeat = asyncio.create_task(_heartbeat(ctx))
+    try:
+        try:
+            result_path = await JOB_TYPES[job.type].handler(json.loads(job.params), ctx)
+        finally:
+            heartbeat.cancel()
+    except asyncio.CancelledError:
+        # 行程關閉時放回佇列，交給下一個 worker 重新執行
+        await _finish(ctx, status="queued", worker=None, finished_at=None)
+        raise
+    except Exception as e:
+        await _finish(ctx, status="failed", error=f"{type(e).__name__}: {e}"[:1000])
+        return
+    await _finish(ctx, status="done", progress=ctx.done, result_path=result_path,
+                  expires_at=datetime.utcnow() + timedelta(seconds=JOB_RESULT_TTL))
+
+
+# --- 清除過期的結果檔，工作狀態改為 expired ---
+async def cleanup_expired(db: AsyncSession):
+    now = datetime.utcnow()
+    expired = (await db.execute(select(Job).where(Job.status == "done", Job.expires_at < now))).scalars().all()
+    for job in expired:
+        if job.result_path and os.path.exists(job.result_path):
+            os.remove(job.result_path)
+        job.status = "expired"
+    await db.commit()
+    return len(expired)
+
+
+async def _enqueue_periodic(db: AsyncSession):
+    now = time.monotonic()
+    for task in PERIODIC:
+        if now >= task.due:
+            task.due = now + task.interval
+            await enqueue(db, task.type, task.params)
+
+
+async def run_worker(name: str, stop: asyncio.Event):
+    last_cleanup = 0.0
+    while not stop.is_set():
+        async with AsyncSessionLocal() as db:
+            job = await claim(db, name)
+            if job is None:
+                await _enqueue_periodic(db)
+            if job is None and time.monotonic() - last_cleanup >= CLEANUP_INTERVAL:
+                last_cleanup = time.monotonic()
+                await cleanup_expired(db)
+        if job is not None:
+            await execute(job)
+            continue
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+# --- API 行程內啟動 worker（由 lifespan 呼叫）；回傳停止用的函式 ---
+def start_workers(count: int = JOB_WORKERS):
+    stop = asyncio.Event()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    tasks = [asyncio.create_task(run_worker(f"{prefix}:{n}", stop)) for n in range(count)]
+
+    async def shutdown():
+        stop.set()
+        _wakeup.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return shutdown
+
+
+if __name__ == "__main__":
+    # 用法：python -m utils.jobs worker [數量]   獨立 worker 行程，可與 JOB_WORKERS=0 的 API 搭配
+    # 以 -m 執行時本模組是 __main__，工作類型註冊在 utils.jobs，須從該模組啟動 worker
+    import routers.exports, routers.reports, routers.inventory, utils.idempotency, utils.archive  # noqa: F401  註冊工作類型
+    from utils.jobs import start_workers as start_registered_workers, JOB_WORKERS
+    from databases import async_engine, async_read_engine
+
+    if not sys.argv[1:] or sys.argv[1] != "worker":
+        print("用法：python -m utils.jobs worker [數量]")
+        sys.exit(1)
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else max(JOB_WORKERS, 1)
+
+    async def main():
+        shutdown = start_registered_workers(count)
+        print(f"已啟動 {count} 個 worker，Ctrl-C 結束")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await shutdown()
+            await async_engine.dispose()
+            await async_read_engine.dispose()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
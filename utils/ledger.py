@@ -0,0 +1,184 @@
+import sys
+from datetime import datetime
+from sqlalchemy import event, func, insert, inspect, literal, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models import Product, StockMovement, StockSnapshot
+from utils.changes import next_version
+
+# 異動原因
+OPENING_BALANCE = "opening_balance"
+SALE = "sale"
+CANCEL = "cancel"
+ORDER_UPDATE = "order_update"
+ADJUSTMENT = "adjustment"
+IMPORT = "import"
+
+
+def _movement_rows(quantities, sign: int, reason: str, order_id=None):
+    now = datetime.utcnow()
+    return [{"product_id": pid, "quantity": sign * qty, "reason": reason, "order_id": order_id, "created_at": now}
+            for pid, qty in quantities.items() if qty]
+
+
+# --- 批次路徑（條件式 UPDATE、匯入）寫入異動，與庫存變動在同一交易內 ---
+async def record_movements(db: AsyncSession, quantities, sign: int, reason: str, order_id=None):
+    rows = _movement_rows(quantities, sign, reason, order_id)
+    if rows:
+        await db.execute(insert(StockMovement), rows)
+
+
+# 既有庫存記為期初餘額（migration、直接寫入資料表的 seed 使用），之後異動帳加總與 Product.stock 一致
+def record_opening_balances(conn):
+    conn.execute(insert(StockMovement).from_select(
+        ["product_id", "quantity", "reason", "created_at"],
+        select(Product.id, Product.stock, literal(OPENING_BALANCE), literal(datetime.utcnow()))
+        .where(Product.stock != 0)
+    ))
+
+
+# --- ORM 路徑（新增 / 修改 / 刪除商品）：flush 後依 stock 欄位的變動寫入異動 ---
+# after_flush 時新商品已有 id，屬性 history 仍保留 flush 前的值；原因可用 session.info["stock_reason"] 指定
+@event.listens_for(Session, "after_flush")
+def _record_product_stock(session, flush_context):
+    quantities = {}
+    for obj in session.new:
+        if isinstance(obj, Product) and obj.stock:
+            quantities[obj.id] = obj.stock
+    for obj in session.dirty:
+        if isinstance(obj, Product):
+            history = inspect(obj).attrs.stock.history
+            if history.added and history.deleted:
+                quantities[obj.id] = (history.added[0] or 0) - (history.deleted[0] or 0)
+    for obj in session.deleted:
+        if isinstance(obj, Product) and obj.stock:
+            quantities[obj.id] = -obj.stock
+    rows = _movement_rows(quantities, 1, session.info.get("stock_reason", ADJUSTMENT))
+    if rows:
+        session.connection().execute(insert(StockMovement), rows)
+
+
+def _latest_snapshot(product_id, position: int):
+    return (
+        select(StockSnapshot.stock)
+        .where(StockSnapshot.product_id == product_id, StockSnapshot.last_movement_id <= position)
+        .order_by(StockSnapshot.last_movement_id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+# --- 快照：上次快照之後有異動的商品，以「各自最近一次快照 + 新異動」寫入新列 ---
+# 先等寫入中的異動 commit，之後小於等於 max(id) 的異動都已 commit，不會漏掉仍在進行中的交易：
+# SQLite 推進全域版本號（寫入庫存的交易都持有同一個計數器列的鎖）；
+# PostgreSQL 的版本號不鎖資料列，改以 SHARE 鎖等待寫入 stock_movements 的交易結束，快照交易 commit 前新的寫入會稍候
+def take_snapshot(conn):
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("LOCK TABLE stock_movements IN SHARE MODE"))
+    else:
+        next_version(conn)
+    last_id = conn.execute(select(func.max(StockMovement.id))).scalar()
+    previous = conn.execute(checkpoint_stmt()).scalar() or 0
+    if last_id is None or last_id <= previous:
+        return {"products": 0, "last_movement_id": previous}
+
+    tail = (
+        select(StockMovement.product_id, func.sum(StockMovement.quantity).label("delta"))
+        .where(StockMovement.id > previous, StockMovement.id <= last_id)
+        .group_by(StockMovement.product_id)
+        .subquery()
+    )
+    rows = select(
+        tail.c.product_id,
+        func.coalesce(_latest_snapshot(tail.c.product_id, previous), 0) + tail.c.delta,
+        literal(last_id),
+        literal(datetime.utcnow()),
+    )
+    result = conn.execute(insert(StockSnapshot).from_select(
+        ["product_id", "stock", "last_movement_id", "created_at"], rows
+    ))
+    return {"products": result.rowcount, "last_movement_id": last_id}
+
+
+async def take_snapshot_async(db: AsyncSession):
+    result = await db.run_sync(lambda session: take_snapshot(session.connection()))
+    await db.commit()
+    return result
+
+
+# --- 歷史查詢：時間點先換算成「該時間之前（不含）最後一筆異動的 id」，之後都以 id 範圍查詢 ---
+# 異動的 created_at 與 id 同樣遞增（寫入時取號；PostgreSQL 上同時寫入的交易之間只會有毫秒內的交錯）
+def position_stmt(at: datetime):
+    return (
+        select(StockMovement.id)
+        .where(StockMovement.created_at < at)
+        .order_by(StockMovement.created_at.desc(), StockMovement.id.desc())
+        .limit(1)
+    )
+
+
+async def movement_position(db: AsyncSession, at: datetime):
+    return (await db.execute(position_stmt(at))).scalar() or 0
+
+
+# position 之前（含）最近一次快照的 last_movement_id；position 為 None 表示最新一次快照
+def checkpoint_stmt(position: int = None):
+    stmt = select(func.max(StockSnapshot.last_movement_id))
+    if position is not None:
+        stmt = stmt.where(StockSnapshot.last_movement_id <= position)
+    return stmt
+
+
+# 各商品在 position 時的庫存：最近一次快照 + 快照之後到 position 的異動；position 為 None 表示到最新
+def stock_at_stmt(checkpoint: int, position: int = None):
+    tail = select(StockMovement.product_id, func.sum(StockMovement.quantity).label("delta")) \
+        .where(StockMovement.id > checkpoint)
+    if position is not None:
+        tail = tail.where(StockMovement.id <= position)
+    tail = tail.group_by(StockMovement.product_id).subquery()
+    stock = func.coalesce(_latest_snapshot(Product.id, checkpoint), 0) + func.coalesce(tail.c.delta, 0)
+    return (
+        select(Product.id.label("product_id"), Product.name, Product.category, stock.label("stock"),
+               Product.stock.label("current_stock"))
+        .outerjoin(tail, tail.c.product_id == Product.id)
+    )
+
+
+# 單一商品在 position 時的庫存
+async def product_stock_at(db: AsyncSession, product_id: int, position: int):
+    checkpoint = (await db.execute(checkpoint_stmt(position))).scalar() or 0
+    tail = (
+        select(func.coalesce(func.sum(StockMovement.quantity), 0))
+        .where(StockMovement.product_id == product_id, StockMovement.id > checkpoint, StockMovement.id <= position)
+        .scalar_subquery()
+    )
+    return (await db.execute(select(func.coalesce(_latest_snapshot(product_id, checkpoint), 0) + tail))).scalar()
+
+
+# --- 帳務核對：目前庫存（Product.stock）與快照 + 異動推算不一致的商品 ---
+def verify(conn):
+    checkpoint = conn.execute(checkpoint_stmt()).scalar() or 0
+    rows = conn.execute(stock_at_stmt(checkpoint)).mappings()
+    return [{"product_id": r["product_id"], "stock": r["current_stock"], "ledger": r["stock"]}
+            for r in rows if (r["current_stock"] or 0) != r["stock"]]
+
+
+if __name__ == "__main__":
+    # 用法：python -m utils.ledger [snapshot|verify]
+    from databases import engine
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "snapshot":
+        with engine.begin() as conn:
+            result = take_snapshot(conn)
+        print(f"已寫入 {result['products']} 個商品的快照（至異動 #{result['last_movement_id']}）")
+    elif command == "verify":
+        with engine.begin() as conn:
+            mismatches = verify(conn)
+        for row in mismatches:
+            print(f"商品 {row['product_id']}：庫存 {row['stock']}，異動帳 {row['ledger']}")
+        print("異動帳與庫存一致" if not mismatches else f"{len(mismatches)} 個商品不一致")
+        sys.exit(1 if mismatches else 0)
+    else:
+        print("用法：python -m utils.ledger [snapshot|verify]")
+        sys.exit(1)
@@ -0,0 +1,162 @@
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))            # 0 表示不記錄慢請求
+SLOW_LOG_MAX_STATEMENTS = int(os.getenv("SLOW_LOG_MAX_STATEMENTS", "50"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+logger = logging.getLogger("erp.slow_requests")
+
+# 目前請求的 SQL 統計；由 middleware 設定，engine 事件累加（非同步 session 的事件也在同一個 context 內觸發）
+_request_stats: ContextVar = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+# --- 以 (method, route, status) 為標籤累計請求耗時與 SQL 用量 ---
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.sql_count = {}
+        self.sql_seconds = {}
+
+    def record(self, method: str, route: str, status: int, seconds: float, stats):
+        key = (method, route, str(status))
+        with self._lock:
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.sql_count.setdefault(key, Histogram(SQL_COUNT_BUCKETS)).observe(stats["count"])
+            self.sql_seconds[key] = self.sql_seconds.get(key, 0.0) + stats["seconds"]
+
+    def render(self):
+        # 多 worker 時每個行程各自累計，以 pid 區分是哪個 worker 的數字
+        lines = ["# HELP erp_worker_info 產生這份指標的 worker 行程",
+                 "# TYPE erp_worker_info gauge",
+                 f'erp_worker_info{{pid="{os.getpid()}"}} 1']
+        with self._lock:
+            self._histogram(lines, "http_request_duration_seconds", "請求耗時", self.latency)
+            self._histogram(lines, "http_request_sql_statements", "每個請求執行的 SQL 數", self.sql_count)
+            lines.append("# HELP http_request_sql_seconds_total 請求內 SQL 累計耗時")
+            lines.append("# TYPE http_request_sql_seconds_total counter")
+            for key, value in sorted(self.sql_seconds.items()):
+                lines.append(f"http_request_sql_seconds_total{{{_labels(key)}}} {value:.6f}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _histogram(lines, name, help_text, data):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, hist in sorted(data.items()):
+            labels = _labels(key)
+            for bound, count in zip(hist.buckets, hist.counts):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.total}')
+            lines.append(f"{name}_sum{{{labels}}} {hist.sum:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {hist.total}")
+
+
+def _labels(key):
+    method, route, status = key
+    return f'method="{method}",route="{route}",status="{status}"'
+
+
+registry = Registry()
+
+
+# --- SQLAlchemy engine 事件：計算目前請求的 SQL 數量與耗時，慢請求記錄用保留語句 ---
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = _request_stats.get()
+        if stats is None:
+            return
+        stats["count"] += 1
+        stats["seconds"] += elapsed
+        if len(stats["statements"]) < SLOW_LOG_MAX_STATEMENTS:
+            stats["statements"].append((elapsed, statement))
+
+
+# 以 endpoint 反查路由樣板（/orders/{order_id}），避免以實際路徑當標籤
+def _route_path(scope):
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    app = scope.get("app")
+    paths = getattr(app, "_metrics_route_paths", None)
+    if paths is None:
+        paths = {getattr(r, "endpoint", None): r.path for r in getattr(app, "routes", [])}
+        app._metrics_route_paths = paths
+    return paths.get(endpoint, "unmatched")
+
+
+def _server_timing(stats, app_seconds: float):
+    return (f'db;desc="{stats["count"]} queries";dur={stats["seconds"] * 1000:.1f}, '
+            f"app;dur={app_seconds * 1000:.1f}").encode()
+
+
+# --- ASGI middleware：記錄每個請求的耗時與 SQL 用量，回應加上 Server-Timing 標頭 ---
+# 串流回應的標頭在第一個 chunk 前送出，Server-Timing 只含到該時間點為止的數字；直方圖記錄完整耗時
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = {"count": 0, "seconds": 0.0, "statements": []}
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", _server_timing(stats, time.perf_counter() - started)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            route = _route_path(scope)
+            registry.record(scope["method"], route, status, elapsed, stats)
+            if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+                _log_slow(scope, route, status, elapsed, stats)
+
+
+def _log_slow(scope, route, status, elapsed, stats):
+    statements = "\n".join(f"    [{ms * 1000:.1f} ms] {sql}" for ms, sql in stats["statements"])
+    dropped = stats["count"] - len(stats["statements"])
+    logger.warning(
+        "slow request %s %s (%s) status=%s %.1f ms, %d SQL / %.1f ms%s\n%s",
+        scope["method"], scope["path"], route, status, elapsed * 1000, stats["count"],
+        stats["seconds"] * 1000, f"（另有 {dropped} 筆未列出）" if dropped > 0 else "", statements,
+    )
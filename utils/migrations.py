@@ -0,0 +1,244 @@
+import fcntl
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import inspect, text
+from databases import Base
+import models  # 確保所有 model 已註冊到 Base.metadata
+from utils.search import create_search_index
+from utils.reports import rebuild_reports, fill_customer_sales
+from utils.ledger import take_snapshot, record_opening_balances
+
+# --- 版本化 migration：依版本號依序執行，已套用的版本記錄在 schema_migrations ---
+# 新資料庫在 baseline 就由 create_all 建好所有資料表與索引，因此後續 migration 必須可重複執行
+MIGRATIONS = []
+
+
+def migration(version: int, description: str):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+@migration(1, "baseline tables")
+def _baseline(conn):
+    Base.metadata.create_all(bind=conn)
+
+
+@migration(2, "product / customer full-text search index")
+def _search_index(conn):
+    create_search_index(conn)
+
+
+# migration 只依賴當時的資料表結構：索引逐一列出，不讀目前 model 的 table.indexes
+# （之後加入的欄位索引，例如 row_version，由新增該欄位的 migration 建立）
+HOT_INDEXES = (
+    ("ix_orders_order_date_id", "orders", "order_date, id"),
+    ("ix_orders_customer_date", "orders", "customer_id, order_date, id"),
+    ("ix_orders_status_date", "orders", "payment_status, order_date, id"),
+    ("ix_order_items_order_id", "order_items", "order_id"),
+    ("ix_order_items_product_id", "order_items", "product_id"),
+    ("ix_products_active_category_price", "products", "is_active, category, price"),
+    ("ix_products_active_price", "products", "is_active, price"),
+)
+
+
+@migration(3, "indexes for hot query columns")
+def _hot_indexes(conn):
+    for name, table, columns in HOT_INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+@migration(4, "sales report summary tables")
+def _report_tables(conn):
+    for model in (models.DailySales, models.ProductSales, models.CustomerSales):
+        model.__table__.create(bind=conn, checkfirst=True)
+    # 重建時也讀封存資料表（migration 9），舊資料庫升級到這一版時先建立空的封存資料表
+    for model in (models.ArchivedOrder, models.ArchivedOrderItem):
+        model.__table__.create(bind=conn, checkfirst=True)
+    rebuild_reports(conn)
+
+
+@migration(5, "background job queue")
+def _job_table(conn):
+    models.Job.__table__.create(bind=conn, checkfirst=True)
+
+
+@migration(6, "row_version / updated_at change tracking and tombstones")
+def _change_tracking(conn):
+    for table in ("customers", "products", "orders"):
+        existing = {c["name"] for c in inspect(conn).get_columns(table)}
+        for name, ddl in (("updated_at", "TIMESTAMP"), ("row_version", "INTEGER NOT NULL DEFAULT 0")):
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_row_version ON {table} (row_version)"))
+    for model in (models.ChangeSequence, models.DeletedRow):
+        model.__table__.create(bind=conn, checkfirst=True)
+    conn.execute(text("INSERT INTO change_sequence (id, value) SELECT 1, 0 WHERE NOT EXISTS (SELECT 1 FROM change_sequence)"))
+
+
+@migration(7, "stock movement ledger and snapshots")
+def _stock_ledger(conn):
+    for model in (models.StockMovement, models.StockSnapshot):
+        model.__table__.create(bind=conn, checkfirst=True)
+    if conn.execute(text("SELECT 1 FROM stock_movements LIMIT 1")).first() is None:
+        record_opening_balances(conn)
+    take_snapshot(conn)
+
+
+@migration(8, "idempotency keys for order mutations")
+def _idempotency_keys(conn):
+    models.IdempotencyKey.__table__.create(bind=conn, checkfirst=True)
+
+
+@migration(9, "order archive tables")
+def _order_archive(conn):
+    for model in (models.ArchivedOrder, models.ArchivedOrderItem):
+        model.__table__.create(bind=conn, checkfirst=True)
+
+
+@migration(10, "customer order summary indexes")
+def _customer_summary(conn):
+    for index in models.CustomerSales.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
+    fill_customer_sales(conn)
+
+
+# --- SQLite 的 INTEGER PRIMARY KEY 以目前最大 id + 1 配號，最新的訂單 / 項目被刪除或封存後 id 會被重複使用 ---
+# SQLite 無法以 ALTER 加上 AUTOINCREMENT，依 PRAGMA 讀到的現有欄位、外鍵與索引重建資料表
+# 配號起點設為一般與封存資料表中最大的 id（已經用過的號碼不再配出）；PostgreSQL 的 sequence 本來就不會重複配號
+def _rebuild_autoincrement(conn, table: str, archive: str):
+    ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :t"), {"t": table}).scalar()
+    if "AUTOINCREMENT" not in ddl.upper():
+        columns, definitions = [], []
+        for _, name, type_, notnull, default, pk in conn.execute(text(f"PRAGMA table_info({table})")):
+            columns.append(f'"{name}"')
+            if pk:
+                definitions.append(f'"{name}" INTEGER PRIMARY KEY AUTOINCREMENT')
+                continue
+            definition = f'"{name}" {type_}' + (" NOT NULL" if notnull else "")
+            definitions.append(definition + (f" DEFAULT {default}" if default is not None else ""))
+        for row in conn.execute(text(f"PRAGMA foreign_key_list({table})")):
+            definitions.append(f'FOREIGN KEY("{row[3]}") REFERENCES {row[2]} ("{row[4]}")')
+        indexes = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :t AND sql IS NOT NULL"
+        ), {"t": table}).scalars().all()
+
+        conn.execute(text(f"CREATE TABLE {table}_rebuild ({', '.join(definitions)})"))
+        conn.execute(text(f"INSERT INTO {table}_rebuild ({', '.join(columns)}) SELECT {', '.join(columns)} FROM {table}"))
+        conn.execute(text(f"DROP TABLE {table}"))
+        conn.execute(text(f"ALTER TABLE {table}_rebuild RENAME TO {table}"))
+        for index in indexes:
+            conn.execute(text(index))
+
+    newest = conn.execute(text(
+        f"SELECT max(id) FROM (SELECT max(id) AS id FROM {table} UNION ALL SELECT max(id) FROM {archive} "
+        "UNION ALL SELECT seq FROM sqlite_sequence WHERE name = :t)"
+    ), {"t": table}).scalar() or 0
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :t"), {"t": table})
+    conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:t, :seq)"), {"t": table, "seq": newest})
+
+
+@migration(11, "never reuse order / order item ids")
+def _order_autoincrement(conn):
+    if conn.dialect.name != "sqlite":
+        return
+    for table, archive in (("orders", "orders_archive"), ("order_items", "order_items_archive")):
+        _rebuild_autoincrement(conn, table, archive)
+
+
+# --- PostgreSQL 的版本號改以交易 id 配發（utils.changes），寫入交易不再共用計數器列的鎖 ---
+# 交易 id 為 64 位元，row_version 改為 BIGINT；change_sequence.value 改存位移，讓新版本一定大於舊計數器配出的版本
+@migration(12, "transaction-id change versions on PostgreSQL")
+def _pg_change_versions(conn):
+    if conn.dialect.name != "postgresql":
+        return
+    for table in ("customers", "products", "orders", "orders_archive", "deleted_rows"):
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN row_version TYPE BIGINT"))
+    conn.execute(text("UPDATE change_sequence SET value = GREATEST(value + 1 - txid_current(), 0) WHERE id = 1"))
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def applied_versions(conn):
+    _ensure_version_table(conn)
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+# --- 跨行程的 migration 鎖：多個 worker 同時啟動時只有一個會執行 migration，其餘等待後看到已套用 ---
+# PostgreSQL 用 advisory lock（多台主機也有效）；SQLite 等單機資料庫用資料庫檔旁的檔案鎖
+MIGRATION_LOCK_ID = 7_420_001
+
+
+@contextmanager
+def migration_lock(engine):
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+                conn.commit()
+        return
+
+    database = engine.url.database
+    if engine.dialect.name == "sqlite" and database and database != ":memory:":
+        path = os.path.abspath(database) + ".migrate.lock"
+    else:
+        path = os.path.join(tempfile.gettempdir(), "erp-migrate.lock")
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def latest_version():
+    return MIGRATIONS[-1][0]
+
+
+# 每個 migration 各自一個交易，中途失敗時已完成的版本不會重跑
+def run_migrations(engine):
+    with migration_lock(engine):
+        with engine.begin() as conn:
+            done = applied_versions(conn)
+        applied = []
+        for version, description, fn in MIGRATIONS:
+            if version in done:
+                continue
+            with engine.begin() as conn:
+                fn(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                    {"v": version, "d": description, "t": datetime.utcnow()},
+                )
+            applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    # 用法：python -m utils.migrations [upgrade|status]
+    from databases import engine
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if command == "status":
+        with engine.begin() as conn:
+            done = applied_versions(conn)
+        for version, description, _ in MIGRATIONS:
+            print(f"{'x' if version in done else ' '} {version:04d} {description}")
+    elif command == "upgrade":
+        print(f"已套用：{run_migrations(engine) or '無（已是最新）'}")
+    else:
+        print("用法：python -m utils.migrations [upgrade|status]")
+        sys.exit(1)
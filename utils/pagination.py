@@ -0,0 +1,18 @@
+import base64
+from datetime import datetime
+from fastapi import HTTPException
+
+
+# --- 游標編碼：以 (order_date, id) 作為 keyset，序列化成 URL-safe 字串 ---
+def encode_cursor(order_date: datetime, order_id: int) -> str:
+    raw = f"{order_date.isoformat()}|{order_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        order_date, order_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(order_date), int(order_id)
+    except ValueError:
+        raise HTTPException(400, detail="cursor 格式錯誤")
@@ -0,0 +1,31 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+
+# bcrypt 成本係數；調高後，舊雜湊會在下次登入成功時自動以新係數重算
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+bcrypt_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+# --- bcrypt 為 CPU 密集運算（且會釋放 GIL），放到獨立執行緒池，避免阻塞 event loop ---
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1))),
+    thread_name_prefix="bcrypt",
+)
+
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, bcrypt_context.hash, password)
+
+
+# 回傳 (是否通過, 新雜湊)；新雜湊不為 None 時代表舊雜湊需要升級
+async def verify_password(password: str, hashed: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, bcrypt_context.verify_and_update, password, hashed)
@@ -1,9 +1,10 @@
 from fastapi import Depends, HTTPException, status
 from routers.auth import get_current_user
 
+# async 版本：同步的 dependency 會被丟到執行緒池執行，每個請求多一次執行緒切換
 def roles_required(*roles):
-    def wrapper(user=Depends(get_current_user)):
+    async def wrapper(user=Depends(get_current_user)):
         if user["user_role"] not in roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="無此權限")
         return user
-    return wrapper
\ No newline at end of file
+    return wrapper
@@ -0,0 +1,55 @@
+import os
+import time
+from fastapi import Depends, Request
+from databases import DATABASE_URL, READ_DATABASE_URL, AsyncSessionLocal, AsyncReadSessionLocal, async_engine, \
+    async_read_engine
+
+# 寫入後此秒數內，同一個用戶端的讀取改走主資料庫（replica 可能尚未同步）
+# 讀取來源是同一個 SQLite 檔案時沒有延遲，預設為 0
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS",
+                                           "0" if READ_DATABASE_URL == DATABASE_URL else "5"))
+READ_PRIMARY_COOKIE = "read_primary_until"
+READ_PRIMARY_HEADER = "X-Read-Primary"       # 用戶端不保存 cookie 時可自行帶 1，強制讀主資料庫
+MUTATING_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+def reads_primary(request: Request):
+    if async_read_engine is async_engine:
+        return True
+    if request.headers.get(READ_PRIMARY_HEADER, "").lower() in ("1", "true", "yes"):
+        return True
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+# --- 讀取用 session：列表、報表與匯出的依賴；剛寫入過的用戶端仍讀主資料庫 ---
+def read_sessionmaker(request: Request):
+    return AsyncSessionLocal if reads_primary(request) else AsyncReadSessionLocal
+
+
+async def get_read_db(sessions=Depends(read_sessionmaker)):
+    async with sessions() as db:
+        yield db
+
+
+# --- ASGI middleware：寫入成功的回應加上 cookie，READ_YOUR_WRITES_SECONDS 內的讀取走主資料庫 ---
+class ReadYourWritesMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] not in MUTATING_METHODS
+                or async_read_engine is async_engine or READ_YOUR_WRITES_SECONDS <= 0):
+            return await self.app(scope, receive, send)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + READ_YOUR_WRITES_SECONDS
+                cookie = (f"{READ_PRIMARY_COOKIE}={until:.3f}; Max-Age={int(READ_YOUR_WRITES_SECONDS) + 1}; "
+                          f"Path=/; HttpOnly; SameSite=Lax")
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,185 @@
+import sys
+from collections import defaultdict
+from sqlalchemy import case, cast, delete, distinct, event, func, insert, literal, select, union_all, Date
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from models import DailySales, ProductSales, CustomerSales, Customer
+from utils.archive import ORDER_TABLES
+
+
+# --- 將訂單整理成彙總用的數字，items 預設取 order.items（需已載入） ---
+def order_figures(order, items=None):
+    items = order.items if items is None else items
+    return {
+        "day": order.order_date.date(),
+        "customer_id": order.customer_id,
+        "order_date": order.order_date,
+        "total": order.total_amount or 0,
+        "paid": order.payment_status == "paid",
+        "items": [(item.product_id, item.quantity, item.quantity * item.unit_price) for item in items],
+    }
+
+
+def _dialect_insert(dialect):
+    return postgresql.insert if dialect.name == "postgresql" else sqlite.insert
+
+
+# 累加式 upsert：不存在時插入，存在時各欄位加上新值；last_order_at 取較大者
+async def _upsert(db, model, key: str, rows):
+    if not rows:
+        return
+    table = model.__table__
+    stmt = _dialect_insert(db.bind.dialect)(table)
+    greatest = func.greatest if db.bind.dialect.name == "postgresql" else func.max
+    set_ = {}
+    for column in rows[0]:
+        if column == key:
+            continue
+        if column == "last_order_at":
+            set_[column] = greatest(func.coalesce(table.c[column], stmt.excluded[column]),
+                                    func.coalesce(stmt.excluded[column], table.c[column]))
+        else:
+            set_[column] = table.c[column] + stmt.excluded[column]
+    await db.execute(stmt.on_conflict_do_update(index_elements=[key], set_=set_), rows)
+
+
+# --- 增量更新彙總表：sign=1 計入、-1 扣除；count=False 時不改每日與顧客訂單數（修改訂單項目用） ---
+# 多筆訂單先在記憶體合併，每個彙總表只執行一次 upsert
+async def record_orders(db, figures, sign: int = 1, count: bool = True):
+    daily = defaultdict(lambda: {"order_count": 0, "items_sold": 0, "revenue": 0.0, "paid_revenue": 0.0})
+    products = defaultdict(lambda: {"order_count": 0, "units_sold": 0, "revenue": 0.0})
+    customers = defaultdict(lambda: {"order_count": 0, "revenue": 0.0, "paid_revenue": 0.0, "last_order_at": None})
+    orders = sign if count else 0
+
+    for f in figures:
+        day = daily[f["day"]]
+        day["order_count"] += orders
+        day["revenue"] += sign * f["total"]
+        day["paid_revenue"] += sign * f["total"] if f["paid"] else 0
+        # 商品的訂單數隨項目增減，修改訂單項目時也要調整
+        for product_id in {product_id for product_id, _, _ in f["items"]}:
+            products[product_id]["order_count"] += sign
+        for product_id, quantity, amount in f["items"]:
+            day["items_sold"] += sign * quantity
+            products[product_id]["units_sold"] += sign * quantity
+            products[product_id]["revenue"] += sign * amount
+        customer = customers[f["customer_id"]]
+        customer["order_count"] += orders
+        customer["revenue"] += sign * f["total"]
+        customer["paid_revenue"] += sign * f["total"] if f["paid"] else 0
+        if sign > 0 and (customer["last_order_at"] is None or f["order_date"] > customer["last_order_at"]):
+            customer["last_order_at"] = f["order_date"]
+
+    await _upsert(db, DailySales, "day", [{"day": k, **v} for k, v in daily.items()])
+    await _upsert(db, ProductSales, "product_id", [{"product_id": k, **v} for k, v in products.items()])
+    await _upsert(db, CustomerSales, "customer_id", [{"customer_id": k, **v} for k, v in customers.items()])
+
+
+# --- 訂單付款：只影響已付款金額 ---
+async def record_payment(db, order):
+    await _upsert(db, DailySales, "day", [{"day": order.order_date.date(), "order_count": 0, "items_sold": 0,
+                                          "revenue": 0.0, "paid_revenue": order.total_amount or 0}])
+    await _upsert(db, CustomerSales, "customer_id", [{"customer_id": order.customer_id, "order_count": 0,
+                                                     "revenue": 0.0, "paid_revenue": order.total_amount or 0,
+                                                     "last_order_at": None}])
+
+
+# --- 顧客彙總列：每位顧客都有一列（沒有訂單時為 0），顧客列表才能只走 customer_sales 的索引排序、篩選 ---
+def _empty_customer_sales(ids):
+    return [{"customer_id": customer_id, "order_count": 0, "revenue": 0.0, "paid_revenue": 0.0,
+             "last_order_at": None} for customer_id in ids]
+
+
+def open_customer_sales(conn, ids):
+    if ids:
+        stmt = _dialect_insert(conn.dialect)(CustomerSales.__table__).on_conflict_do_nothing(
+            index_elements=["customer_id"])
+        conn.execute(stmt, _empty_customer_sales(ids))
+
+
+# 補上還沒有彙總列的顧客（migration、重建與直接寫入資料表的 seed / 匯入）
+def fill_customer_sales(conn):
+    conn.execute(insert(CustomerSales).from_select(
+        ["customer_id", "order_count", "revenue", "paid_revenue"],
+        select(Customer.id, literal(0), literal(0.0), literal(0.0))
+        .where(~select(CustomerSales.customer_id).where(CustomerSales.customer_id == Customer.id).exists())
+    ))
+
+
+# ORM 新增顧客（建立顧客、註冊）：flush 後已有 id，在同一交易內建立彙總列
+@event.listens_for(Session, "after_flush")
+def _open_new_customers(session, flush_context):
+    open_customer_sales(session.connection(), [obj.id for obj in session.new if isinstance(obj, Customer)])
+
+
+# 封存只是搬移訂單，重建彙總表時一般與封存資料表都要計入
+def _all_orders():
+    return union_all(*[
+        select(orders.id, orders.customer_id, orders.order_date, orders.total_amount, orders.payment_status)
+        for orders, _ in ORDER_TABLES
+    ]).subquery("all_orders")
+
+
+def _all_items():
+    return union_all(*[
+        select(items.order_id, items.product_id, items.quantity, items.unit_price) for _, items in ORDER_TABLES
+    ]).subquery("all_items")
+
+
+# --- 從訂單資料完整重建彙總表（同步 connection，供 migration、CLI 與 API 共用） ---
+def rebuild_reports(conn):
+    order, item = _all_orders(), _all_items()
+    active = order.c.payment_status != "cancelled"
+    paid_total = case((order.c.payment_status == "paid", order.c.total_amount), else_=0)
+    day = cast(order.c.order_date, Date) if conn.dialect.name == "postgresql" else func.date(order.c.order_date)
+
+    for model in (DailySales, ProductSales, CustomerSales):
+        conn.execute(delete(model))
+
+    orders = (
+        select(day.label("day"), func.count().label("order_count"),
+               func.sum(order.c.total_amount).label("revenue"), func.sum(paid_total).label("paid_revenue"))
+        .where(active).group_by(day).subquery()
+    )
+    items = (
+        select(day.label("day"), func.sum(item.c.quantity).label("items_sold"))
+        .select_from(item).join(order, order.c.id == item.c.order_id).where(active).group_by(day).subquery()
+    )
+    conn.execute(insert(DailySales).from_select(
+        ["day", "order_count", "items_sold", "revenue", "paid_revenue"],
+        select(orders.c.day, orders.c.order_count, func.coalesce(items.c.items_sold, 0),
+               orders.c.revenue, orders.c.paid_revenue)
+        .outerjoin(items, items.c.day == orders.c.day)
+    ))
+    conn.execute(insert(ProductSales).from_select(
+        ["product_id", "order_count", "units_sold", "revenue"],
+        select(item.c.product_id, func.count(distinct(item.c.order_id)), func.sum(item.c.quantity),
+               func.sum(item.c.quantity * item.c.unit_price))
+        .select_from(item).join(order, order.c.id == item.c.order_id).where(active).group_by(item.c.product_id)
+    ))
+    # last_order_at 含已取消的訂單，與增量更新（取消時不回退）一致
+    conn.execute(insert(CustomerSales).from_select(
+        ["customer_id", "order_count", "revenue", "paid_revenue", "last_order_at"],
+        select(order.c.customer_id, func.sum(case((active, 1), else_=0)),
+               func.sum(case((active, order.c.total_amount), else_=0)), func.sum(paid_total),
+               func.max(order.c.order_date))
+        .group_by(order.c.customer_id)
+    ))
+    fill_customer_sales(conn)
+
+
+async def rebuild_reports_async(db):
+    await db.run_sync(lambda session: rebuild_reports(session.connection()))
+    await db.commit()
+
+
+if __name__ == "__main__":
+    # 用法：python -m utils.reports rebuild
+    from databases import engine
+
+    if sys.argv[1:] != ["rebuild"]:
+        print("用法：python -m utils.reports rebuild")
+        sys.exit(1)
+    with engine.begin() as conn:
+        rebuild_reports(conn)
+    print("報表彙總表已重建")
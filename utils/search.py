@@ -0,0 +1,112 @@
+import os
+import sys
+from sqlalchemy import text, Integer, Float
+
+# --- FTS5 trigram 影子資料表：external content 指向原表，由 trigger 同步 ---
+SEARCH_INDEXES = {
+    "products": ("products_fts", ["name"]),
+    "customers": ("customers_fts", ["name", "email"]),
+}
+
+MIN_TERM_LENGTH = 3  # trigram 至少需要 3 個字元，較短的關鍵字改用 LIKE
+# 熱門關鍵字可能命中數萬筆；只回傳第一頁且沒有其他條件時，FTS5 只保留相關度最高的 N 筆再與資料表合併排序
+RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "500"))
+
+_enabled = False
+
+
+def _ddl(table: str, fts: str, columns):
+    cols = ", ".join(columns)
+    new_cols = ", ".join(f"new.{c}" for c in columns)
+    old_cols = ", ".join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+    ]
+
+
+# --- 建立索引與 trigger（僅 SQLite）；新建立的索引會先從原表重建一次 ---
+def create_search_index(conn):
+    if conn.dialect.name != "sqlite":
+        return False
+    existing = _existing_tables(conn)
+    for table, (fts, columns) in SEARCH_INDEXES.items():
+        for statement in _ddl(table, fts, columns):
+            conn.exec_driver_sql(statement)
+        if fts not in existing:
+            conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    return True
+
+
+def ensure_search_index(engine):
+    global _enabled
+    with engine.begin() as conn:
+        _enabled = create_search_index(conn)
+    return _enabled
+
+
+# 啟動時確認索引是否已由 migration 建立，決定搜尋是否走 FTS5
+def detect_search_index(engine):
+    global _enabled
+    if engine.dialect.name != "sqlite":
+        _enabled = False
+        return False
+    with engine.connect() as conn:
+        existing = _existing_tables(conn)
+    _enabled = all(fts in existing for fts, _ in SEARCH_INDEXES.values())
+    return _enabled
+
+
+def _existing_tables(conn):
+    return {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def rebuild_search_index(engine):
+    with engine.begin() as conn:
+        for fts, _ in SEARCH_INDEXES.values():
+            conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def use_search_index(db, term: str) -> bool:
+    return _enabled and len(term) >= MIN_TERM_LENGTH and db.bind.dialect.name == "sqlite"
+
+
+# 候選結果可以只取 RANK_WINDOW 筆的情況：沒有其他篩選 / 排序條件、沒有 offset，且筆數在上限內
+# 其餘情況要先套用條件才分頁，候選結果不能截斷，否則超過上限的命中會被略過
+def rank_window(limit, offset: int, filtered: bool):
+    if filtered or offset or limit is None or limit > RANK_WINDOW:
+        return None
+    return RANK_WINDOW
+
+
+# --- 依相關度排序的搜尋結果子查詢，欄位為 (id, rank)，rank 越小越相關 ---
+# window 為候選結果上限（見 rank_window），None 表示不限
+def search_subquery(table: str, term: str, window: int = None):
+    fts = SEARCH_INDEXES[table][0]
+    phrase = '"' + term.replace('"', '""') + '"'
+    if window is None:
+        stmt = text(f"SELECT rowid AS id, rank FROM {fts} WHERE {fts} MATCH :phrase").bindparams(phrase=phrase)
+    else:
+        # 依 (rank, rowid) 取前 N 筆，與不限筆數時外層的 (rank, id) 排序一致，第一頁與後續頁面不會重複或漏掉
+        stmt = text(
+            f"SELECT rowid AS id, rank FROM {fts} WHERE {fts} MATCH :phrase ORDER BY rank, rowid LIMIT :window"
+        ).bindparams(phrase=phrase, window=window)
+    return stmt.columns(id=Integer, rank=Float).subquery(f"{table}_search")
+
+
+if __name__ == "__main__":
+    # 用法：python -m utils.search rebuild
+    from databases import engine
+
+    if sys.argv[1:] != ["rebuild"]:
+        print("用法：python -m utils.search rebuild")
+        sys.exit(1)
+    ensure_search_index(engine)
+    rebuild_search_index(engine)
+    print("搜尋索引已重建")
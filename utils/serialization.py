@@ -0,0 +1,30 @@
+import orjson
+from fastapi import Response
+from sqlalchemy.orm import ColumnProperty
+
+# --- 大量列表的快速輸出：只查回應 schema 需要的欄位，直接以 orjson 編碼 ---
+# 不經過逐筆 Pydantic model_validate / model_dump；端點仍宣告 response_model，OpenAPI 文件不變
+# （端點直接回傳 Response 時 FastAPI 不會再驗證）。datetime 與 Pydantic 一樣輸出 ISO 8601
+
+
+# 回應 schema 中對應到 model 欄位的 column（關聯欄位如 items 另外查詢）
+def schema_columns(model, schema):
+    columns = []
+    for name in schema.model_fields:
+        attr = getattr(model, name, None)
+        if attr is not None and isinstance(getattr(attr, "property", None), ColumnProperty):
+            columns.append(attr)
+    return columns
+
+
+def rows_as_dicts(result):
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
+
+def dump_json(content) -> bytes:
+    return orjson.dumps(content)
+
+
+def json_response(content, headers=None):
+    return Response(content=dump_json(content), media_type="application/json", headers=headers)
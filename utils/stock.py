@@ -0,0 +1,128 @@
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import select, update, case, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Product
+from utils.cache import mark_catalog_dirty
+from utils.changes import change_version
+from utils.ledger import record_movements, SALE, CANCEL
+
+
+class StockError(Exception):
+    def __init__(self, failures):
+        super().__init__("商品不存在或庫存不足")
+        self.failures = failures
+
+
+def _aggregate(items):
+    # 同一商品出現多次時合併數量，保留原始順序
+    quantities = OrderedDict()
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+
+async def _bulk_adjust(db: AsyncSession, quantities, sign: int, check: bool, reason: str, order_id=None):
+    # 單一 UPDATE 完成所有商品的庫存增減；check=True 時僅在 stock >= 數量時扣減
+    # 同一交易內寫入異動帳；部分更新失敗時呼叫端會 rollback，回補時則只記錄仍存在的商品
+    delta = case(quantities, value=Product.id)
+    stmt = update(Product).where(Product.id.in_(list(quantities)))
+    if check:
+        stmt = stmt.where(Product.stock >= delta)
+    stmt = stmt.values(
+        stock=Product.stock + sign * delta,
+        row_version=await change_version(db),
+        updated_at=datetime.utcnow(),
+    ).execution_options(synchronize_session=False)
+    updated = (await db.execute(stmt)).rowcount
+    if updated:
+        mark_catalog_dirty(db)
+    if updated == len(quantities):
+        await record_movements(db, quantities, sign, reason, order_id)
+    elif updated and not check:
+        existing = set((await db.execute(select(Product.id).where(Product.id.in_(list(quantities))))).scalars())
+        await record_movements(db, {pid: qty for pid, qty in quantities.items() if pid in existing}, sign, reason, order_id)
+    return updated
+
+
+def _expire_stock(db: AsyncSession, product_ids):
+    # 批次 UPDATE 不會同步 session 內的物件，將已載入商品的 stock 標記為過期
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, Product) and inspect(obj).identity[0] in product_ids:
+            db.expire(obj, ["stock", "row_version", "updated_at"])
+
+
+async def _load_products(db: AsyncSession, quantities):
+    result = await db.execute(select(Product).where(Product.id.in_(list(quantities))))
+    return {p.id: p for p in result.scalars()}
+
+
+def _failures(quantities, products):
+    failures = []
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        available = product.stock if product else None
+        if available is None or available < quantity:
+            failures.append({"product_id": product_id, "requested": quantity, "available": available})
+    return failures
+
+
+# --- 預留庫存：一次查詢取得所有商品，再以條件式批次 UPDATE 扣庫存 ---
+# 任一商品不存在或庫存不足時 rollback，並以 StockError 回報每個失敗項目
+async def reserve_stock(db: AsyncSession, items, reason: str = SALE, order_id=None):
+    quantities = _aggregate(items)
+    if not quantities:
+        return {}
+
+    products = await _load_products(db, quantities)
+    failures = _failures(quantities, products)
+    if not failures:
+        if await _bulk_adjust(db, quantities, -1, check=True, reason=reason, order_id=order_id) == len(quantities):
+            _expire_stock(db, quantities)
+            return products
+        # 查詢後被其他交易搶先扣減：整筆 rollback，重新讀取庫存以回報失敗項目
+        await db.rollback()
+        products = await _load_products(db, quantities)
+        failures = _failures(quantities, products) or [
+            {"product_id": pid, "requested": qty, "available": products[pid].stock}
+            for pid, qty in quantities.items()
+        ]
+
+    await db.rollback()
+    raise StockError(failures)
+
+
+# --- 回補庫存：取消或修改訂單時將原項目數量批次加回 ---
+async def release_stock(db: AsyncSession, items, reason: str = CANCEL, order_id=None):
+    quantities = _aggregate(items)
+    if quantities:
+        await _bulk_adjust(db, quantities, 1, check=False, reason=reason, order_id=order_id)
+        _expire_stock(db, quantities)
+
+
+# --- 批次預留：依序以讀到的庫存分配給每組項目，可滿足的組別合併後以單一條件式 UPDATE 扣減 ---
+# 回傳 (products, 成功的組別索引, {失敗組別索引: failures})；扣減時被其他交易搶先則 rollback 重新分配
+async def reserve_stock_batch(db: AsyncSession, groups, attempts: int = 3):
+    wanted = [_aggregate(items) for items in groups]
+    for _ in range(attempts):
+        products = await _load_products(db, {pid for quantities in wanted for pid in quantities})
+        available = {pid: p.stock for pid, p in products.items()}
+        total, accepted, rejected = OrderedDict(), [], {}
+        for index, quantities in enumerate(wanted):
+            failures = [
+                {"product_id": pid, "requested": qty, "available": available.get(pid)}
+                for pid, qty in quantities.items()
+                if available.get(pid) is None or available[pid] < qty
+            ]
+            if failures:
+                rejected[index] = failures
+                continue
+            for pid, qty in quantities.items():
+                available[pid] -= qty
+                total[pid] = total.get(pid, 0) + qty
+            accepted.append(index)
+        if not total or await _bulk_adjust(db, total, -1, check=True, reason=SALE) == len(total):
+            _expire_stock(db, total)
+            return products, accepted, rejected
+        await db.rollback()
+    raise StockError([{"product_id": pid, "requested": qty, "available": None} for pid, qty in total.items()])